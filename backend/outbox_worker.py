@@ -0,0 +1,57 @@
+"""
+Outbox Worker
+API sürecinden ayrı çalışan bildirim gönderim süreci.
+
+    python outbox_worker.py
+
+`outbox` koleksiyonundaki işleri OUTBOX_WORKERS adet eşzamanlı döngü ile
+lease alarak gönderir (bkz. routes/outbox.py). Birden fazla kopya aynı anda
+çalıştırılabilir; her iş tek bir worker tarafından sahiplenilir.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+from routes.bson_dates import DATE_CODEC_OPTIONS
+from routes.outbox import Outbox, OUTBOX_WORKERS
+from routes.rate_limiter import rate_limiter
+from routes.smtp_pool import smtp_pool
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("outbox_worker")
+
+
+async def _main() -> None:
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client.get_database(os.environ['DB_NAME'], codec_options=DATE_CODEC_OPTIONS)
+    outbox = Outbox(db)
+    rate_limiter.set_db(db)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logger.info(f"Outbox worker başladı ({OUTBOX_WORKERS} eşzamanlı döngü)")
+    try:
+        await outbox.run_pool(OUTBOX_WORKERS, stop)
+    finally:
+        logger.info(f"Outbox worker durdu: {outbox.stats()}")
+        await smtp_pool.close()
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
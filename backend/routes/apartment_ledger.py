@@ -0,0 +1,445 @@
+"""
+Apartment Ledger
+Daire bazlı, yalnızca eklenen (append-only) borç / alacak defteri.
+
+Borç bugüne kadar her okumada `monthly_dues` ile `due_payments` birleştirilerek
+hesaplanıyordu. Bu modülle:
+
+- `apartment_ledger`: her daire için sıralı (seq) kayıtlar. Aylık aidat
+  tanımı her daireye bir `charge`, sakin ödemesi bir `credit` yazar. Her
+  kayıt yazıldığı andaki bakiyeyi (`balance_after`) taşır. Charge
+  kayıtlarında ödendiğinde `settled=True` olur; ödeme borcu önce koşullu
+  (`settled: False` -> `True`) kapatır, borcu eşzamanlı başka bir ödeme
+  kapattıysa ödeme kaydedilmez. Gecikme zammı da
+  (`source_type=late_fee`, `monthly_due_id` ile aidata bağlı) bir charge'dır
+  ve aidatla birlikte ödenir (`late_fee_ids`).
+- `apartment_balances`: daire başına güncel bakiye, son seq ve toplam
+  borçlanan / ödenen tutar. Bakiye okuması O(1)'dir.
+- `apartment_ledger_snapshots` / `apartment_ledger_archive`: kapanmış yıllar
+  için sıkıştırma. Kapatılmış (settled) kayıtlar arşive taşınır ve yıl başına
+  bir özet yazılır. Açık kalemler canlı defterde kalır. Aidat ödeme durumu
+  (`monthly_due_charges`) arşivdeki kapanmış aidat borçlarını da okur;
+  sıkıştırılmış bir yılın ödenmiş aidatı yeniden açık görünmez.
+
+Yazmalar, MongoDB replica set / mongos üzerinde transaction içinde yapılır
+(docker-compose.yml MongoDB'yi tek üyeli `rs0` replica set olarak başlatır).
+Aidat tanımı ve ödeme kayıtları da aynı transaction'a dahildir: çağıran
+`transaction` ile bir işlem açar ve session'ı `charge_monthly_due` /
+`record_payments` çağrılarına geçirir. Standalone sunucularda transaction
+desteklenmez; işlemler transaction olmadan uygulanır ve başlangıçta uyarı
+loglanır (bu modda yarıda kalan bir yazma bakiye ile kayıtları ayırabilir).
+"""
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+CHARGE = "charge"
+CREDIT = "credit"
+
+
+def _money(amount: float) -> float:
+    return round(float(amount or 0), 2)
+
+
+def _signed(entry: dict) -> float:
+    return entry["amount"] if entry["kind"] == CHARGE else -entry["amount"]
+
+
+class ApartmentLedger:
+    """apartment_ledger / apartment_balances üzerinde defter servisi"""
+
+    def __init__(self, db):
+        self.db = db
+        self._transactions_supported: Optional[bool] = None
+
+    async def _supports_transactions(self) -> bool:
+        if self._transactions_supported is None:
+            try:
+                hello = await self.db.command("hello")
+                self._transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+            except Exception:
+                self._transactions_supported = False
+            if not self._transactions_supported:
+                logger.warning("MongoDB transaction desteklemiyor (standalone); defter yazmaları transaction olmadan yapılacak")
+        return self._transactions_supported
+
+    async def transaction(self, operation) -> Any:
+        """operation(session) destekleniyorsa transaction içinde, değilse doğrudan (session=None) çalışır"""
+        if not await self._supports_transactions():
+            return await operation(None)
+        async with await self.db.client.start_session() as session:
+            return await session.with_transaction(operation)
+
+    async def _run(self, operation, session=None) -> Any:
+        """Çağıranın session'ı varsa onun transaction'ında, yoksa yeni bir transaction'da çalıştır"""
+        if session is not None:
+            return await operation(session)
+        return await self.transaction(operation)
+
+    @staticmethod
+    def _entry(building_id: str, apartment_id: str, kind: str, amount: float, source_type: str, source_id: str, **extra) -> dict:
+        return {
+            "id": str(uuid.uuid4()),
+            "building_id": building_id,
+            "apartment_id": apartment_id,
+            "kind": kind,
+            "amount": _money(amount),
+            "source_type": source_type,
+            "source_id": source_id,
+            "created_at": datetime.now(timezone.utc),
+            **extra,
+        }
+
+    async def _post(self, building_id: str, apartment_id: str, entries: List[dict], session=None) -> dict:
+        """Bir dairenin bakiyesini artır ve kayıtları seq / bakiye ile ekle"""
+        delta = sum(_signed(e) for e in entries)
+        charged = sum(e["amount"] for e in entries if e["kind"] == CHARGE)
+        credited = sum(e["amount"] for e in entries if e["kind"] == CREDIT)
+
+        balance = await self.db.apartment_balances.find_one_and_update(
+            {"apartment_id": apartment_id},
+            {
+                "$inc": {"balance": delta, "seq": len(entries), "charged_total": charged, "credited_total": credited},
+                "$set": {"building_id": building_id, "updated_at": datetime.now(timezone.utc)}
+            },
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+
+        # Dönen bakiye son kaydın sonrasıdır; önceki kayıtlar geriye doğru hesaplanır
+        running = balance["balance"]
+        seq = balance["seq"]
+        for entry in reversed(entries):
+            entry["seq"] = seq
+            entry["balance_after"] = _money(running)
+            running -= _signed(entry)
+            seq -= 1
+
+        await self.db.apartment_ledger.insert_many(entries, session=session)
+        return balance
+
+    async def _post_bulk(self, entries: List[dict], session=None) -> int:
+        """Birden çok dairenin kayıtlarını tek bulk_write + insert_many ile yaz"""
+        by_apartment: Dict[str, List[dict]] = {}
+        for entry in entries:
+            by_apartment.setdefault(entry["apartment_id"], []).append(entry)
+        if not by_apartment:
+            return 0
+
+        now = datetime.now(timezone.utc)
+        await self.db.apartment_balances.bulk_write([
+            UpdateOne(
+                {"apartment_id": apartment_id},
+                {
+                    "$inc": {
+                        "balance": _money(sum(_signed(e) for e in apartment_entries)),
+                        "seq": len(apartment_entries),
+                        "charged_total": _money(sum(e["amount"] for e in apartment_entries if e["kind"] == CHARGE)),
+                        "credited_total": _money(sum(e["amount"] for e in apartment_entries if e["kind"] == CREDIT))
+                    },
+                    "$set": {"building_id": apartment_entries[0]["building_id"], "updated_at": now}
+                },
+                upsert=True
+            )
+            for apartment_id, apartment_entries in by_apartment.items()
+        ], ordered=False, session=session)
+
+        balances = await self.db.apartment_balances.find(
+            {"apartment_id": {"$in": list(by_apartment)}}, {"_id": 0}, session=session
+        ).to_list(None)
+
+        # Dönen bakiye dairenin son kaydının sonrasıdır; kayıtlar geriye doğru numaralanır
+        for balance in balances:
+            running = balance["balance"]
+            seq = balance["seq"]
+            for entry in reversed(by_apartment[balance["apartment_id"]]):
+                entry["seq"] = seq
+                entry["balance_after"] = _money(running)
+                running -= _signed(entry)
+                seq -= 1
+
+        await self.db.apartment_ledger.insert_many(entries, ordered=False, session=session)
+        return len(entries)
+
+    async def post_charges(self, entries: List[dict], session=None) -> int:
+        """Hazırlanmış borç kayıtlarını (ör. gecikme zammı) toplu yaz"""
+        if not entries:
+            return 0
+        return await self._run(lambda session: self._post_bulk(entries, session=session), session)
+
+    def charge_entry(self, building_id: str, apartment_id: str, amount: float, source_type: str, source_id: str, **extra) -> dict:
+        return self._entry(building_id, apartment_id, CHARGE, amount, source_type, source_id, settled=False, **extra)
+
+    async def charge_monthly_due(self, monthly_due: dict, apartment_ids: List[str], amounts: Optional[Dict[str, float]] = None,
+                                 session=None) -> int:
+        """Aylık aidat tanımı için her daireye borç kaydı yaz (amounts: daire bazlı dağıtım)"""
+        flat_amount = monthly_due.get("per_apartment_amount", 0)
+        entries = [
+            self.charge_entry(
+                monthly_due["building_id"],
+                apartment_id,
+                amounts.get(apartment_id, 0) if amounts is not None else flat_amount,
+                "monthly_due",
+                monthly_due["id"],
+                period=monthly_due.get("month"),
+                due_date=monthly_due.get("due_date")
+            )
+            for apartment_id in apartment_ids
+        ]
+        return await self.post_charges(entries, session=session)
+
+    async def _monthly_due_charged(self, apartment_id: str, monthly_due_id: str, session=None) -> bool:
+        """Dairenin bu aidat için (açık veya kapalı, arşiv dahil) borç kaydı var mı"""
+        query = {"apartment_id": apartment_id, "kind": CHARGE, "source_type": "monthly_due", "source_id": monthly_due_id}
+        if await self.db.apartment_ledger.find_one(query, {"_id": 1}, session=session):
+            return True
+        return bool(await self.db.apartment_ledger_archive.find_one(query, {"_id": 1}, session=session))
+
+    async def _settle_for(self, payment: dict, settled_at: datetime, session=None) -> bool:
+        """Ödemenin kapattığı borçları koşullu (settled: False -> True) kapat; ödeme geçerliyse True
+
+        Aidat borcunu başka bir ödeme (ör. eşzamanlı online ödeme) kapatmışsa ödeme
+        kaydedilmez. Defterde borcu olmayan (eski) aidatların ödemesi kabul edilir.
+        """
+        settle = {"$set": {"settled": True, "settled_at": settled_at, "settled_by": payment["id"]}}
+        apartment_id = payment["apartment_id"]
+        monthly_due_id = payment.get("monthly_due_id")
+        # Yalnızca gecikme zammı ödemesinde (aidat önceden ödenmiş) aidat borcuna dokunulmaz
+        covers_due = round(payment["amount"] - (payment.get("late_fee_amount") or 0), 2) > 0
+        if monthly_due_id and covers_due:
+            result = await self.db.apartment_ledger.update_one(
+                {"apartment_id": apartment_id, "source_type": "monthly_due", "source_id": monthly_due_id,
+                 "kind": CHARGE, "settled": False},
+                settle,
+                session=session
+            )
+            if result.modified_count == 0 and await self._monthly_due_charged(apartment_id, monthly_due_id, session):
+                return False
+
+        fee_ids = payment.get("late_fee_ids") or []
+        won_fees = 0
+        for fee_id in fee_ids:
+            result = await self.db.apartment_ledger.update_one(
+                {"id": fee_id, "apartment_id": apartment_id, "kind": CHARGE, "settled": False}, settle, session=session
+            )
+            won_fees += result.modified_count
+        return covers_due or not fee_ids or won_fees > 0
+
+    async def record_payments(self, payments: List[dict], session=None) -> List[dict]:
+        """Ödemelerin borçlarını koşullu kapat, kazanan ödemeleri alacak olarak yaz; kaydedilen ödemeleri döndür
+
+        Dairesi olmayan ödemeler deftere yazılmaz ama kaydedilmiş sayılır.
+        """
+        if not payments:
+            return []
+
+        async def operation(session):
+            now = datetime.now(timezone.utc)
+            recorded = []
+            for payment in payments:
+                if not payment.get("apartment_id") or await self._settle_for(payment, now, session=session):
+                    recorded.append(payment)
+            credits = [
+                self._entry(
+                    p["building_id"], p["apartment_id"], CREDIT, p["amount"], "due_payment", p["id"],
+                    monthly_due_id=p.get("monthly_due_id")
+                )
+                for p in recorded if p.get("apartment_id")
+            ]
+            if credits:
+                await self._post_bulk(credits, session=session)
+            return recorded
+
+        return await self._run(operation, session)
+
+    async def reverse_monthly_due(self, monthly_due_id: str, session=None) -> int:
+        """Aidat tanımının açık borçlarını ve gecikme zamlarını ters kayıtla kapat"""
+        async def operation(session):
+            charges = await self.db.apartment_ledger.find(
+                {
+                    "$or": [
+                        {"source_type": "monthly_due", "source_id": monthly_due_id},
+                        {"source_type": "late_fee", "monthly_due_id": monthly_due_id},
+                    ],
+                    "kind": CHARGE,
+                    "settled": False
+                },
+                {"_id": 0, "id": 1, "building_id": 1, "apartment_id": 1, "amount": 1},
+                session=session
+            ).to_list(None)
+            if not charges:
+                return 0
+
+            reversals = [
+                self._entry(
+                    charge["building_id"], charge["apartment_id"], CREDIT, charge["amount"],
+                    "monthly_due_reversal", monthly_due_id, monthly_due_id=monthly_due_id
+                )
+                for charge in charges
+            ]
+            await self._post_bulk(reversals, session=session)
+            await self.db.apartment_ledger.bulk_write([
+                UpdateOne(
+                    {"id": charge["id"], "settled": False},
+                    {"$set": {"settled": True, "settled_at": reversal["created_at"], "settled_by": reversal["id"]}}
+                )
+                for charge, reversal in zip(charges, reversals)
+            ], ordered=False, session=session)
+            return len(charges)
+
+        return await self._run(operation, session)
+
+    async def repost_monthly_due(self, monthly_due: dict, apartment_ids: List[str], amounts: Optional[Dict[str, float]] = None,
+                                 session=None) -> int:
+        """Tanımı değişen aidatın açık borçlarını ters kayıtla kapat ve yeni tutar / vade ile yeniden yaz"""
+        async def operation(session):
+            await self.reverse_monthly_due(monthly_due["id"], session=session)
+            return await self.charge_monthly_due(monthly_due, apartment_ids, amounts, session=session)
+
+        return await self._run(operation, session)
+
+    async def get_balance(self, apartment_id: str) -> dict:
+        balance = await self.db.apartment_balances.find_one({"apartment_id": apartment_id}, {"_id": 0})
+        return balance or {"apartment_id": apartment_id, "balance": 0.0, "seq": 0, "charged_total": 0.0, "credited_total": 0.0}
+
+    async def open_charges(self, apartment_id: str) -> List[dict]:
+        """Dairenin kapanmamış borç kalemleri (vade sırasıyla)"""
+        return await self.db.apartment_ledger.find(
+            {"apartment_id": apartment_id, "kind": CHARGE, "settled": False},
+            {"_id": 0}
+        ).sort("due_date", 1).to_list(None)
+
+    async def monthly_due_charges(self, apartment_id: str) -> Dict[str, dict]:
+        """Dairenin aidat borçları: monthly_due_id -> {amount, settled} (arşivlenenler dahil)"""
+        query = {"apartment_id": apartment_id, "kind": CHARGE, "source_type": "monthly_due"}
+        projection = {"_id": 0, "source_id": 1, "amount": 1, "settled": 1}
+        live, archived = await asyncio.gather(
+            self.db.apartment_ledger.find(query, projection).to_list(None),
+            self.db.apartment_ledger_archive.find(query, projection).to_list(None)
+        )
+        # Arşive yalnızca kapatılmış borçlar taşınır; canlı kayıt varsa o geçerlidir
+        charges = {charge["source_id"]: charge for charge in archived}
+        charges.update((charge["source_id"], charge) for charge in live)
+        return charges
+
+    async def open_late_fees(self, apartment_id: str, monthly_due_id: Optional[str] = None) -> List[dict]:
+        """Dairenin ödenmemiş gecikme zamları (isteğe bağlı tek aidat için)"""
+        query: Dict[str, Any] = {"apartment_id": apartment_id, "kind": CHARGE, "settled": False, "source_type": "late_fee"}
+        if monthly_due_id:
+            query["monthly_due_id"] = monthly_due_id
+        return await self.db.apartment_ledger.find(
+            query, {"_id": 0, "id": 1, "amount": 1, "monthly_due_id": 1, "charge_id": 1, "period": 1, "due_date": 1}
+        ).sort("due_date", 1).to_list(None)
+
+    async def charge_amounts(self, monthly_due_id: str, apartment_ids: List[str]) -> Dict[str, float]:
+        """Bir aidat tanımının daire bazlı borç tutarları: apartment_id -> tutar"""
+        charges = await self.db.apartment_ledger.find(
+            {"source_type": "monthly_due", "source_id": monthly_due_id, "apartment_id": {"$in": apartment_ids}, "kind": CHARGE},
+            {"_id": 0, "apartment_id": 1, "amount": 1}
+        ).to_list(None)
+        return {charge["apartment_id"]: charge["amount"] for charge in charges}
+
+    async def entries(self, apartment_id: str, limit: int = 50, before_seq: Optional[int] = None) -> List[dict]:
+        """Dairenin defter kayıtları (yeniden eskiye, seq ile sayfalı)"""
+        query: Dict[str, Any] = {"apartment_id": apartment_id}
+        if before_seq is not None:
+            query["seq"] = {"$lt": before_seq}
+        return await self.db.apartment_ledger.find(query, {"_id": 0}).sort("seq", -1).to_list(limit)
+
+    async def overdue_charges(self, building_id: str, now: Optional[datetime] = None) -> List[dict]:
+        """Binadaki vadesi geçmiş açık borç kalemleri"""
+        return await self.db.apartment_ledger.find(
+            {"building_id": building_id, "kind": CHARGE, "settled": False, "due_date": {"$lt": now or datetime.now(timezone.utc)}},
+            {"_id": 0}
+        ).sort("due_date", 1).to_list(None)
+
+    async def collection_report(self, building_id: str) -> dict:
+        """Bina tahsilat raporu (daire bakiyeleri üzerinden)"""
+        rows = await self.db.apartment_balances.aggregate([
+            {"$match": {"building_id": building_id}},
+            {"$group": {
+                "_id": None,
+                "apartments": {"$sum": 1},
+                "apartments_in_debt": {"$sum": {"$cond": [{"$gt": ["$balance", 0]}, 1, 0]}},
+                "outstanding": {"$sum": {"$cond": [{"$gt": ["$balance", 0]}, "$balance", 0]}},
+                "charged_total": {"$sum": "$charged_total"},
+                "credited_total": {"$sum": "$credited_total"}
+            }}
+        ]).to_list(1)
+        report = rows[0] if rows else {"apartments": 0, "apartments_in_debt": 0, "outstanding": 0, "charged_total": 0, "credited_total": 0}
+        report.pop("_id", None)
+        charged = report["charged_total"]
+        report["collection_rate"] = round(report["credited_total"] / charged, 4) if charged else 0.0
+        for field in ("outstanding", "charged_total", "credited_total"):
+            report[field] = _money(report[field])
+        return report
+
+    async def compact_year(self, building_id: str, year: int) -> dict:
+        """Kapanmış bir yılın kapatılmış kayıtlarını arşive taşı ve yıllık özet yaz"""
+        if year >= datetime.now(timezone.utc).year:
+            raise ValueError("Yalnızca kapanmış yıllar sıkıştırılabilir")
+
+        start = datetime(year, 1, 1, tzinfo=timezone.utc)
+        end = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+        closed = {
+            "building_id": building_id,
+            "created_at": {"$gte": start, "$lt": end},
+            "$or": [{"kind": CREDIT}, {"kind": CHARGE, "settled": True}]
+        }
+
+        summaries = await self.db.apartment_ledger.aggregate([
+            {"$match": closed},
+            {"$sort": {"seq": 1}},
+            {"$group": {
+                "_id": "$apartment_id",
+                "entry_count": {"$sum": 1},
+                "charges": {"$sum": {"$cond": [{"$eq": ["$kind", CHARGE]}, "$amount", 0]}},
+                "credits": {"$sum": {"$cond": [{"$eq": ["$kind", CREDIT]}, "$amount", 0]}},
+                "first_seq": {"$first": "$seq"},
+                "last_seq": {"$last": "$seq"},
+                "closing_balance": {"$last": "$balance_after"}
+            }}
+        ]).to_list(None)
+
+        archived = 0
+        for summary in summaries:
+            apartment_id = summary.pop("_id")
+
+            async def operation(session, apartment_id=apartment_id, summary=summary):
+                query = {**closed, "apartment_id": apartment_id}
+                entries = await self.db.apartment_ledger.find(query, session=session).to_list(None)
+                if not entries:
+                    return 0
+                await self.db.apartment_ledger_archive.insert_many(entries, session=session)
+                await self.db.apartment_ledger_snapshots.update_one(
+                    {"building_id": building_id, "apartment_id": apartment_id, "year": year},
+                    {
+                        "$inc": {
+                            "entry_count": summary["entry_count"],
+                            "charges": _money(summary["charges"]),
+                            "credits": _money(summary["credits"])
+                        },
+                        "$max": {"last_seq": summary["last_seq"]},
+                        "$min": {"first_seq": summary["first_seq"]},
+                        "$set": {"closing_balance": summary["closing_balance"], "compacted_at": datetime.now(timezone.utc)}
+                    },
+                    upsert=True,
+                    session=session
+                )
+                result = await self.db.apartment_ledger.delete_many(
+                    {"_id": {"$in": [entry["_id"] for entry in entries]}}, session=session
+                )
+                return result.deleted_count
+
+            archived += await self._run(operation)
+
+        return {"year": year, "apartments": len(summaries), "archived_entries": archived}
@@ -0,0 +1,476 @@
+"""
+Bank Reconciliation
+Banka ekstresi (CSV / MT940) hareketlerinin açık aidat borçlarıyla eşleştirilmesi.
+
+Sakinlerin çoğu aidatı EFT / havale ile öder ve yönetici bunları elle
+işaretliyordu. İçe aktarılan ekstrenin alacak (C) hareketleri, binanın
+apartment_ledger'daki açık aidat borçlarıyla eşleştirilir. İçe aktarma
+başında bir kez kurulan hash index'ler kullanılır (iç içe döngü yok):
+
+- (tutar (kuruş), daire) -> açık borçlar (vade sırasıyla); referans / isimden
+  bulunan aday dairelerin borçlarına doğrudan erişilir
+- tutar (kuruş) -> vadeye göre sıralı kova; yalnızca tutarla eşleştirmede vade
+  penceresi ikili aramayla bulunur, kullanılmış borçlar kova içinde
+  sıkıştırılmış bir "sonraki boş" imleciyle atlanır (eşit bölünmüş aidatlarda
+  tüm borçlar aynı kovadadır)
+- normalize daire numarası -> daire ("A-12", "a12", "A 12" aynı anahtar)
+- normalize sakin adı -> (daire, sakin)
+
+Gecikme zammı olan borçlar index'e iki tutarla girer: yalnızca anapara ve
+anapara + açık gecikme zamları (ikincisi onaylanınca zamları da kapatır).
+
+Her hareketin açıklama / gönderen metninden daire referansı ve isim adayları
+çıkarılır. Tutarı tutan, vade penceresi (BANK_MATCH_DAYS_BEFORE /
+BANK_MATCH_DAYS_AFTER) içindeki ve aday dairelerden birine ait en eski borç
+seçilir. Güven düzeyi: daire + isim -> high, biri -> medium, yalnızca
+tutar (binada o tutarda tek borç) -> low.
+
+Sonuçlar `bank_reconciliation_items` kuyruğuna yazılır; yönetici onayladığı
+eşleşmeler `due_payments` yoluyla toplu kaydedilir, reddettikleri kapanır.
+Onay, kalemleri önce tek bir `update_many` ile `pending` -> `confirming`
+olarak sahiplenir ve yalnızca sahiplendiklerini kaydeder; eşzamanlı iki onay
+(ör. çift tıklama) aynı ödemeyi iki kez yazamaz. Kayıt hata verirse kalemler
+`pending`'e geri alınır; yarıda kalmış sahiplenmeler BANK_CLAIM_TIMEOUT_SECONDS
+sonra yeniden alınabilir. Ödeme borcu koşullu kapatır; bu arada online ödeme
+ile kapanmış borcun kalemi `already_settled` gerekçesiyle reddedilir.
+"""
+
+import bisect
+import csv
+import io
+import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from routes.bson_dates import as_datetime
+
+BANK_MATCH_DAYS_BEFORE = int(os.environ.get("BANK_MATCH_DAYS_BEFORE", "31"))
+BANK_MATCH_DAYS_AFTER = int(os.environ.get("BANK_MATCH_DAYS_AFTER", "90"))
+BANK_CLAIM_TIMEOUT_SECONDS = int(os.environ.get("BANK_CLAIM_TIMEOUT_SECONDS", "300"))
+
+TURKISH_ASCII = str.maketrans("çğıİöşüÇĞÖŞÜâîû", "cgiiosucgosuaiu")
+
+CSV_COLUMNS = {
+    "date": ("date", "tarih", "islem_tarihi", "işlem_tarihi", "valor"),
+    "amount": ("amount", "tutar", "alacak", "miktar"),
+    "description": ("description", "aciklama", "açıklama", "detay"),
+    "payer": ("payer", "gonderen", "gönderen", "ad_soyad", "karsi_taraf", "karşı_taraf"),
+    "reference": ("reference", "referans", "dekont_no", "islem_no", "işlem_no"),
+}
+
+DATE_FORMATS = ("%d.%m.%Y", "%d/%m/%Y", "%Y-%m-%d", "%d.%m.%Y %H:%M", "%d.%m.%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+
+def normalize_text(value: Any) -> str:
+    """Küçük harf, Türkçe karakterler ASCII, yalnızca harf / rakam / boşluk"""
+    text = str(value or "").translate(TURKISH_ASCII).lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+
+def normalize_reference(value: Any) -> str:
+    """Daire numarası anahtarı: 'A-12', 'a 12', 'A12' -> 'a12'"""
+    return normalize_text(value).replace(" ", "")
+
+
+def parse_amount(value: Any) -> Optional[float]:
+    text = str(value or "").strip().replace(" ", "").replace("TL", "").replace("₺", "")
+    if not text:
+        return None
+    if "," in text and "." in text:
+        # Son ayraç ondalık ayracıdır
+        if text.rfind(",") > text.rfind("."):
+            text = text.replace(".", "").replace(",", ".")
+        else:
+            text = text.replace(",", "")
+    elif "," in text:
+        text = text.replace(",", ".")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parse_date(value: Any) -> Optional[datetime]:
+    text = str(value or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+    return None
+
+
+def _decode(content: bytes) -> str:
+    try:
+        return content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        # Türk bankalarının Windows çıktıları
+        return content.decode("cp1254", errors="replace")
+
+
+def parse_csv(text: str) -> Iterator[dict]:
+    sample = text[:4096]
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(io.StringIO(text), dialect)
+    headers = [normalize_text(h).replace(" ", "_") for h in next(reader, [])]
+    lookup = {normalize_text(a).replace(" ", "_"): field for field, aliases in CSV_COLUMNS.items() for a in aliases}
+    mapping = {pos: lookup[h] for pos, h in enumerate(headers) if h in lookup}
+
+    for line, values in enumerate(reader, start=2):
+        row = {field: values[pos].strip() for pos, field in mapping.items() if pos < len(values)}
+        yield {
+            "line": line,
+            "date": parse_date(row.get("date")),
+            "amount": parse_amount(row.get("amount")),
+            "payer": row.get("payer") or None,
+            "description": row.get("description", ""),
+            "reference": row.get("reference") or None,
+        }
+
+
+MT940_STATEMENT_LINE = re.compile(r"^(\d{6})(\d{4})?(R?[CD])[A-Z]?(\d+,\d{0,2})")
+
+
+def parse_mt940(text: str) -> Iterator[dict]:
+    """:61: hareket satırları ve ardından gelen :86: açıklamaları"""
+    current: Optional[dict] = None
+    in_info = False
+    for line_number, raw in enumerate(text.splitlines(), start=1):
+        line = raw.rstrip()
+        if line.startswith(":61:"):
+            if current:
+                yield current
+            match = MT940_STATEMENT_LINE.match(line[4:])
+            in_info = False
+            if not match:
+                current = None
+                continue
+            value_date, _, mark, amount = match.groups()
+            signed = parse_amount(amount) or 0.0
+            reference = line[4:].split("//", 1)[1].strip() if "//" in line else None
+            current = {
+                "line": line_number,
+                "date": datetime.strptime(value_date, "%y%m%d").replace(tzinfo=timezone.utc),
+                "amount": signed if mark in ("C", "RD") else -signed,
+                "payer": None,
+                "description": "",
+                "reference": reference,
+            }
+        elif line.startswith(":86:") and current is not None:
+            current["description"] = re.sub(r"\?\d{2}", " ", line[4:])
+            in_info = True
+        elif line.startswith(":"):
+            in_info = False
+        elif in_info and current is not None:
+            current["description"] += " " + re.sub(r"\?\d{2}", " ", line)
+    if current:
+        yield current
+
+
+def parse_statement(content: bytes, filename: str) -> List[dict]:
+    text = _decode(content)
+    is_mt940 = filename.lower().endswith((".sta", ".mt940", ".940")) or ":61:" in text[:20000]
+    transactions = parse_mt940(text) if is_mt940 else parse_csv(text)
+    return [t for t in transactions if t["amount"] and t["amount"] > 0 and t["date"]]
+
+
+def _kurus(amount: float) -> int:
+    return int(round(amount * 100))
+
+
+def _in_window(charge: dict, date: datetime) -> bool:
+    due_date = charge.get("due_date")
+    return due_date is None or (
+        due_date - timedelta(days=BANK_MATCH_DAYS_BEFORE) <= date <= due_date + timedelta(days=BANK_MATCH_DAYS_AFTER)
+    )
+
+
+class AmountBucket:
+    """Aynı tutardaki açık borçlar: vadeye göre sıralı, kullanılanları atlayan imleçle"""
+
+    def __init__(self, charges: List[dict]):
+        self.charges = charges  # vade sırasıyla, vadesizler sonda
+        self.dates = [charge["due_date"] for charge in charges if charge.get("due_date") is not None]
+        # _next[i]: i'den itibaren kullanılmamış olabilecek ilk pozisyon (union-find, yol sıkıştırmalı)
+        self._next = list(range(len(charges) + 1))
+
+    def _find(self, position: int) -> int:
+        root = position
+        while self._next[root] != root:
+            root = self._next[root]
+        while self._next[position] != root:
+            self._next[position], position = root, self._next[position]
+        return root
+
+    def _unused(self, start: int, stop: int, used: Set[str]) -> Iterator[dict]:
+        position = self._find(start)
+        while position < stop:
+            charge = self.charges[position]
+            if charge["id"] in used:
+                # used yalnızca büyür: pozisyon kalıcı olarak atlanır
+                self._next[position] = position + 1
+            else:
+                yield charge
+            position = self._find(position + 1)
+
+    def in_window(self, date: datetime, used: Set[str], limit: int) -> List[dict]:
+        """Vade penceresindeki kullanılmamış ilk `limit` borç"""
+        start = bisect.bisect_left(self.dates, date - timedelta(days=BANK_MATCH_DAYS_AFTER))
+        stop = bisect.bisect_right(self.dates, date + timedelta(days=BANK_MATCH_DAYS_BEFORE))
+        found: List[dict] = []
+        for start, stop in ((start, stop), (len(self.dates), len(self.charges))):
+            for charge in self._unused(start, stop, used):
+                found.append(charge)
+                if len(found) >= limit:
+                    return found
+        return found
+
+
+class MatchIndex:
+    """İçe aktarma başına bir kez kurulan hash index'ler"""
+
+    def __init__(self, charges: List[dict], apartments: List[dict], residents: List[dict]):
+        self.by_amount_apartment: Dict[Tuple[int, str], List[dict]] = {}
+        grouped: Dict[int, List[dict]] = {}
+        for charge in sorted(charges, key=lambda c: (c.get("due_date") is None, c.get("due_date"))):
+            amount = _kurus(charge["amount"])
+            self.by_amount_apartment.setdefault((amount, charge["apartment_id"]), []).append(charge)
+            grouped.setdefault(amount, []).append(charge)
+        self.by_amount: Dict[int, AmountBucket] = {amount: AmountBucket(group) for amount, group in grouped.items()}
+
+        self.by_reference: Dict[str, str] = {}
+        door_counts: Dict[str, int] = {}
+        for apartment in apartments:
+            door = normalize_reference(apartment.get("door_number"))
+            if door:
+                door_counts[door] = door_counts.get(door, 0) + 1
+        for apartment in apartments:
+            number = normalize_reference(apartment.get("apartment_number"))
+            if number:
+                self.by_reference[number] = apartment["id"]
+            door = normalize_reference(apartment.get("door_number"))
+            # Yalnızca binada tekil olan kapı numaraları referans sayılır
+            if door and door_counts[door] == 1:
+                self.by_reference.setdefault(door, apartment["id"])
+
+        self.by_name: Dict[str, List[Tuple[str, str]]] = {}
+        self.residents_by_apartment: Dict[str, List[str]] = {}
+        for resident in residents:
+            if not resident.get("apartment_id"):
+                continue
+            self.residents_by_apartment.setdefault(resident["apartment_id"], []).append(resident["id"])
+            name = normalize_text(resident.get("full_name"))
+            if name:
+                self.by_name.setdefault(name, []).append((resident["apartment_id"], resident["id"]))
+
+    def references(self, tokens: List[str]) -> Set[str]:
+        """Tekli ve ardışık ikili token'lardan daire referansları"""
+        found = set()
+        for i, token in enumerate(tokens):
+            for key in (token, token + tokens[i + 1] if i + 1 < len(tokens) else None):
+                if key and key in self.by_reference:
+                    found.add(self.by_reference[key])
+        return found
+
+    def names(self, payer: Optional[str], tokens: List[str]) -> Dict[str, str]:
+        """Gönderen adı ve açıklamadaki 2-3 kelimelik pencerelerden (daire -> sakin)"""
+        found: Dict[str, str] = {}
+        windows = [normalize_text(payer)] if payer else []
+        windows += [" ".join(tokens[i:i + size]) for size in (2, 3) for i in range(len(tokens) - size + 1)]
+        for window in windows:
+            for apartment_id, resident_id in self.by_name.get(window, []):
+                found.setdefault(apartment_id, resident_id)
+        return found
+
+
+def match_transaction(transaction: dict, index: MatchIndex, used: Set[str]) -> Optional[dict]:
+    """Hareketi en uygun açık borçla eşleştir"""
+    amount = _kurus(transaction["amount"])
+    bucket = index.by_amount.get(amount)
+    if bucket is None:
+        return None
+
+    tokens = normalize_text(f"{transaction.get('payer') or ''} {transaction.get('description') or ''}").split()
+    references = index.references(tokens)
+    names = index.names(transaction.get("payer"), tokens)
+    apartments = references | set(names)
+
+    date = transaction["date"]
+    if apartments:
+        # Aday dairelerin bu tutardaki borçları; her dairenin en eski uygun borcu
+        matches = []
+        for apartment_id in apartments:
+            for charge in index.by_amount_apartment.get((amount, apartment_id), []):
+                if charge["id"] not in used and _in_window(charge, date):
+                    matches.append(charge)
+                    break
+        matches.sort(key=lambda c: (c.get("due_date") is None, c.get("due_date")))
+    else:
+        # Referans / isim yoksa yalnızca tutarı tekil olan borç düşük güvenle önerilir
+        matches = bucket.in_window(date, used, limit=2)
+        matches = matches if len(matches) == 1 else []
+    if not matches:
+        return None
+
+    charge = matches[0]
+    apartment_id = charge["apartment_id"]
+    reasons = ["amount", "date_window"]
+    if apartment_id in references:
+        reasons.append("apartment_reference")
+    if apartment_id in names:
+        reasons.append("payer_name")
+    confidence = {4: "high", 3: "medium"}.get(len(reasons), "low")
+
+    resident_id = names.get(apartment_id) or next(iter(index.residents_by_apartment.get(apartment_id, [])), None)
+    return {
+        "charge_id": charge["id"],
+        "monthly_due_id": charge.get("source_id"),
+        "apartment_id": apartment_id,
+        "resident_id": resident_id,
+        "amount": charge["amount"],
+        "late_fee_ids": charge.get("late_fee_ids", []),
+        "period": charge.get("period"),
+        "confidence": confidence,
+        "reasons": reasons,
+    }
+
+
+class BankReconciliation:
+    """bank_statement_imports / bank_reconciliation_items üzerinde mutabakat servisi"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def _build_index(self, building_id: str) -> MatchIndex:
+        charges = await self.db.apartment_ledger.find(
+            {"building_id": building_id, "kind": "charge", "settled": False, "source_type": "monthly_due"},
+            {"_id": 0, "id": 1, "apartment_id": 1, "amount": 1, "source_id": 1, "due_date": 1, "period": 1}
+        ).to_list(None)
+        fees = await self.db.apartment_ledger.find(
+            {"building_id": building_id, "kind": "charge", "settled": False, "source_type": "late_fee"},
+            {"_id": 0, "id": 1, "amount": 1, "charge_id": 1}
+        ).to_list(None)
+        fees_by_charge: Dict[str, List[dict]] = {}
+        for fee in fees:
+            fees_by_charge.setdefault(fee.get("charge_id"), []).append(fee)
+
+        with_fees = []
+        for charge in charges:
+            charge["due_date"] = as_datetime(charge.get("due_date"))
+            charge_fees = fees_by_charge.get(charge["id"])
+            if charge_fees:
+                with_fees.append({
+                    **charge,
+                    "amount": round(charge["amount"] + sum(fee["amount"] for fee in charge_fees), 2),
+                    "late_fee_ids": [fee["id"] for fee in charge_fees],
+                })
+        charges += with_fees
+        apartments = await self.db.apartments.find(
+            {"building_id": building_id}, {"_id": 0, "id": 1, "apartment_number": 1, "door_number": 1}
+        ).to_list(None)
+        residents = await self.db.residents.find(
+            {"building_id": building_id, "is_active": True},
+            {"_id": 0, "id": 1, "apartment_id": 1, "full_name": 1}
+        ).to_list(None)
+        return MatchIndex(charges, apartments, residents)
+
+    async def import_statement(self, content: bytes, filename: str, building_id: str, user_id: str) -> dict:
+        """Ekstreyi ayrıştır, eşleştir ve onay kuyruğuna yaz"""
+        transactions = parse_statement(content, filename)
+        index = await self._build_index(building_id)
+
+        import_id = str(uuid.uuid4())
+        now = datetime.now(timezone.utc)
+        used: Set[str] = set()
+        items = []
+        for transaction in transactions:
+            match = match_transaction(transaction, index, used)
+            if match:
+                used.add(match["charge_id"])
+            items.append({
+                "id": str(uuid.uuid4()),
+                "import_id": import_id,
+                "building_id": building_id,
+                "status": "pending" if match else "unmatched",
+                "transaction": transaction,
+                "match": match,
+                "created_at": now,
+            })
+
+        matched = sum(1 for item in items if item["match"])
+        summary = {
+            "id": import_id,
+            "building_id": building_id,
+            "filename": filename,
+            "transaction_count": len(transactions),
+            "matched": matched,
+            "unmatched": len(items) - matched,
+            "by_confidence": {
+                level: sum(1 for item in items if item["match"] and item["match"]["confidence"] == level)
+                for level in ("high", "medium", "low")
+            },
+            "imported_by": user_id,
+            "created_at": now,
+        }
+        if items:
+            await self.db.bank_reconciliation_items.insert_many(items, ordered=False)
+        await self.db.bank_statement_imports.insert_one(summary)
+        summary.pop("_id", None)
+        return summary
+
+    async def get_import(self, import_id: str, building_id: str) -> Optional[dict]:
+        return await self.db.bank_statement_imports.find_one({"id": import_id, "building_id": building_id}, {"_id": 0})
+
+    async def pending_items(self, import_id: str, building_id: str, item_ids: Optional[List[str]] = None) -> List[dict]:
+        query: Dict[str, Any] = {"import_id": import_id, "building_id": building_id, "status": "pending"}
+        if item_ids is not None:
+            query["id"] = {"$in": item_ids}
+        return await self.db.bank_reconciliation_items.find(query, {"_id": 0}).to_list(None)
+
+    async def claim(self, import_id: str, building_id: str, item_ids: Optional[List[str]], user_id: str) -> List[dict]:
+        """Bekleyen kalemleri atomik olarak onaya al; yalnızca bu çağrının sahiplendikleri döner
+
+        BANK_CLAIM_TIMEOUT_SECONDS'tan eski, yarıda kalmış (ör. süreç çöktü) sahiplenmeler
+        yeniden alınabilir; ödemeler borcu koşullu kapattığından tekrar kayıt oluşmaz.
+        """
+        claim_id = str(uuid.uuid4())
+        now = datetime.now(timezone.utc)
+        query: Dict[str, Any] = {
+            "import_id": import_id,
+            "building_id": building_id,
+            "$or": [
+                {"status": "pending"},
+                {"status": "confirming", "decided_at": {"$lt": now - timedelta(seconds=BANK_CLAIM_TIMEOUT_SECONDS)}},
+            ],
+        }
+        if item_ids is not None:
+            query["id"] = {"$in": item_ids}
+        await self.db.bank_reconciliation_items.update_many(
+            query,
+            {"$set": {"status": "confirming", "claim_id": claim_id, "decided_by": user_id, "decided_at": now}}
+        )
+        return await self.db.bank_reconciliation_items.find({"claim_id": claim_id}, {"_id": 0}).to_list(None)
+
+    async def release(self, item_ids: List[str]) -> int:
+        """Sahiplenilmiş (confirming) kalemleri onay bekleyen duruma geri al"""
+        if not item_ids:
+            return 0
+        result = await self.db.bank_reconciliation_items.update_many(
+            {"id": {"$in": item_ids}, "status": "confirming"},
+            {"$set": {"status": "pending"}, "$unset": {"claim_id": "", "decided_by": "", "decided_at": ""}}
+        )
+        return result.modified_count
+
+    async def mark(self, item_ids: List[str], status: str, user_id: str, from_status: str = "pending", **extra) -> int:
+        if not item_ids:
+            return 0
+        result = await self.db.bank_reconciliation_items.update_many(
+            {"id": {"$in": item_ids}, "status": from_status},
+            {"$set": {"status": status, "decided_by": user_id, "decided_at": datetime.now(timezone.utc), **extra}}
+        )
+        return result.modified_count
@@ -0,0 +1,96 @@
+"""
+Batch Loader
+İstek kapsamlı, DataLoader tarzı ilişki yükleyici.
+
+Aynı event loop turunda istenen anahtarları tek bir `$in` sorgusunda toplar
+ve sonuçları istek boyunca önbellekte tutar. Toplu mail gibi fan-out
+yollarında sakin başına yapılan `find_one` çağrılarını (N+1) tek sorguya
+indirir:
+
+    loaders = RequestLoaders(db)
+    await loaders.apartments.load_many(r.get("apartment_id") for r in residents)
+    apartment = await loaders.apartments.load(resident["apartment_id"])  # önbellekten
+
+Yükleyiciler istek başına oluşturulmalıdır; süreç genelinde paylaşılmaz.
+"""
+
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional
+
+MAX_BATCH_SIZE = 1000
+
+
+class BatchLoader:
+    """Bir koleksiyon için anahtar -> doküman yükleyici"""
+
+    def __init__(self, collection, key: str = "id", projection: Optional[dict] = None, max_batch_size: int = MAX_BATCH_SIZE):
+        self.collection = collection
+        self.key = key
+        self.projection = {"_id": 0, **(projection or {})}
+        self.max_batch_size = max_batch_size
+        self._cache: Dict[Any, asyncio.Future] = {}
+        self._queue: List[Any] = []
+        self._dispatch_scheduled = False
+        self.query_count = 0
+
+    async def load(self, key: Any) -> Optional[dict]:
+        """Tek bir dokümanı getir (aynı turdaki diğer isteklerle birleştirilir)"""
+        if key is None:
+            return None
+
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._cache[key] = future
+            self._queue.append(key)
+            if not self._dispatch_scheduled:
+                self._dispatch_scheduled = True
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+        return await future
+
+    async def load_many(self, keys: Iterable[Any]) -> List[Optional[dict]]:
+        """Birden çok dokümanı tek (veya parça başına bir) sorguyla getir"""
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key: Any, doc: Optional[dict]) -> None:
+        """Zaten elde olan bir dokümanı önbelleğe koy"""
+        if key is not None and key not in self._cache:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(doc)
+            self._cache[key] = future
+
+    def clear(self, key: Any) -> None:
+        self._cache.pop(key, None)
+
+    async def _dispatch(self) -> None:
+        keys, self._queue = self._queue, []
+        self._dispatch_scheduled = False
+
+        for start in range(0, len(keys), self.max_batch_size):
+            chunk = keys[start:start + self.max_batch_size]
+            try:
+                self.query_count += 1
+                docs = await self.collection.find({self.key: {"$in": chunk}}, self.projection).to_list(None)
+            except Exception as e:
+                for key in chunk:
+                    future = self._cache.pop(key, None)
+                    if future is not None and not future.done():
+                        future.set_exception(e)
+                continue
+
+            by_key = {doc.get(self.key): doc for doc in docs}
+            for key in chunk:
+                future = self._cache.get(key)
+                if future is not None and not future.done():
+                    future.set_result(by_key.get(key))
+
+
+class RequestLoaders:
+    """Bir istek boyunca kullanılan yükleyiciler"""
+
+    def __init__(self, db):
+        self.apartments = BatchLoader(db.apartments)
+        self.blocks = BatchLoader(db.blocks)
+        self.buildings = BatchLoader(db.buildings)
+        self.residents = BatchLoader(db.residents, projection={"hashed_password": 0})
@@ -0,0 +1,175 @@
+"""
+BSON Date Codec & Migration
+Zaman damgalarının ISO string yerine native BSON date olarak saklanması.
+
+- `DATE_CODEC_OPTIONS`: Motor veritabanı nesnesine verilir; okunan tüm
+  tarihler UTC timezone'lu `datetime` olarak gelir.
+- `as_datetime` / `decode_dates`: migration tamamlanana kadar kalan eski
+  string değerleri okurken datetime'a çevirir (datetime ise dokunmaz).
+- `migrate_dates`: `DATE_FIELDS` içindeki string alanları `_id` sırasıyla
+  partiler halinde BSON date'e çevirir. İlerleme `migrations` koleksiyonunda
+  tutulur; yarıda kesilirse kaldığı yerden devam eder. Tarih olarak
+  ayrıştırılamayan string değerler None ile ezilmez: olduğu gibi bırakılır,
+  checkpoint'te `skipped` olarak sayılır ve `_id`'leriyle loglanır.
+
+CLI: `python -m routes.bson_dates [--batch-size 500]`
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from bson.codec_options import CodecOptions
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+DATE_CODEC_OPTIONS = CodecOptions(tz_aware=True, tzinfo=timezone.utc)
+
+MIGRATE_BSON_DATES_ON_STARTUP = os.environ.get("MIGRATE_BSON_DATES_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+MIGRATION_BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", "500"))
+
+MIGRATION_NAME = "bson_dates"
+
+# Koleksiyon -> BSON date'e çevrilecek alanlar
+DATE_FIELDS: Dict[str, List[str]] = {
+    "users": ["created_at"],
+    "buildings": ["created_at", "subscription_end_date"],
+    "subscription_plans": ["created_at"],
+    "subscription_payments": ["created_at", "payment_date"],
+    "registration_requests": ["created_at", "approved_at", "rejected_at"],
+    "blocks": ["created_at"],
+    "apartments": ["created_at"],
+    "residents": ["created_at", "move_in_date", "move_out_date"],
+    "dues": ["created_at", "due_date", "paid_date"],
+    "monthly_dues": ["created_at", "due_date", "sent_at"],
+    "due_payments": ["payment_date"],
+    "announcements": ["created_at"],
+    "requests": ["created_at", "resolved_at"],
+    "surveys": ["created_at"],
+    "votings": ["created_at"],
+    "meetings": ["created_at"],
+    "decisions": ["created_at"],
+    "building_payments": ["due_date", "paid_date", "updated_at"],
+    "building_status": ["updated_at"],
+    "building_mail_templates": ["updated_at"],
+    "system_settings": ["updated_at"],
+    "mail_logs": ["sent_at"],
+    "notification_logs": ["sent_at"],
+    "token_versions": ["updated_at"],
+}
+
+
+def as_datetime(value: Any) -> Optional[datetime]:
+    """datetime veya ISO string'i UTC timezone'lu datetime'a çevir"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return None
+
+
+def decode_dates(doc: Optional[dict], *fields: str) -> Optional[dict]:
+    """Dokümandaki tarih alanlarını (eski string kayıtlar dahil) datetime yap"""
+    if doc:
+        for field in fields:
+            if doc.get(field) is not None:
+                doc[field] = as_datetime(doc[field])
+    return doc
+
+
+async def _migrate_collection(db, collection_name: str, fields: List[str], batch_size: int) -> int:
+    checkpoint_id = f"{MIGRATION_NAME}:{collection_name}"
+    checkpoint = await db.migrations.find_one({"_id": checkpoint_id}) or {}
+    if checkpoint.get("done"):
+        return 0
+
+    last_id = checkpoint.get("last_id")
+    converted = checkpoint.get("converted", 0)
+    skipped = checkpoint.get("skipped", 0)
+    string_filter = {"$or": [{field: {"$type": "string"}} for field in fields]}
+
+    while True:
+        query = {"$and": [string_filter, {"_id": {"$gt": last_id}}]} if last_id is not None else string_filter
+        batch = await db[collection_name].find(query, {field: 1 for field in fields}).sort("_id", 1).to_list(batch_size)
+        if not batch:
+            break
+
+        operations = []
+        unparseable = []
+        for doc in batch:
+            update = {}
+            for field in fields:
+                if not isinstance(doc.get(field), str):
+                    continue
+                value = as_datetime(doc[field])
+                if value is not None or doc[field] == "":
+                    # Boş string "tarih yok" demektir, None olarak yazılır
+                    update[field] = value
+                else:
+                    unparseable.append(f"{doc['_id']}.{field}={doc[field]!r}")
+            if update:
+                operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+
+        if unparseable:
+            skipped += len(unparseable)
+            logger.warning(f"BSON date migration: {collection_name} içinde ayrıştırılamayan tarihler atlandı: {', '.join(unparseable)}")
+
+        if operations:
+            await db[collection_name].bulk_write(operations, ordered=False)
+        converted += len(operations)
+        last_id = batch[-1]["_id"]
+
+        await db.migrations.update_one(
+            {"_id": checkpoint_id},
+            {"$set": {"last_id": last_id, "converted": converted, "skipped": skipped, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    await db.migrations.update_one(
+        {"_id": checkpoint_id},
+        {"$set": {"done": True, "converted": converted, "skipped": skipped, "finished_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    logger.info(f"BSON date migration: {collection_name} tamamlandı ({converted} doküman, {skipped} atlanan değer)")
+    return converted
+
+
+async def migrate_dates(db, batch_size: int = MIGRATION_BATCH_SIZE) -> Dict[str, int]:
+    """Tüm koleksiyonlardaki string tarihleri BSON date'e çevir (kaldığı yerden devam eder)"""
+    results = {}
+    for collection_name, fields in DATE_FIELDS.items():
+        results[collection_name] = await _migrate_collection(db, collection_name, fields, batch_size)
+    return results
+
+
+async def _main(batch_size: int) -> None:
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).resolve().parent.parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client.get_database(os.environ["DB_NAME"], codec_options=DATE_CODEC_OPTIONS)
+    try:
+        results = await migrate_dates(db, batch_size)
+    finally:
+        client.close()
+    for collection_name, converted in results.items():
+        print(f"{collection_name}: {converted}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="String tarihleri BSON date'e çevir")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    args = parser.parse_args()
+    asyncio.run(_main(args.batch_size))
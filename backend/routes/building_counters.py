@@ -0,0 +1,164 @@
+"""
+Building Counters
+Bina yöneticisi dashboard'u için bina başına artımlı tutulan sayaçlar.
+
+Dashboard her görüntülemede binanın tüm daire ve aidat kayıtlarını belleğe
+çekiyordu. Bunun yerine `building_counters` koleksiyonunda bina başına tek bir
+doküman tutulur ve yazma yolları bu dokümanı atomik `$inc` ile günceller:
+
+- daireler: toplam / dolu daire sayısı
+- sakinler: aktif sakin sayısı
+- aidatlar (`dues`): bekleyen adet ve tutar, tahsil edilen tutar
+- talepler: açık (pending / in_progress) talep sayısı
+- sakin online ödemeleri (`pay_resident_due`): tahsil edilen tutara eklenir
+
+Sayaç dokümanı yoksa ilk okumada sıfırdan hesaplanır (`$inc` upsert yapmaz;
+aksi halde yarım sayaçlı bir doküman oluşurdu). `rebuild` / `reconcile_all`
+sapmaları düzeltmek için sayaçları kaynak koleksiyonlardan yeniden hesaplar.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+OCCUPIED_APARTMENT_STATUSES = ("rented", "owner_occupied")
+OPEN_REQUEST_STATUSES = ("pending", "in_progress")
+
+COUNTER_FIELDS = (
+    "apartments",
+    "occupied_apartments",
+    "active_residents",
+    "pending_dues",
+    "pending_due_amount",
+    "collected_amount",
+    "open_requests",
+)
+
+
+def _apartment_counts(doc: dict) -> Dict[str, float]:
+    return {
+        "apartments": 1,
+        "occupied_apartments": 1 if doc.get("status") in OCCUPIED_APARTMENT_STATUSES else 0,
+    }
+
+
+def _resident_counts(doc: dict) -> Dict[str, float]:
+    return {"active_residents": 1 if doc.get("is_active") else 0}
+
+
+def _due_counts(doc: dict) -> Dict[str, float]:
+    amount = doc.get("amount", 0) or 0
+    unpaid = doc.get("status") == "unpaid"
+    paid = doc.get("status") == "paid"
+    return {
+        "pending_dues": 1 if unpaid else 0,
+        "pending_due_amount": amount if unpaid else 0,
+        "collected_amount": amount if paid else 0,
+    }
+
+
+def _request_counts(doc: dict) -> Dict[str, float]:
+    return {"open_requests": 1 if doc.get("status") in OPEN_REQUEST_STATUSES else 0}
+
+
+COUNTED_KINDS: Dict[str, Callable[[dict], Dict[str, float]]] = {
+    "apartment": _apartment_counts,
+    "resident": _resident_counts,
+    "due": _due_counts,
+    "request": _request_counts,
+}
+
+
+class BuildingCounters:
+    """building_counters koleksiyonu üzerinde sayaç servisi"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def _inc(self, building_id: str, deltas: Dict[str, float]) -> None:
+        deltas = {field: value for field, value in deltas.items() if value}
+        if not building_id or not deltas:
+            return
+        await self.db.building_counters.update_one(
+            {"building_id": building_id},
+            {"$inc": deltas, "$set": {"updated_at": datetime.now(timezone.utc)}}
+        )
+
+    async def apply(self, kind: str, old: Optional[dict] = None, new: Optional[dict] = None) -> None:
+        """Bir dokümanın eklenmesi / güncellenmesi / silinmesi için sayaç farkını uygula"""
+        counts = COUNTED_KINDS[kind]
+        before = counts(old) if old else {}
+        after = counts(new) if new else {}
+        deltas = {field: after.get(field, 0) - before.get(field, 0) for field in set(before) | set(after)}
+        building_id = (new or old or {}).get("building_id")
+        await self._inc(building_id, deltas)
+
+    async def apply_many(self, kind: str, new_docs: Optional[List[dict]] = None, old: Optional[List[dict]] = None) -> None:
+        """Toplu eklenen (new_docs) / silinen veya güncellenmeden önceki (old) dokümanlar için
+        farkları bina başına tek $inc ile uygula"""
+        counts = COUNTED_KINDS[kind]
+        per_building: Dict[str, Dict[str, float]] = {}
+        for docs, sign in ((new_docs or [], 1), (old or [], -1)):
+            for doc in docs:
+                totals = per_building.setdefault(doc.get("building_id"), {})
+                for field, value in counts(doc).items():
+                    totals[field] = totals.get(field, 0) + sign * value
+        for building_id, deltas in per_building.items():
+            await self._inc(building_id, deltas)
+
+    async def record_payment(self, building_id: str, amount: float) -> None:
+        """Sakin online ödemesini tahsil edilen tutara ekle"""
+        await self._inc(building_id, {"collected_amount": amount})
+
+    async def _sum_by_status(self, collection, building_id: str) -> Dict[Any, Dict[str, float]]:
+        rows = await collection.aggregate([
+            {"$match": {"building_id": building_id}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}, "amount": {"$sum": {"$ifNull": ["$amount", 0]}}}}
+        ]).to_list(None)
+        return {row["_id"]: row for row in rows}
+
+    async def rebuild(self, building_id: str) -> dict:
+        """Binanın sayaçlarını kaynak koleksiyonlardan sıfırdan hesapla"""
+        apartments, active_residents, dues, open_requests, payments = await asyncio.gather(
+            self._sum_by_status(self.db.apartments, building_id),
+            self.db.residents.count_documents({"building_id": building_id, "is_active": True}),
+            self._sum_by_status(self.db.dues, building_id),
+            self.db.requests.count_documents({"building_id": building_id, "status": {"$in": list(OPEN_REQUEST_STATUSES)}}),
+            self.db.due_payments.aggregate([
+                {"$match": {"building_id": building_id, "status": "paid"}},
+                {"$group": {"_id": None, "amount": {"$sum": {"$ifNull": ["$amount", 0]}}}}
+            ]).to_list(1)
+        )
+
+        now = datetime.now(timezone.utc)
+        counters = {
+            "building_id": building_id,
+            "apartments": sum(row["count"] for row in apartments.values()),
+            "occupied_apartments": sum(apartments.get(s, {}).get("count", 0) for s in OCCUPIED_APARTMENT_STATUSES),
+            "active_residents": active_residents,
+            "pending_dues": dues.get("unpaid", {}).get("count", 0),
+            "pending_due_amount": dues.get("unpaid", {}).get("amount", 0),
+            "collected_amount": dues.get("paid", {}).get("amount", 0) + (payments[0]["amount"] if payments else 0),
+            "open_requests": open_requests,
+            "updated_at": now,
+            "rebuilt_at": now,
+        }
+        await self.db.building_counters.replace_one({"building_id": building_id}, counters, upsert=True)
+        return counters
+
+    async def get(self, building_id: str) -> dict:
+        """Sayaç dokümanını oku; yoksa oluştur"""
+        counters = await self.db.building_counters.find_one({"building_id": building_id}, {"_id": 0})
+        if counters is None:
+            counters = await self.rebuild(building_id)
+        return counters
+
+    async def delete(self, building_id: str) -> None:
+        await self.db.building_counters.delete_one({"building_id": building_id})
+
+    async def reconcile_all(self) -> int:
+        """Tüm binaların sayaçlarını yeniden hesapla"""
+        building_ids = await self.db.buildings.distinct("id")
+        for building_id in building_ids:
+            await self.rebuild(building_id)
+        return len(building_ids)
@@ -0,0 +1,96 @@
+"""
+Bulk Insert
+Toplu oluşturma uç noktaları için satır bazlı doğrulama ve `insert_many`.
+
+Her satır ayrı ayrı pydantic modeli ile doğrulanır; hatalı satırlar tüm
+isteği düşürmez, rapora hata olarak yazılır. Geçerli satırlar tek bir
+`insert_many(ordered=False)` ile yazılır; yazma hataları (ör. unique index
+ihlali) `BulkWriteError` içindeki index üzerinden ilgili satıra eşlenir.
+Dönen rapor her satır için `created` / `error` sonucunu içerir.
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+from pymongo.errors import BulkWriteError
+
+BULK_MAX_ROWS = int(os.environ.get("BULK_MAX_ROWS", "1000"))
+
+
+class BulkReport:
+    """Satır bazlı toplu işlem raporu"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self._results: Dict[int, Dict[str, Any]] = {}
+
+    def error(self, row: int, message: str) -> None:
+        self._results[row] = {"row": row, "status": "error", "error": message}
+
+    def created(self, row: int, doc_id: str) -> None:
+        self._results[row] = {"row": row, "status": "created", "id": doc_id}
+
+    def failed(self, row: int) -> bool:
+        return self._results.get(row, {}).get("status") == "error"
+
+    def as_dict(self) -> Dict[str, Any]:
+        results = [self._results[row] for row in sorted(self._results)]
+        created = sum(1 for result in results if result["status"] == "created")
+        return {
+            "total": self.total,
+            "created": created,
+            "failed": self.total - created,
+            "results": results,
+        }
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()
+    )
+
+
+def validate_rows(rows: List[dict], model: Type[BaseModel], report: BulkReport) -> List[Tuple[int, BaseModel]]:
+    """Satırları modele göre doğrula; geçerli olanları (satır no, model) olarak döndür"""
+    valid = []
+    for row, data in enumerate(rows):
+        try:
+            valid.append((row, model.model_validate(data)))
+        except ValidationError as e:
+            report.error(row, _validation_message(e))
+    return valid
+
+
+def mark_duplicates(items: List[Tuple[int, Any]], key, report: BulkReport, message: str) -> None:
+    """Aynı batch içinde anahtarı tekrar eden satırları (ilki hariç) hatalı işaretle"""
+    seen = set()
+    for row, item in items:
+        value = key(item)
+        if value is None or report.failed(row):
+            continue
+        if value in seen:
+            report.error(row, message)
+        seen.add(value)
+
+
+async def insert_rows(collection, rows: List[Tuple[int, dict]], report: BulkReport) -> List[dict]:
+    """Dokümanları ordered=False ile yaz; başarıyla yazılanları döndür"""
+    if not rows:
+        return []
+
+    failed: Dict[int, Optional[str]] = {}
+    try:
+        await collection.insert_many([doc for _, doc in rows], ordered=False)
+    except BulkWriteError as e:
+        for write_error in e.details.get("writeErrors", []):
+            failed[write_error["index"]] = write_error.get("errmsg")
+
+    inserted = []
+    for position, (row, doc) in enumerate(rows):
+        if position in failed:
+            report.error(row, "Kayıt yazılamadı (tekrarlanan kayıt olabilir)")
+        else:
+            report.created(row, doc["id"])
+            inserted.append(doc)
+    return inserted
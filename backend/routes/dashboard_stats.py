@@ -0,0 +1,115 @@
+"""
+Dashboard Stats
+Süperadmin dashboard istatistiklerinin tek bir `$facet` aggregation ile
+hesaplanması ve kısa TTL'li önbelleği.
+
+Tüm bina dokümanlarını Python'a çekmek yerine sayımlar, toplamlar, abonelik
+durumuna göre dağılım ve en yeni 5 bina Mongo tarafında hesaplanır. `$facet`
+öncesindeki sıralama (created_at, id) index'ini kullanır; böylece "son
+binalar" için bellekte sıralama yapılmaz.
+
+Sonuç `dashboard_cache` içinde tutulur; `buildings` koleksiyonuna ve kullanıcı
+sayısına etki eden yazmalar önbelleği geçersiz kılar.
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from cachetools import TTLCache
+
+DASHBOARD_CACHE_TTL_SECONDS = int(os.environ.get("DASHBOARD_CACHE_TTL_SECONDS", "30"))
+
+# Abonelik durumuna göre aylık gelir (bina başına, şimdilik sabit)
+SUBSCRIPTION_MONTHLY_REVENUE = {"active": 500.0}
+
+RECENT_BUILDINGS_LIMIT = 5
+
+SUPERADMIN_DASHBOARD_PIPELINE = [
+    {"$sort": {"created_at": -1, "id": -1}},
+    {"$facet": {
+        "totals": [
+            {"$group": {
+                "_id": None,
+                "total_buildings": {"$sum": 1},
+                "active_buildings": {"$sum": {"$cond": [{"$eq": ["$is_active", False]}, 0, 1]}},
+                "total_apartments": {"$sum": {"$ifNull": ["$apartment_count", 0]}}
+            }}
+        ],
+        "by_subscription": [
+            {"$group": {"_id": "$subscription_status", "count": {"$sum": 1}}}
+        ],
+        "recent": [
+            {"$limit": RECENT_BUILDINGS_LIMIT},
+            {"$project": {"_id": 0}}
+        ]
+    }}
+]
+
+
+async def aggregate_superadmin_stats(db) -> Dict[str, Any]:
+    """Bina istatistiklerini tek aggregation ile hesapla"""
+    result = await db.buildings.aggregate(SUPERADMIN_DASHBOARD_PIPELINE).to_list(1)
+    facets = result[0] if result else {}
+
+    totals = (facets.get("totals") or [{}])[0]
+    by_subscription = {row["_id"]: row["count"] for row in facets.get("by_subscription", [])}
+    total_buildings = totals.get("total_buildings", 0)
+    active_buildings = totals.get("active_buildings", 0)
+
+    return {
+        "total_buildings": total_buildings,
+        "active_buildings": active_buildings,
+        "inactive_buildings": total_buildings - active_buildings,
+        "total_apartments": totals.get("total_apartments", 0),
+        "total_revenue": sum(
+            count * SUBSCRIPTION_MONTHLY_REVENUE.get(status, 0.0)
+            for status, count in by_subscription.items()
+        ),
+        "subscriptions": by_subscription,
+        "recent_buildings": facets.get("recent", []),
+    }
+
+
+class DashboardCache:
+    """Dashboard sonuçları için anahtar bazlı TTL önbelleği"""
+
+    def __init__(self, ttl: int = DASHBOARD_CACHE_TTL_SECONDS, maxsize: int = 1024):
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._cache.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._cache[key] = value
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            if self._cache.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "ttl_seconds": self._cache.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+SUPERADMIN_DASHBOARD_KEY = "superadmin"
+
+dashboard_cache = DashboardCache()
@@ -0,0 +1,129 @@
+"""
+Due Allocation
+Gider kalemlerinin dairelere arsa payı, m² veya eşit paylaşımla, blok
+filtresiyle dağıtılması.
+
+Her gider kalemi (`ExpenseItem`) bir dağıtım yöntemi (`allocation`) ve
+isteğe bağlı `block_ids` taşır. Dağıtım tek bir NumPy matris işlemidir:
+
+- `basis` (daire × yöntem): eşit (1), arsa payı, m²
+- `weights` (daire × kalem): kalemin yöntemine ait sütun × blok maskesi
+- `shares`: sütun bazında normalize edilmiş ağırlıklar × kalem tutarı
+
+Tutarlar kuruş (int64) cinsinden hesaplanır: her daireye payının tabanı
+yazılır, kalan kuruşlar en büyük küsurattan başlayarak (largest remainder)
+birer birer dağıtılır. Böylece her kalemin daire toplamı kalem tutarına
+kuruşu kuruşuna eşittir.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+ALLOCATION_METHODS = ("equal", "land_share", "square_meters")
+
+
+def to_kurus(amount: float) -> int:
+    return int(round(float(amount) * 100))
+
+
+def requires_allocation(expense_items: List[dict]) -> bool:
+    """Tüm kalemler blok filtresiz eşit paylaşımsa daire başı sabit tutar yeterlidir"""
+    return any(
+        item.get("allocation", "equal") != "equal" or item.get("block_ids")
+        for item in expense_items
+    )
+
+
+def allocate(apartments: List[dict], expense_items: List[dict]) -> np.ndarray:
+    """Daire × kalem kuruş matrisi döndür (satırlar apartments sırasında)"""
+    n, k = len(apartments), len(expense_items)
+    if n == 0:
+        raise ValueError("Binada daire bulunamadı")
+    if k == 0:
+        return np.zeros((n, 0), dtype=np.int64)
+
+    methods = [item.get("allocation", "equal") for item in expense_items]
+    unknown = sorted(set(methods) - set(ALLOCATION_METHODS))
+    if unknown:
+        raise ValueError(f"Geçersiz dağıtım yöntemi: {', '.join(unknown)}")
+
+    # Yöntem tabanı: daire × (eşit, arsa payı, m²)
+    basis = np.column_stack([
+        np.ones(n),
+        np.array([a.get("land_share") or 0.0 for a in apartments], dtype=np.float64),
+        np.array([a.get("square_meters") or 0.0 for a in apartments], dtype=np.float64),
+    ])
+    weights = basis[:, [ALLOCATION_METHODS.index(m) for m in methods]]
+
+    # Blok maskesi: kalem × blok üyelik matrisi, dairelerin blok koduyla genişletilir
+    block_codes, apartment_blocks = np.unique(
+        np.array([a.get("block_id") or "" for a in apartments], dtype=object), return_inverse=True
+    )
+    block_index = {block_id: code for code, block_id in enumerate(block_codes)}
+    membership = np.ones((k, len(block_codes)), dtype=bool)
+    for column, item in enumerate(expense_items):
+        if item.get("block_ids"):
+            membership[column] = False
+            membership[column, [block_index[b] for b in item["block_ids"] if b in block_index]] = True
+    weights = weights * membership[:, apartment_blocks].T
+
+    totals = weights.sum(axis=0)
+    empty = np.flatnonzero(totals <= 0)
+    if empty.size:
+        names = ", ".join(expense_items[i].get("name", str(i)) for i in empty)
+        raise ValueError(f"Dağıtım ağırlığı bulunamayan gider kalemleri (arsa payı / m² eksik veya blok boş): {names}")
+
+    amounts = np.array([to_kurus(item.get("amount", 0)) for item in expense_items], dtype=np.int64)
+    exact = weights / totals * amounts
+    base = np.floor(exact).astype(np.int64)
+
+    # Largest remainder: her kalemde kalan kuruşlar en büyük küsurata sahip dairelere
+    remainder = amounts - base.sum(axis=0)
+    fraction = np.where(weights > 0, exact - base, -1.0)
+    order = np.argsort(-fraction, axis=0, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(n)[:, None].repeat(k, axis=1), axis=0)
+    return base + (ranks < remainder).astype(np.int64)
+
+
+def allocation_report(apartments: List[dict], expense_items: List[dict], matrix: np.ndarray) -> Dict[str, Any]:
+    """Kuruş matrisini daire bazlı TL rapora çevir"""
+    names = [item.get("name", "") for item in expense_items]
+    apartment_totals = matrix.sum(axis=1)
+    rows = [
+        {
+            "apartment_id": apartment["id"],
+            "apartment_number": apartment.get("apartment_number"),
+            "block_id": apartment.get("block_id"),
+            "items": {name: int(value) / 100 for name, value in zip(names, matrix[i])},
+            "total": int(apartment_totals[i]) / 100,
+        }
+        for i, apartment in enumerate(apartments)
+    ]
+    return {
+        "apartment_count": len(apartments),
+        "total_amount": int(matrix.sum()) / 100,
+        "item_totals": {name: int(value) / 100 for name, value in zip(names, matrix.sum(axis=0))},
+        "min_amount": int(apartment_totals.min()) / 100 if len(apartments) else 0.0,
+        "max_amount": int(apartment_totals.max()) / 100 if len(apartments) else 0.0,
+        "apartments": rows,
+    }
+
+
+async def load_allocation_apartments(db, building_id: str) -> List[dict]:
+    return await db.apartments.find(
+        {"building_id": building_id},
+        {"_id": 0, "id": 1, "block_id": 1, "apartment_number": 1, "land_share": 1, "square_meters": 1}
+    ).sort("apartment_number", 1).to_list(None)
+
+
+async def apartment_amounts(db, monthly_due: dict) -> Optional[Dict[str, float]]:
+    """Aidat tanımı için daire -> tutar; dağıtım gerekmiyorsa None (per_apartment_amount geçerli)"""
+    expense_items = monthly_due.get("expense_items") or []
+    if not requires_allocation(expense_items):
+        return None
+    apartments = await load_allocation_apartments(db, monthly_due["building_id"])
+    matrix = allocate(apartments, expense_items)
+    totals = matrix.sum(axis=1)
+    return {apartment["id"]: int(total) / 100 for apartment, total in zip(apartments, totals)}
@@ -0,0 +1,145 @@
+"""
+Due Generation
+Aylık aidat tanımından dolu her daire için `dues` kaydının toplu üretimi.
+
+`create_monthly_due` yalnızca bina düzeyinde bir tanım (`per_apartment_amount`)
+saklar; daire bazlı `dues` kayıtları `POST /api/dues` ile tek tek
+oluşturuluyordu. `DueGenerator` tanımı alır, dolu (rented / owner_occupied)
+daireleri ve bu dairelerin aktif sakinlerini birer sorgu ile okur ve tüm
+kayıtları tek bir `bulk_write` ile yazar.
+
+Tanımın tutarı / vadesi değişince `reprice` ödenmemiş kayıtları günceller.
+
+Her işlem (monthly_due_id, apartment_id) üzerinde `$setOnInsert` upsert'tür;
+aynı koleksiyondaki kısmi unique index ile birlikte üretim idempotenttir:
+tekrar çalıştırmak mevcut kayıtlara dokunmaz, yalnızca eksik daireleri ekler.
+"""
+
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from routes.building_counters import OCCUPIED_APARTMENT_STATUSES
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def _pick_resident(apartment: dict, residents: List[dict]) -> Optional[dict]:
+    """Kiradaki dairede kiracıyı, diğerlerinde malik'i tercih et"""
+    preferred = "tenant" if apartment.get("status") == "rented" else "owner"
+    for resident in residents:
+        if resident.get("type") == preferred:
+            return resident
+    return residents[0] if residents else None
+
+
+class DueGenerator:
+    """monthly_dues -> dues toplu üretim servisi"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def _occupied_apartments(self, building_id: str) -> Tuple[List[dict], Dict[str, List[dict]]]:
+        apartments = await self.db.apartments.find(
+            {"building_id": building_id, "status": {"$in": list(OCCUPIED_APARTMENT_STATUSES)}},
+            {"_id": 0, "id": 1, "status": 1, "apartment_number": 1}
+        ).to_list(None)
+
+        residents_by_apartment: Dict[str, List[dict]] = {}
+        if apartments:
+            residents = await self.db.residents.find(
+                {"building_id": building_id, "is_active": True, "apartment_id": {"$in": [a["id"] for a in apartments]}},
+                {"_id": 0, "id": 1, "apartment_id": 1, "type": 1}
+            ).sort("created_at", 1).to_list(None)
+            for resident in residents:
+                residents_by_apartment.setdefault(resident["apartment_id"], []).append(resident)
+        return apartments, residents_by_apartment
+
+    def _due_doc(self, monthly_due: dict, apartment: dict, resident: dict, amount: float, now: datetime) -> dict:
+        return {
+            "id": str(uuid.uuid4()),
+            "building_id": monthly_due["building_id"],
+            "monthly_due_id": monthly_due["id"],
+            "apartment_id": apartment["id"],
+            "resident_id": resident["id"],
+            "month": monthly_due.get("month"),
+            "amount": amount,
+            "description": f"{monthly_due.get('month', '')} aidatı",
+            "due_date": monthly_due.get("due_date"),
+            "status": "unpaid",
+            "paid_date": None,
+            "created_at": now,
+        }
+
+    async def generate(self, monthly_due: dict, amounts: Optional[Dict[str, float]] = None) -> Tuple[dict, List[dict]]:
+        """Dolu her daireye aidat kaydı üret; (rapor, yeni eklenen kayıtlar) döndür
+
+        amounts verilirse (gider dağıtımı) daire tutarı oradan, aksi halde
+        per_apartment_amount'tan alınır.
+        """
+        apartments, residents_by_apartment = await self._occupied_apartments(monthly_due["building_id"])
+        flat_amount = monthly_due.get("per_apartment_amount", 0)
+        now = datetime.now(timezone.utc)
+
+        docs = []
+        without_resident = []
+        for apartment in apartments:
+            resident = _pick_resident(apartment, residents_by_apartment.get(apartment["id"], []))
+            if resident is None:
+                without_resident.append(apartment.get("apartment_number") or apartment["id"])
+                continue
+            amount = amounts.get(apartment["id"], 0) if amounts is not None else flat_amount
+            docs.append(self._due_doc(monthly_due, apartment, resident, amount, now))
+
+        upserted_indexes: List[int] = []
+        if docs:
+            operations = [
+                UpdateOne(
+                    {"monthly_due_id": doc["monthly_due_id"], "apartment_id": doc["apartment_id"]},
+                    {"$setOnInsert": doc},
+                    upsert=True
+                )
+                for doc in docs
+            ]
+            try:
+                result = await self.db.dues.bulk_write(operations, ordered=False)
+                upserted_indexes = list(result.upserted_ids.keys())
+            except BulkWriteError as e:
+                # Eşzamanlı bir üretim aynı daireyi eklemiş olabilir; unique index ihlalleri yok sayılır
+                unexpected = [err for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY_ERROR]
+                if unexpected:
+                    raise
+                upserted_indexes = [item["index"] for item in e.details.get("upserted", [])]
+
+        inserted = [docs[index] for index in upserted_indexes]
+        report = {
+            "occupied_apartments": len(apartments),
+            "created": len(inserted),
+            "existing": len(docs) - len(inserted),
+            "without_resident": without_resident,
+        }
+        return report, inserted
+
+    async def reprice(self, monthly_due: dict, amounts: Optional[Dict[str, float]] = None, session=None) -> Tuple[List[dict], List[dict]]:
+        """Ödenmemiş kayıtların tutar / vadesini güncel tanıma göre yaz; (eski, yeni) kayıtları döndür"""
+        pending = await self.db.dues.find(
+            {"monthly_due_id": monthly_due["id"], "status": "unpaid"}, {"_id": 0}, session=session
+        ).to_list(None)
+        flat_amount = monthly_due.get("per_apartment_amount", 0)
+        repriced = [
+            {
+                **due,
+                "amount": amounts.get(due["apartment_id"], 0) if amounts is not None else flat_amount,
+                "due_date": monthly_due.get("due_date"),
+            }
+            for due in pending
+        ]
+        if repriced:
+            await self.db.dues.bulk_write([
+                UpdateOne({"id": due["id"], "status": "unpaid"}, {"$set": {"amount": due["amount"], "due_date": due["due_date"]}})
+                for due in repriced
+            ], ordered=False, session=session)
+        return pending, repriced
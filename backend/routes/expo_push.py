@@ -13,6 +13,9 @@ import logging
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 
+from routes.bson_dates import DATE_CODEC_OPTIONS
+from routes.rate_limiter import rate_limiter
+
 # Setup logging
 logger = logging.getLogger(__name__)
 
@@ -21,7 +24,7 @@ router = APIRouter(prefix="/api/expo-push", tags=["expo-push"])
 # MongoDB connection
 MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 client = AsyncIOMotorClient(MONGO_URL)
-db = client[os.environ.get('DB_NAME', 'bina_yonetim')]
+db = client.get_database(os.environ.get('DB_NAME', 'bina_yonetim'), codec_options=DATE_CODEC_OPTIONS)
 
 # Expo Push API URL
 EXPO_PUSH_URL = "https://exp.host/--/api/v2/push/send"
@@ -151,6 +154,7 @@ async def send_notification_to_building(request: SendToBuildingRequest):
             }
         
         # Expo Push API'ye gönder
+        await rate_limiter.acquire("expo", None, tokens=len(messages))
         async with httpx.AsyncClient() as client:
             response = await client.post(
                 EXPO_PUSH_URL,
@@ -231,6 +235,7 @@ async def send_announcement_notification(request: SendAnnouncementRequest):
             }
         
         # Expo Push API'ye gönder
+        await rate_limiter.acquire("expo", None, tokens=len(messages))
         async with httpx.AsyncClient() as client:
             response = await client.post(
                 EXPO_PUSH_URL,
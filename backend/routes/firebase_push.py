@@ -14,6 +14,8 @@ import os
 import logging
 from pathlib import Path
 
+from routes.rate_limiter import rate_limiter
+
 # Setup logging
 logger = logging.getLogger(__name__)
 
@@ -206,6 +208,7 @@ async def send_notification_to_building(request: SendToTopicRequest):
         )
         
         # Gönder
+        await rate_limiter.acquire("firebase", None)
         response = messaging.send(message)
         logger.info(f"Notification sent to topic {topic}: {response}")
         
@@ -281,6 +284,7 @@ async def send_announcement_notification(request: SendAnnouncementNotificationRe
             apns=apns_config
         )
         
+        await rate_limiter.acquire("firebase", None)
         response = messaging.send(message)
         logger.info(f"Announcement notification sent to {topic}: {response}")
         
@@ -315,6 +319,7 @@ async def send_notification_to_token(request: SendToTokenRequest):
             token=request.fcm_token
         )
         
+        await rate_limiter.acquire("firebase", None)
         response = messaging.send(message)
         logger.info(f"Notification sent to token: {response}")
         
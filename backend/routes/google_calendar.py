@@ -15,6 +15,8 @@ from googleapiclient.discovery import build
 from google.auth.transport.requests import Request as GoogleRequest
 import requests
 
+from routes.settings_registry import settings_registry
+
 router = APIRouter(prefix="/api/google-calendar", tags=["Google Calendar"])
 
 # Google OAuth Config - will be loaded from DB
@@ -50,11 +52,7 @@ class MeetingRequest(BaseModel):
 
 async def get_google_config(building_id: str) -> dict:
     """Get Google Calendar config for a building"""
-    config = await db.google_calendar_config.find_one(
-        {"building_id": building_id},
-        {"_id": 0}
-    )
-    return config
+    return await settings_registry.get(db, "google_calendar", building_id)
 
 
 async def get_google_tokens(building_id: str) -> dict:
@@ -140,6 +138,7 @@ async def save_config(building_id: str, config: GoogleCalendarConfig):
         }},
         upsert=True
     )
+    await settings_registry.invalidate(db, "google_calendar", building_id)
     return {"success": True, "message": "Konfigürasyon kaydedildi"}
 
 
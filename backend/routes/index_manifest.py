@@ -0,0 +1,447 @@
+"""
+Index Manifest
+Tüm koleksiyonların index'lerinin tek, bildirimsel tanımı.
+
+Startup'ta `reconcile_indexes(db)` manifest'i veritabanıyla karşılaştırır:
+eksik index'ler koleksiyonlar arasında eşzamanlı olarak oluşturulur, manifest
+dışında kalan index'ler yalnızca loglanır (silinmez; elle eklenmiş bir index'i
+yanlışlıkla düşürmemek için). Anahtarı aynı olup `unique`, partial filtre veya
+TTL seçeneği değişen index'ler düşürülüp yeniden oluşturulur.
+
+`QUERY_SHAPES`, handler'ların kullandığı sorgu şekillerinin listesidir.
+`check_query_plans(db)` her birini `explain()` ile çalıştırıp COLLSCAN'a düşen
+sorguları döndürür. INDEX_PLAN_CHECK=true ile startup'ta çalışır ve hata
+varsa uygulama açılmaz; CI'da `python -m routes.index_manifest` ile de
+çalıştırılabilir.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+logger = logging.getLogger(__name__)
+
+INDEX_PLAN_CHECK = os.environ.get("INDEX_PLAN_CHECK", "false").lower() in ("1", "true", "yes")
+
+
+def _index(keys, **options) -> IndexModel:
+    if isinstance(keys, str):
+        keys = [(keys, ASCENDING)]
+    return IndexModel(keys, **options)
+
+
+def _tenant_listing() -> IndexModel:
+    # Keyset pagination: building_id + (created_at, id)
+    return _index([("building_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)])
+
+
+def _global_listing() -> IndexModel:
+    return _index([("created_at", DESCENDING), ("id", DESCENDING)])
+
+
+INDEX_MANIFEST: Dict[str, List[IndexModel]] = {
+    "users": [
+        _index("email", unique=True),
+        _index("id", unique=True),
+        _index([("building_id", ASCENDING), ("role", ASCENDING)]),
+        _index("role"),
+        _global_listing(),
+    ],
+    "buildings": [
+        _index("id", unique=True),
+        _global_listing(),
+    ],
+    "subscription_plans": [
+        _index("id", unique=True),
+        _index([("is_active", ASCENDING), ("price_monthly", ASCENDING)]),
+    ],
+    "subscription_payments": [
+        _global_listing(),
+    ],
+    "registration_requests": [
+        _index("id", unique=True),
+        _index("email"),
+        _global_listing(),
+    ],
+    "blocks": [
+        _index("id", unique=True),
+        _index("building_id"),
+    ],
+    "apartments": [
+        _index("id", unique=True),
+        _tenant_listing(),
+    ],
+    "residents": [
+        _index("id", unique=True),
+        _index([("phone", ASCENDING), ("is_active", ASCENDING)]),
+        _index("email"),
+        _index([("building_id", ASCENDING), ("is_active", ASCENDING)]),
+        _index("push_token"),
+        _tenant_listing(),
+    ],
+    "dues": [
+        _index("id", unique=True),
+        _index([("building_id", ASCENDING), ("due_date", ASCENDING)]),
+        # Aidat tanımından üretilen kayıtlar daire başına tekil (eski kayıtlarda monthly_due_id yok)
+        _index(
+            [("monthly_due_id", ASCENDING), ("apartment_id", ASCENDING)],
+            unique=True,
+            # $exists null'ı da kapsar; eski POST /dues kayıtları null taşıyabilir
+            partialFilterExpression={"monthly_due_id": {"$type": "string"}}
+        ),
+        _tenant_listing(),
+    ],
+    "monthly_dues": [
+        _index("id", unique=True),
+        _index([("building_id", ASCENDING), ("month", ASCENDING)]),
+        _index([("building_id", ASCENDING), ("due_date", ASCENDING)]),
+        _tenant_listing(),
+    ],
+    "due_payments": [
+        _index([("resident_id", ASCENDING), ("monthly_due_id", ASCENDING), ("status", ASCENDING)]),
+        _index("monthly_due_id"),
+        _index([("building_id", ASCENDING), ("status", ASCENDING)]),
+    ],
+    "announcements": [
+        _index("id", unique=True),
+        _index([("building_id", ASCENDING), ("is_active", ASCENDING), ("created_at", DESCENDING)]),
+        _tenant_listing(),
+    ],
+    "requests": [
+        _index("id", unique=True),
+        _index([("resident_id", ASCENDING), ("created_at", DESCENDING)]),
+        _index([("building_id", ASCENDING), ("status", ASCENDING)]),
+        _tenant_listing(),
+    ],
+    "surveys": [
+        _index("id", unique=True),
+        _index([("building_id", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "votings": [
+        _index("id", unique=True),
+        _index([("building_id", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "meetings": [
+        _index("id", unique=True),
+        _index([("building_id", ASCENDING), ("date", DESCENDING)]),
+    ],
+    "decisions": [
+        _index("id", unique=True),
+        _index([("building_id", ASCENDING), ("decision_date", DESCENDING)]),
+    ],
+    "building_status": [
+        _index("building_id"),
+    ],
+    "building_payments": [
+        _index("id"),
+        _index([("building_id", ASCENDING), ("due_date", DESCENDING)]),
+    ],
+    "building_counters": [
+        _index("building_id", unique=True),
+    ],
+    "building_mail_templates": [
+        _index([("building_id", ASCENDING), ("name", ASCENDING)]),
+    ],
+    "mail_templates": [
+        _index("id"),
+        _index("name"),
+    ],
+    "mail_logs": [
+        _index([("sent_at", DESCENDING)]),
+    ],
+    "notification_logs": [
+        _index([("building_id", ASCENDING), ("sent_at", DESCENDING)]),
+    ],
+    "notification_timeline": [
+        _index([("type", ASCENDING), ("id", ASCENDING)], unique=True),
+        _tenant_listing(),
+    ],
+    "apartment_ledger": [
+        _index("id", unique=True),
+        _index([("apartment_id", ASCENDING), ("seq", DESCENDING)]),
+        _index([("apartment_id", ASCENDING), ("kind", ASCENDING), ("settled", ASCENDING), ("due_date", ASCENDING)]),
+        _index([("source_type", ASCENDING), ("source_id", ASCENDING), ("apartment_id", ASCENDING)]),
+        _index([("building_id", ASCENDING), ("kind", ASCENDING), ("settled", ASCENDING), ("due_date", ASCENDING)]),
+        _index([("building_id", ASCENDING), ("created_at", ASCENDING)]),
+        # Gecikme zammı taraması: tüm binalarda açık, vadesi geçmiş borçlar
+        _index([("kind", ASCENDING), ("settled", ASCENDING), ("due_date", ASCENDING)]),
+        # Aidat silinince / ödenince bağlı gecikme zamları
+        _index([("source_type", ASCENDING), ("monthly_due_id", ASCENDING)]),
+        # Gecikme zammı (borç, dönem) başına tekil
+        _index(
+            [("source_id", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"source_type": "late_fee"}
+        ),
+    ],
+    "bank_statement_imports": [
+        _index("id", unique=True),
+        _index("building_id"),
+    ],
+    "bank_reconciliation_items": [
+        _index("id", unique=True),
+        _index([("import_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        _index([("import_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        _index("claim_id", sparse=True),
+        _index("building_id"),
+    ],
+    "late_fee_runs": [
+        _index("id", unique=True),
+        _index("building_id"),
+    ],
+    "apartment_balances": [
+        _index("apartment_id", unique=True),
+        _index([("building_id", ASCENDING), ("balance", DESCENDING)]),
+    ],
+    "apartment_ledger_archive": [
+        _index("building_id"),
+        # Sıkıştırılmış yılların ödenmiş aidatları (my-dues / aidat ödeme)
+        _index([("apartment_id", ASCENDING), ("source_type", ASCENDING), ("kind", ASCENDING)]),
+    ],
+    "apartment_ledger_snapshots": [
+        _index([("building_id", ASCENDING), ("apartment_id", ASCENDING), ("year", ASCENDING)], unique=True),
+    ],
+    "push_tokens": [
+        _index("user_id"),
+        _index([("building_id", ASCENDING), ("is_active", ASCENDING)]),
+    ],
+    "payments": [
+        _index("order_id"),
+    ],
+    "google_calendar_config": [
+        _index("building_id"),
+    ],
+    "google_tokens": [
+        _index("building_id"),
+    ],
+    "token_versions": [
+        _index("id", unique=True),
+        _index("updated_at"),
+    ],
+    "resident_imports": [
+        _index("id", unique=True),
+        _index("building_id"),
+    ],
+    "purge_jobs": [
+        _index("id", unique=True),
+        _index("status"),
+    ],
+    "settings_versions": [
+        _index("id", unique=True),
+        _index("updated_at"),
+    ],
+    "rate_limits": [
+        _index("id", unique=True),
+    ],
+    "outbox": [
+        _index("id", unique=True),
+        # Worker claim: status eşitliği + (priority, available_at) sırası
+        _index([("status", ASCENDING), ("priority", ASCENDING), ("available_at", ASCENDING)]),
+        _index([("status", ASCENDING), ("failed_at", DESCENDING)]),
+        # Bina silinince bina işleri tenant purge ile temizlenir
+        _index("building_id"),
+        # Gönderilmiş işler 14 gün sonra silinir
+        _index("sent_at", expireAfterSeconds=14 * 24 * 3600),
+    ],
+}
+
+
+def _key_tuple(keys) -> Tuple[Tuple[str, Any], ...]:
+    return tuple((field, direction) for field, direction in keys.items())
+
+
+# Değişirse index'in yeniden oluşturulması gereken seçenekler
+REBUILD_OPTIONS = ("unique", "partialFilterExpression", "expireAfterSeconds")
+
+
+def _options(spec) -> Dict[str, Any]:
+    return {option: spec.get(option) for option in REBUILD_OPTIONS if spec.get(option) not in (None, False)}
+
+
+async def _reconcile_collection(db, name: str, models: List[IndexModel]) -> Dict[str, Any]:
+    collection = db[name]
+    existing = {}
+    async for info in collection.list_indexes():
+        existing[_key_tuple(info["key"])] = info
+
+    wanted = {_key_tuple(model.document["key"]): model for model in models}
+    missing = [model for key, model in wanted.items() if key not in existing]
+    extra = [info["name"] for key, info in existing.items() if key not in wanted and info["name"] != "_id_"]
+
+    # Anahtarı aynı, seçenekleri değişmiş index: düşürüp manifest'teki haliyle oluştur
+    for key, model in wanted.items():
+        info = existing.get(key)
+        if info is not None and info["name"] != "_id_" and _options(info) != _options(model.document):
+            logger.info(f"Index seçenekleri değişti, yeniden oluşturuluyor: {name}.{info['name']}")
+            await collection.drop_index(info["name"])
+            missing.append(model)
+
+    created = []
+    if missing:
+        created = await collection.create_indexes(missing)
+    for index_name in extra:
+        logger.warning(f"Index manifest dışı index: {name}.{index_name}")
+
+    return {"created": created, "extra": extra}
+
+
+async def reconcile_indexes(db, manifest: Optional[Dict[str, List[IndexModel]]] = None) -> Dict[str, Any]:
+    """Manifest'teki eksik index'leri oluştur, fazlaları logla"""
+    manifest = manifest or INDEX_MANIFEST
+    names = list(manifest)
+    results = await asyncio.gather(*(_reconcile_collection(db, name, manifest[name]) for name in names))
+    report = {name: result for name, result in zip(names, results) if result["created"] or result["extra"]}
+    created_total = sum(len(result["created"]) for result in results)
+    if created_total:
+        logger.info(f"Index manifest: {created_total} index oluşturuldu")
+    return report
+
+
+# (koleksiyon, filtre, sıralama) — handler'ların sorgu şekilleri.
+# Filtre değerleri yalnızca plan seçimi için temsilidir.
+QUERY_SHAPES: List[Tuple[str, dict, Optional[list]]] = [
+    ("users", {"email": "x"}, None),
+    ("users", {"id": "x"}, None),
+    ("users", {"role": "superadmin"}, None),
+    ("users", {"building_id": "x", "role": "building_admin"}, None),
+    ("users", {}, [("created_at", -1), ("id", -1)]),
+    ("buildings", {"id": "x"}, None),
+    ("buildings", {}, [("created_at", -1), ("id", -1)]),
+    ("buildings", {"$or": [{"created_at": {"$lt": "x"}}, {"created_at": "x", "id": {"$lt": "x"}}]}, [("created_at", -1), ("id", -1)]),
+    ("subscription_plans", {"is_active": True}, [("price_monthly", 1)]),
+    ("subscription_payments", {}, [("created_at", -1), ("id", -1)]),
+    ("registration_requests", {"email": "x"}, None),
+    ("registration_requests", {"id": "x"}, None),
+    ("blocks", {"building_id": "x"}, None),
+    ("apartments", {"building_id": "x"}, [("created_at", -1), ("id", -1)]),
+    ("apartments", {"id": "x", "building_id": "x"}, None),
+    ("residents", {"phone": "x", "is_active": True}, None),
+    ("residents", {"email": "x"}, None),
+    ("residents", {"building_id": "x", "is_active": True, "email": {"$ne": None}}, None),
+    ("residents", {"building_id": "x"}, [("created_at", -1), ("id", -1)]),
+    ("residents", {"push_token": {"$exists": True, "$ne": None}}, None),
+    ("dues", {"building_id": "x"}, [("created_at", -1), ("id", -1)]),
+    ("monthly_dues", {"building_id": "x"}, [("created_at", -1), ("id", -1)]),
+    ("monthly_dues", {"building_id": "x", "month": "x"}, None),
+    ("monthly_dues", {"building_id": "x", "due_date": {"$lt": datetime(2000, 1, 1, tzinfo=timezone.utc)}}, None),
+    ("dues", {"building_id": "x", "due_date": {"$lt": datetime(2000, 1, 1, tzinfo=timezone.utc)}}, None),
+    ("monthly_dues", {"id": "x", "building_id": "x"}, None),
+    ("dues", {"monthly_due_id": "x", "apartment_id": "x"}, None),
+    ("dues", {"monthly_due_id": "x", "status": "unpaid"}, None),
+    ("dues", {"monthly_due_id": "x", "building_id": "x"}, None),
+    ("apartments", {"building_id": "x", "status": {"$in": ["rented", "owner_occupied"]}}, None),
+    ("due_payments", {"resident_id": "x"}, None),
+    ("due_payments", {"monthly_due_id": "x", "resident_id": "x", "status": "paid"}, None),
+    ("due_payments", {"monthly_due_id": "x", "status": "paid"}, None),
+    ("announcements", {"building_id": "x"}, [("created_at", -1), ("id", -1)]),
+    ("announcements", {"building_id": "x", "is_active": True}, [("created_at", -1)]),
+    ("requests", {"building_id": "x"}, [("created_at", -1), ("id", -1)]),
+    ("requests", {"resident_id": "x"}, [("created_at", -1)]),
+    ("requests", {"building_id": "x", "status": {"$in": ["pending", "in_progress"]}}, None),
+    ("surveys", {"building_id": "x"}, [("created_at", -1)]),
+    ("votings", {"building_id": "x"}, [("created_at", -1)]),
+    ("meetings", {"building_id": "x"}, [("date", -1)]),
+    ("decisions", {"building_id": "x"}, [("decision_date", -1)]),
+    ("building_status", {"building_id": "x"}, None),
+    ("building_counters", {"building_id": "x"}, None),
+    ("building_payments", {"building_id": "x"}, [("due_date", -1)]),
+    ("building_payments", {"id": "x", "building_id": "x"}, None),
+    ("building_mail_templates", {"building_id": "x"}, None),
+    ("building_mail_templates", {"building_id": "x", "name": "x"}, None),
+    ("mail_templates", {"id": "x"}, None),
+    ("mail_templates", {"name": "x", "is_active": True}, None),
+    ("mail_logs", {}, [("sent_at", -1)]),
+    ("notification_logs", {"building_id": "x"}, [("sent_at", -1)]),
+    ("notification_timeline", {"building_id": "x"}, [("created_at", -1), ("id", -1)]),
+    ("notification_timeline", {"building_id": "x", "created_at": {"$gt": datetime(2000, 1, 1, tzinfo=timezone.utc)}}, [("created_at", -1), ("id", -1)]),
+    ("notification_timeline", {"type": "x", "id": "x"}, None),
+    ("apartment_ledger", {"apartment_id": "x"}, [("seq", -1)]),
+    ("apartment_ledger", {"apartment_id": "x", "kind": "charge", "settled": False}, [("due_date", 1)]),
+    ("apartment_ledger", {"source_type": "monthly_due", "source_id": "x", "kind": "charge", "settled": False}, None),
+    ("apartment_ledger", {"source_type": "monthly_due", "source_id": "x", "apartment_id": {"$in": ["x"]}, "kind": "charge"}, None),
+    ("apartment_ledger", {"apartment_id": "x", "kind": "charge", "source_type": "monthly_due"}, None),
+    ("apartment_ledger_archive", {"apartment_id": "x", "kind": "charge", "source_type": "monthly_due"}, None),
+    ("apartment_ledger", {"apartment_id": "x", "kind": "charge", "settled": False, "source_type": "late_fee"}, [("due_date", 1)]),
+    ("apartment_ledger", {"building_id": "x", "kind": "charge", "settled": False, "source_type": "late_fee"}, None),
+    ("apartment_ledger", {"source_type": "late_fee", "monthly_due_id": "x", "kind": "charge", "settled": False}, None),
+    ("apartment_ledger", {"building_id": "x", "kind": "charge", "settled": False, "due_date": {"$lt": datetime(2000, 1, 1, tzinfo=timezone.utc)}}, [("due_date", 1)]),
+    ("apartment_ledger", {"kind": "charge", "settled": False, "source_type": "monthly_due", "due_date": {"$lt": datetime(2000, 1, 1, tzinfo=timezone.utc)}}, None),
+    ("apartment_ledger", {"source_type": "late_fee", "source_id": {"$in": ["x"]}}, None),
+    ("apartment_ledger", {"apartment_id": "x", "source_type": "monthly_due", "source_id": "x", "kind": "charge", "settled": False}, None),
+    ("apartment_ledger", {"id": "x", "apartment_id": "x", "kind": "charge", "settled": False}, None),
+    ("apartment_ledger_archive", {"apartment_id": "x", "kind": "charge", "source_type": "monthly_due", "source_id": "x"}, None),
+    ("bank_statement_imports", {"id": "x", "building_id": "x"}, None),
+    ("bank_reconciliation_items", {"import_id": "x", "building_id": "x"}, [("created_at", -1), ("id", -1)]),
+    ("bank_reconciliation_items", {"import_id": "x", "building_id": "x", "status": "pending"}, [("created_at", -1), ("id", -1)]),
+    ("bank_reconciliation_items", {"id": {"$in": ["x"]}, "status": "pending"}, None),
+    ("bank_reconciliation_items", {"id": {"$in": ["x"]}, "status": "confirming"}, None),
+    ("bank_reconciliation_items", {"claim_id": "x"}, None),
+    ("late_fee_runs", {"id": "x", "lease_until": {"$lte": datetime(2000, 1, 1, tzinfo=timezone.utc)}}, None),
+    ("apartment_balances", {"apartment_id": "x"}, None),
+    ("apartment_balances", {"building_id": "x"}, [("balance", -1)]),
+    ("push_tokens", {"user_id": "x"}, None),
+    ("push_tokens", {"building_id": "x", "is_active": True}, None),
+    ("payments", {"order_id": "x"}, None),
+    ("google_calendar_config", {"building_id": "x"}, None),
+    ("google_tokens", {"building_id": "x"}, None),
+    ("token_versions", {"updated_at": {"$gte": "x"}}, None),
+    ("resident_imports", {"id": "x", "building_id": "x"}, None),
+    ("purge_jobs", {"id": "x"}, None),
+    ("purge_jobs", {"status": {"$in": ["pending", "running", "failed"]}}, None),
+    ("settings_versions", {"updated_at": {"$gte": "x"}}, None),
+    ("outbox", {"status": "pending", "available_at": {"$lte": "x"}}, [("priority", 1), ("available_at", 1)]),
+    ("outbox", {"status": "dead"}, [("failed_at", -1)]),
+]
+
+
+def _plan_stages(plan: dict):
+    yield plan.get("stage")
+    for child_key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(child_key), dict):
+            yield from _plan_stages(plan[child_key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+async def check_query_plans(db, shapes: Optional[List[Tuple[str, dict, Optional[list]]]] = None) -> List[dict]:
+    """Her sorgu şeklini explain() ile çalıştır, COLLSCAN kullananları döndür"""
+    failures = []
+    for collection_name, query, sort in shapes or QUERY_SHAPES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            failures.append({"collection": collection_name, "query": query, "sort": sort})
+    return failures
+
+
+async def _main() -> int:
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from routes.bson_dates import DATE_CODEC_OPTIONS
+
+    load_dotenv(Path(__file__).resolve().parent.parent / ".env")
+
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client.get_database(os.environ["DB_NAME"], codec_options=DATE_CODEC_OPTIONS)
+    try:
+        await reconcile_indexes(db)
+        failures = await check_query_plans(db)
+    finally:
+        client.close()
+
+    for failure in failures:
+        print(f"COLLSCAN: {failure['collection']} {failure['query']} sort={failure['sort']}")
+    print(f"{len(QUERY_SHAPES) - len(failures)}/{len(QUERY_SHAPES)} sorgu şekli index kullanıyor")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(_main()))
@@ -0,0 +1,185 @@
+"""
+Late Fees
+Vadesi geçmiş aidat borçları için toplu gecikme zammı hesaplama işi.
+
+Gecikme durumu yalnızca `get_resident_dues` okunurken hesaplanıyor, gecikme
+zammı hiç uygulanmıyordu. Bu iş apartment_ledger üzerindeki açık aidat
+borçlarını (kind=charge, settled=False, source_type=monthly_due,
+due_date < kesim) index'li tek bir aralık sorgusu ile tarar ve bina başına:
+
+- tutar / vade dizileri üzerinde NumPy ile vektörel ücret hesaplar
+  (LATE_FEE_MODE=monthly: dönem başına anapara × oran,
+  daily: günlük oran = aylık oran / 30),
+- ücretleri defterde `late_fee` borcu olarak `post_charges` ile toplu yazar.
+
+Dönemler takvime değil borcun vadesine göre sayılır: ilk dönem vade (+ mühlet)
+geçtiği an başlar, sonraki her dönem bir ay (daily modda bir gün) sonra.
+Böylece 31 Ekim vadeli bir borç ertesi gün ikinci bir zam almaz. Her ücret
+`source_id = <borç id>:<dönem başlangıcı YYYY-MM-DD>` taşır. Yazmadan önce
+mevcut kayıtlar elenir ve `late_fee_runs` içinde (bina, çalışma günü) başına
+lease'li bir kilit alınır; kısmi unique index de aynı ücretin iki kez
+yazılmasını engeller. Gecikme zammı kayıtları tekrar zam üretmez (bileşik faiz
+yok).
+
+LATE_FEE_JOB_ENABLED=true ile uygulama içinde LATE_FEE_JOB_INTERVAL_SECONDS
+aralıkla çalışır; ayrıca `POST /api/system/late-fees/run` ile tetiklenebilir.
+"""
+
+import asyncio
+import calendar
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from pymongo.errors import DuplicateKeyError
+
+from routes.bson_dates import as_datetime
+
+logger = logging.getLogger(__name__)
+
+LATE_FEE_MONTHLY_RATE = float(os.environ.get("LATE_FEE_MONTHLY_RATE", "0.05"))
+LATE_FEE_MODE = os.environ.get("LATE_FEE_MODE", "monthly").lower()  # monthly, daily
+LATE_FEE_GRACE_DAYS = int(os.environ.get("LATE_FEE_GRACE_DAYS", "0"))
+LATE_FEE_JOB_ENABLED = os.environ.get("LATE_FEE_JOB_ENABLED", "false").lower() in ("1", "true", "yes")
+LATE_FEE_JOB_INTERVAL_SECONDS = int(os.environ.get("LATE_FEE_JOB_INTERVAL_SECONDS", "3600"))
+LATE_FEE_RUN_LEASE_SECONDS = 600
+
+LATE_FEE_SOURCE = "late_fee"
+
+
+def _add_months(start: datetime, months: int) -> datetime:
+    """Ay ekle; gün hedef ayın son gününe kırpılır (31 Ocak + 1 ay = 28/29 Şubat)"""
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    return start.replace(year=year, month=month, day=min(start.day, calendar.monthrange(year, month)[1]))
+
+
+def fee_period(due_date: datetime, now: datetime, mode: str = LATE_FEE_MODE) -> Optional[datetime]:
+    """Borcun `now` anındaki gecikme döneminin başlangıcı (henüz gecikmemişse None)"""
+    start = due_date + timedelta(days=LATE_FEE_GRACE_DAYS)
+    if now <= start:
+        return None
+    if mode == "daily":
+        return start + timedelta(days=(now - start).days)
+    months = (now.year - start.year) * 12 + now.month - start.month
+    if _add_months(start, months) > now:
+        months -= 1
+    return _add_months(start, months)
+
+
+def compute_fees(amounts: np.ndarray, rate: float = LATE_FEE_MONTHLY_RATE, mode: str = LATE_FEE_MODE) -> np.ndarray:
+    """Dönem başına gecikme zammı (kuruşa yuvarlanmış TL)"""
+    period_rate = rate / 30 if mode == "daily" else rate
+    return np.round(amounts * period_rate * 100) / 100
+
+
+class LateFeeJob:
+    """Açık aidat borçları üzerinde gecikme zammı işi"""
+
+    def __init__(self, db, ledger):
+        self.db = db
+        self.ledger = ledger
+
+    async def _claim(self, building_id: str, run_day: str, now: datetime) -> bool:
+        """(bina, çalışma günü) kilidini al; başka bir süreç çalışıyorsa False"""
+        try:
+            await self.db.late_fee_runs.update_one(
+                {"id": f"{building_id}:{run_day}", "lease_until": {"$lte": now}},
+                {
+                    "$set": {"lease_until": now + timedelta(seconds=LATE_FEE_RUN_LEASE_SECONDS), "started_at": now},
+                    "$setOnInsert": {"building_id": building_id, "run_day": run_day, "fee_count": 0}
+                },
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Kilit başka bir süreçte (lease süresi dolmamış)
+            return False
+
+    async def _apply_building(self, building_id: str, charges: List[dict], run_day: str, now: datetime) -> int:
+        if not await self._claim(building_id, run_day, now):
+            return 0
+
+        periods = [fee_period(charge["due_date"], now).strftime("%Y-%m-%d") for charge in charges]
+        source_ids = [f"{charge['id']}:{period}" for charge, period in zip(charges, periods)]
+        existing = set(await self.db.apartment_ledger.distinct(
+            "source_id", {"source_type": LATE_FEE_SOURCE, "source_id": {"$in": source_ids}}
+        ))
+
+        amounts = np.array([charge["amount"] for charge in charges], dtype=np.float64)
+        fees = compute_fees(amounts)
+        entries = [
+            self.ledger.charge_entry(
+                building_id,
+                charge["apartment_id"],
+                float(fee),
+                LATE_FEE_SOURCE,
+                source_id,
+                period=period,
+                due_date=now,
+                charge_id=charge["id"],
+                monthly_due_id=charge.get("source_id")
+            )
+            for charge, fee, source_id, period in zip(charges, fees, source_ids, periods)
+            if fee > 0 and source_id not in existing
+        ]
+        written = await self.ledger.post_charges(entries)
+
+        # Kilit bırakılır; sonradan vadesi geçen / dönemi dolan borçlar sonraki çalıştırmada eklenir
+        finished = datetime.now(timezone.utc)
+        await self.db.late_fee_runs.update_one(
+            {"id": f"{building_id}:{run_day}"},
+            {"$inc": {"fee_count": written}, "$set": {"lease_until": finished, "finished_at": finished}}
+        )
+        return written
+
+    async def run(self, now: Optional[datetime] = None, building_id: Optional[str] = None) -> Dict[str, Any]:
+        """Tüm binalarda (veya tek binada) borçların içinde bulunduğu dönemin gecikme zamlarını yaz"""
+        now = now or datetime.now(timezone.utc)
+        run_day = now.strftime("%Y-%m-%d")
+        cutoff = now - timedelta(days=LATE_FEE_GRACE_DAYS)
+
+        query: Dict[str, Any] = {
+            "kind": "charge",
+            "settled": False,
+            "source_type": "monthly_due",
+            "due_date": {"$lt": cutoff},
+        }
+        if building_id:
+            query["building_id"] = building_id
+
+        by_building: Dict[str, List[dict]] = {}
+        async for charge in self.db.apartment_ledger.find(
+            query, {"_id": 0, "id": 1, "building_id": 1, "apartment_id": 1, "amount": 1, "source_id": 1, "due_date": 1}
+        ):
+            charge["due_date"] = as_datetime(charge["due_date"])
+            by_building.setdefault(charge["building_id"], []).append(charge)
+
+        written = 0
+        for bid, charges in by_building.items():
+            try:
+                written += await self._apply_building(bid, charges, run_day, now)
+            except Exception as e:
+                logger.error(f"Gecikme zammı hatası ({bid}): {e}")
+
+        return {
+            "run_day": run_day,
+            "mode": LATE_FEE_MODE,
+            "rate": LATE_FEE_MONTHLY_RATE,
+            "buildings": len(by_building),
+            "overdue_charges": sum(len(c) for c in by_building.values()),
+            "fees_written": written,
+        }
+
+    async def loop(self) -> None:
+        """LATE_FEE_JOB_INTERVAL_SECONDS aralıkla çalışan arka plan döngüsü"""
+        while True:
+            try:
+                report = await self.run()
+                if report["fees_written"]:
+                    logger.info(f"Gecikme zammı: {report}")
+            except Exception as e:
+                logger.error(f"Gecikme zammı işi hatası: {e}")
+            await asyncio.sleep(LATE_FEE_JOB_INTERVAL_SECONDS)
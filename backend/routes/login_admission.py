@@ -0,0 +1,218 @@
+"""
+Login Admission Control
+Login endpoint'leri için eşzamanlılık sınırlı kabul katmanı.
+
+Her login bir bcrypt doğrulaması yapar; kontrolsüz bir credential-stuffing
+dalgası veya toplu uygulama açılışı worker'ları doyurup diğer endpoint'leri
+aç bırakabilir. Bu modül şunları sağlar:
+
+- IP ve kimlik (email / telefon) bazında kayan pencere (sliding window) limitleri
+- Global eşzamanlı bcrypt sınırı; gözlenen gecikmeye göre AIMD ile uyarlanır
+- Hızlı 429 yolu (bcrypt'e hiç girmeden ret) ve metrikler
+
+Kimlik penceresi yalnızca başarısız denemeleri sayar; başarılı login kendi
+kaydını geri alır. Pencere endpoint'ten bağımsızdır: aynı telefonu kontrol
+eden `/resident-login` ve `/resident-login-v2` tek bir bütçeyi paylaşır.
+
+IP, yalnızca LOGIN_TRUSTED_PROXIES'teki bir proxy'den gelen isteklerde
+X-Forwarded-For'dan alınır. Varsayılan yalnızca loopback'tir; backend
+portu (8001) doğrudan yayınlandığından özel ağlara güvenmek, LAN'daki
+herkesin başlığı taklit edip IP limitini atlatmasına izin verirdi. Backend
+nginx arkasındaysa nginx'in backend'e bağlandığı adres eklenmelidir (ör.
+host'taki nginx için docker bridge gateway'i: `LOGIN_TRUSTED_PROXIES=
+127.0.0.1/32,::1/128,172.18.0.1/32`); aksi halde tüm istekler proxy
+IP'sinden geliyormuş gibi görünür ve IP limiti site geneli bir login
+sınırına dönüşür.
+"""
+
+import ipaddress
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, List, Optional, Union
+
+from fastapi import HTTPException, Request, status
+
+LOGIN_RATE_PER_IP = int(os.environ.get("LOGIN_RATE_PER_IP", "60"))
+LOGIN_RATE_PER_IP_WINDOW = float(os.environ.get("LOGIN_RATE_PER_IP_WINDOW", "60"))
+LOGIN_RATE_PER_IDENTITY = int(os.environ.get("LOGIN_RATE_PER_IDENTITY", "10"))
+LOGIN_RATE_PER_IDENTITY_WINDOW = float(os.environ.get("LOGIN_RATE_PER_IDENTITY_WINDOW", "300"))
+LOGIN_MAX_IN_FLIGHT = int(os.environ.get("LOGIN_MAX_IN_FLIGHT", "16"))
+LOGIN_MIN_IN_FLIGHT = int(os.environ.get("LOGIN_MIN_IN_FLIGHT", "2"))
+LOGIN_TARGET_LATENCY_MS = float(os.environ.get("LOGIN_TARGET_LATENCY_MS", "750"))
+# X-Forwarded-For'una güvenilen proxy ağları (varsayılan: yalnızca loopback; boş: hiçbiri)
+LOGIN_TRUSTED_PROXIES = os.environ.get("LOGIN_TRUSTED_PROXIES", "127.0.0.0/8,::1/128")
+
+
+def _parse_networks(value: str) -> List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in value.split(",") if item.strip()]
+
+
+TRUSTED_PROXY_NETWORKS = _parse_networks(LOGIN_TRUSTED_PROXIES)
+
+
+def _is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXY_NETWORKS)
+
+
+def client_ip(request: Request) -> Optional[str]:
+    """İstemci IP'si: güvenilen proxy zincirinin solundaki ilk adres"""
+    peer = request.client.host if request.client else None
+    if peer is None or not _is_trusted_proxy(peer):
+        return peer
+
+    forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+    if not forwarded:
+        return request.headers.get("x-real-ip", peer).strip()
+    # Sağdan sola: istemcinin sahte başlık eklemesine karşı ilk güvenilmeyen adres
+    for address in reversed(forwarded):
+        if not _is_trusted_proxy(address):
+            return address
+    return forwarded[0]
+
+
+class SlidingWindowLimiter:
+    """Anahtar başına kayan pencere sayacı (anahtar sayısı sınırlı)"""
+
+    def __init__(self, limit: int, window_seconds: float, max_keys: int = 100000):
+        self.limit = limit
+        self.window = window_seconds
+        self.max_keys = max_keys
+        self._hits: "OrderedDict[str, Deque[float]]" = OrderedDict()
+
+    def hit(self, key: str, now: float) -> Optional[float]:
+        """İsteği kaydet; limit aşıldıysa kaç saniye sonra denenebileceğini döndür"""
+        hits = self._hits.get(key)
+        if hits is None:
+            hits = deque()
+            self._hits[key] = hits
+            if len(self._hits) > self.max_keys:
+                self._hits.popitem(last=False)
+        else:
+            self._hits.move_to_end(key)
+
+        cutoff = now - self.window
+        while hits and hits[0] <= cutoff:
+            hits.popleft()
+
+        if len(hits) >= self.limit:
+            return max(hits[0] + self.window - now, 0.0)
+
+        hits.append(now)
+        return None
+
+    def forget(self, key: str, stamp: float) -> None:
+        """`hit` ile kaydedilmiş tek bir isteği geri al"""
+        hits = self._hits.get(key)
+        if hits:
+            try:
+                hits.remove(stamp)
+            except ValueError:
+                pass
+
+    def __len__(self) -> int:
+        return len(self._hits)
+
+
+class LoginAdmissionController:
+    """Login istekleri için kabul / ret kararı veren katman"""
+
+    def __init__(
+        self,
+        per_ip: int = LOGIN_RATE_PER_IP,
+        per_ip_window: float = LOGIN_RATE_PER_IP_WINDOW,
+        per_identity: int = LOGIN_RATE_PER_IDENTITY,
+        per_identity_window: float = LOGIN_RATE_PER_IDENTITY_WINDOW,
+        max_in_flight: int = LOGIN_MAX_IN_FLIGHT,
+        min_in_flight: int = LOGIN_MIN_IN_FLIGHT,
+        target_latency_ms: float = LOGIN_TARGET_LATENCY_MS,
+    ):
+        self.ip_limiter = SlidingWindowLimiter(per_ip, per_ip_window)
+        self.identity_limiter = SlidingWindowLimiter(per_identity, per_identity_window)
+        self.max_in_flight = max_in_flight
+        self.min_in_flight = min(min_in_flight, max_in_flight)
+        self.target_latency_ms = target_latency_ms
+        self.in_flight_limit = float(max_in_flight)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.latency_ewma_ms = 0.0
+        self.admitted: Dict[str, int] = {}
+        self.rejected: Dict[str, int] = {"ip": 0, "identity": 0, "overloaded": 0}
+
+    @staticmethod
+    def _reject(reason: str, retry_after: float) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Çok fazla giriş denemesi. Lütfen biraz sonra tekrar deneyin.",
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999))), "X-Login-Reject-Reason": reason},
+        )
+
+    def _record_latency(self, elapsed_ms: float) -> None:
+        # Gecikme hedefi aşılıyorsa sınırı çarpımsal azalt, değilse toplamsal artır (AIMD)
+        self.latency_ewma_ms = elapsed_ms if not self.latency_ewma_ms else 0.8 * self.latency_ewma_ms + 0.2 * elapsed_ms
+        if self.latency_ewma_ms > self.target_latency_ms:
+            self.in_flight_limit = max(float(self.min_in_flight), self.in_flight_limit * 0.9)
+        else:
+            self.in_flight_limit = min(float(self.max_in_flight), self.in_flight_limit + 0.25)
+
+    @asynccontextmanager
+    async def admit(self, route: str, ip: Optional[str], identity: Optional[str]):
+        """Login isteğini kabul et veya 429 ile hemen reddet
+
+        Blok hatasız biterse (başarılı login) kimlik penceresindeki kayıt silinir.
+        """
+        now = time.monotonic()
+        identity_key = None
+
+        if ip:
+            retry_after = self.ip_limiter.hit(ip, now)
+            if retry_after is not None:
+                self.rejected["ip"] += 1
+                raise self._reject("ip", retry_after)
+
+        if identity:
+            identity_key = identity.strip().lower()
+            retry_after = self.identity_limiter.hit(identity_key, now)
+            if retry_after is not None:
+                self.rejected["identity"] += 1
+                raise self._reject("identity", retry_after)
+
+        if self.in_flight >= int(self.in_flight_limit):
+            self.rejected["overloaded"] += 1
+            if identity_key:
+                self.identity_limiter.forget(identity_key, now)
+            raise self._reject("overloaded", 1)
+
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        self.admitted[route] = self.admitted.get(route, 0) + 1
+        started = time.perf_counter()
+        try:
+            yield
+            if identity_key:
+                self.identity_limiter.forget(identity_key, now)
+        finally:
+            self.in_flight -= 1
+            self._record_latency((time.perf_counter() - started) * 1000)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "in_flight_limit": int(self.in_flight_limit),
+            "max_in_flight": self.max_in_flight,
+            "latency_ewma_ms": round(self.latency_ewma_ms, 2),
+            "target_latency_ms": self.target_latency_ms,
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+            "tracked_ips": len(self.ip_limiter),
+            "tracked_identities": len(self.identity_limiter),
+        }
+
+
+login_admission = LoginAdmissionController()
@@ -7,14 +7,19 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timezone
-import smtplib
-import ssl
+import aiosmtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import uuid
 import re
 import os
 
+from routes.batch_loader import RequestLoaders
+from routes.rate_limiter import SendBudgetExceeded, rate_limiter
+from routes.mail_templates import CompiledMailTemplate, compile_template, mail_template_cache
+from routes.settings_registry import settings_registry
+from routes.smtp_pool import smtp_pool
+
 router = APIRouter(prefix="/api/mail", tags=["Mail"])
 
 # ============ MODELS ============
@@ -93,8 +98,7 @@ class MailService:
     
     async def get_config(self) -> Optional[dict]:
         """Mail konfigürasyonunu getir"""
-        config = await self.db.mail_config.find_one({"_id": "main"}, {"_id": 0})
-        return config
+        return await settings_registry.get(self.db, "mail")
     
     async def save_config(self, config: MailConfig) -> dict:
         """Mail konfigürasyonunu kaydet"""
@@ -106,6 +110,7 @@ class MailService:
             {"$set": config_dict},
             upsert=True
         )
+        await settings_registry.invalidate(self.db, "mail")
         return config_dict
     
     async def update_config(self, update_data: MailConfigUpdate) -> dict:
@@ -118,26 +123,46 @@ class MailService:
             {"$set": update_dict},
             upsert=True
         )
+        await settings_registry.invalidate(self.db, "mail")
         
         return await self.get_config()
     
     def replace_variables(self, text: str, variables: Dict[str, Any]) -> str:
         """Şablondaki değişkenleri değerlerle değiştir"""
-        for key, value in variables.items():
-            text = text.replace(f"{{{{{key}}}}}", str(value))
-            text = text.replace(f"{{{{ {key} }}}}", str(value))
-        return text
+        return compile_template(text).render(variables)
     
-    async def send_mail(
+    def build_message(
         self,
+        config: dict,
         to: List[str],
         subject: str,
         body_html: str,
         body_text: Optional[str] = None,
         cc: Optional[List[str]] = None,
         bcc: Optional[List[str]] = None
-    ) -> dict:
-        """Email gönder"""
+    ):
+        """MIME mesajı ve tüm alıcılar (to + cc + bcc)"""
+        message = MIMEMultipart("alternative")
+        message["Subject"] = subject
+        message["From"] = f"{config['sender_name']} <{config['sender_email']}>"
+        message["To"] = ", ".join(to)
+        
+        if cc:
+            message["Cc"] = ", ".join(cc)
+        
+        # Plain text ve HTML ekle
+        if body_text:
+            message.attach(MIMEText(body_text, "plain", "utf-8"))
+        message.attach(MIMEText(body_html, "html", "utf-8"))
+        
+        all_recipients = to.copy()
+        if cc:
+            all_recipients.extend(cc)
+        if bcc:
+            all_recipients.extend(bcc)
+        return message, all_recipients
+    
+    async def _active_config(self) -> dict:
         config = await self.get_config()
         
         if not config or not config.get("is_active"):
@@ -145,43 +170,25 @@ class MailService:
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="Mail servisi aktif değil. Lütfen mail ayarlarını yapılandırın."
             )
+        return config
+    
+    async def send_mail(
+        self,
+        to: List[str],
+        subject: str,
+        body_html: str,
+        body_text: Optional[str] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None
+    ) -> dict:
+        """Email gönder (havuzdaki kalıcı SMTP bağlantısı üzerinden)"""
+        config = await self._active_config()
         
         try:
-            # MIME mesajı oluştur
-            message = MIMEMultipart("alternative")
-            message["Subject"] = subject
-            message["From"] = f"{config['sender_name']} <{config['sender_email']}>"
-            message["To"] = ", ".join(to)
-            
-            if cc:
-                message["Cc"] = ", ".join(cc)
-            
-            # Plain text ve HTML ekle
-            if body_text:
-                part1 = MIMEText(body_text, "plain", "utf-8")
-                message.attach(part1)
-            
-            part2 = MIMEText(body_html, "html", "utf-8")
-            message.attach(part2)
-            
-            # Tüm alıcılar
-            all_recipients = to.copy()
-            if cc:
-                all_recipients.extend(cc)
-            if bcc:
-                all_recipients.extend(bcc)
-            
-            # SMTP bağlantısı
-            context = ssl.create_default_context()
-            
-            with smtplib.SMTP(config["smtp_host"], config["smtp_port"]) as server:
-                server.starttls(context=context)
-                server.login(config["smtp_user"], config["smtp_password"])
-                server.sendmail(
-                    config["sender_email"],
-                    all_recipients,
-                    message.as_string()
-                )
+            message, all_recipients = self.build_message(config, to, subject, body_html, body_text, cc, bcc)
+            # Gmail alıcı başına sayar; hesabın token'ı gelene kadar bekle
+            await rate_limiter.acquire("mail", config["smtp_user"], tokens=len(all_recipients))
+            await smtp_pool.get(config).send(message, config["sender_email"], all_recipients)
             
             # Log kaydı
             await self.db.mail_logs.insert_one({
@@ -191,12 +198,14 @@ class MailService:
                 "bcc": bcc,
                 "subject": subject,
                 "status": "sent",
-                "sent_at": datetime.now(timezone.utc).isoformat()
+                "sent_at": datetime.now(timezone.utc)
             })
             
             return {"success": True, "message": "Email başarıyla gönderildi"}
             
-        except smtplib.SMTPAuthenticationError:
+        except SendBudgetExceeded as e:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+        except aiosmtplib.SMTPAuthenticationError:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Gmail kimlik doğrulama hatası. Lütfen App Password'ü kontrol edin."
@@ -209,15 +218,62 @@ class MailService:
                 "subject": subject,
                 "status": "failed",
                 "error": str(e),
-                "sent_at": datetime.now(timezone.utc).isoformat()
+                "sent_at": datetime.now(timezone.utc)
             })
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Email gönderilemedi: {str(e)}"
             )
     
+    async def send_batch(self, mails: List[Dict[str, Any]]) -> dict:
+        """Birden çok maili tek SMTP oturumunda art arda gönder
+        
+        Her eleman send_mail parametrelerini (to, subject, body_html, ...) taşır.
+        """
+        config = await self._active_config()
+        envelopes = []
+        for mail in mails:
+            message, all_recipients = self.build_message(config, **mail)
+            envelopes.append((message, config["sender_email"], all_recipients))
+        
+        try:
+            results = await smtp_pool.get(config).send_many(
+                envelopes,
+                throttle=lambda recipients: rate_limiter.acquire("mail", config["smtp_user"], tokens=len(recipients))
+            )
+        except aiosmtplib.SMTPAuthenticationError:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Gmail kimlik doğrulama hatası. Lütfen App Password'ü kontrol edin."
+            )
+        
+        now = datetime.now(timezone.utc)
+        logs = [
+            {
+                "id": str(uuid.uuid4()),
+                "to": mail["to"],
+                "subject": mail["subject"],
+                "status": "sent" if error is None else "failed",
+                **({"error": str(error)} if error is not None else {}),
+                "sent_at": now
+            }
+            for mail, error in zip(mails, results)
+        ]
+        if logs:
+            await self.db.mail_logs.insert_many(logs)
+        
+        failed_count = sum(1 for error in results if error is not None)
+        return {"sent_count": len(results) - failed_count, "failed_count": failed_count}
+    
+    _default_templates: Optional[Dict[str, dict]] = None
+    
     def get_default_templates(self) -> Dict[str, dict]:
-        """Varsayılan mail şablonlarını döndür"""
+        """Varsayılan mail şablonlarını döndür (süreç başına bir kez kurulur; paylaşılır, değiştirilmemelidir)"""
+        if MailService._default_templates is None:
+            MailService._default_templates = self._build_default_templates()
+        return MailService._default_templates
+    
+    def _build_default_templates(self) -> Dict[str, dict]:
         return {
             "dues_notification": {
                 "subject": "💰 Aidat Bildirimi - {{building_name}} ({{month}})",
@@ -446,16 +502,8 @@ class MailService:
             }
         }
 
-    async def send_with_template(
-        self,
-        to: List[str],
-        template_name: str,
-        variables: Dict[str, Any],
-        cc: Optional[List[str]] = None,
-        bcc: Optional[List[str]] = None,
-        building_id: Optional[str] = None
-    ) -> dict:
-        """Şablon kullanarak email gönder"""
+    async def _find_template(self, template_name: str, building_id: Optional[str] = None) -> Optional[dict]:
+        """Şablonu bul: bina özel -> genel (veritabanı) -> varsayılan"""
         # Önce bina özel şablonunu kontrol et
         template = None
         if building_id:
@@ -489,16 +537,30 @@ class MailService:
                     "subject": default_templates[template_name]["subject"],
                     "body_html": default_templates[template_name]["body"]
                 }
-        
-        if not template:
+        return template
+    
+    async def get_template(self, template_name: str, building_id: Optional[str] = None) -> CompiledMailTemplate:
+        """Derlenmiş şablon (bina, şablon, sürüm) önbelleğinden"""
+        template = await mail_template_cache.get(self.db, template_name, building_id, self._find_template)
+        if template is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"'{template_name}' şablonu bulunamadı"
             )
-        
-        # Değişkenleri değiştir
-        subject = self.replace_variables(template["subject"], variables)
-        body_html = self.replace_variables(template["body_html"], variables)
+        return template
+    
+    async def send_with_template(
+        self,
+        to: List[str],
+        template_name: str,
+        variables: Dict[str, Any],
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+        building_id: Optional[str] = None
+    ) -> dict:
+        """Şablon kullanarak email gönder"""
+        template = await self.get_template(template_name, building_id)
+        subject, body_html = template.render(variables)
         
         return await self.send_mail(to, subject, body_html, None, cc, bcc)
 
@@ -584,6 +646,7 @@ def get_mail_routes(db):
         template_dict["updated_at"] = datetime.now(timezone.utc).isoformat()
         
         await db.mail_templates.insert_one(template_dict)
+        await mail_template_cache.invalidate(db)
         
         return {k: v for k, v in template_dict.items() if k != "_id"}
     
@@ -600,6 +663,7 @@ def get_mail_routes(db):
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Şablon bulunamadı")
+        await mail_template_cache.invalidate(db)
         
         return await db.mail_templates.find_one({"id": template_id}, {"_id": 0})
     
@@ -609,6 +673,7 @@ def get_mail_routes(db):
         result = await db.mail_templates.delete_one({"id": template_id})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Şablon bulunamadı")
+        await mail_template_cache.invalidate(db)
         return {"message": "Şablon silindi"}
     
     # --- Send Mail Routes ---
@@ -654,34 +719,31 @@ def get_mail_routes(db):
         if not residents:
             return {"success": False, "message": "Gönderilecek sakin bulunamadı", "sent_count": 0}
         
-        sent_count = 0
-        failed_count = 0
+        # Sakinlerin dairelerini tek sorguda önceden yükle
+        loaders = RequestLoaders(db)
+        await loaders.apartments.load_many({r["apartment_id"] for r in residents if r.get("apartment_id")})
         
+        template = await mail_service.get_template(template_name)
+        
+        mails = []
         for resident in residents:
             if resident.get("email"):
-                try:
-                    # Kişiye özel değişkenler ekle
-                    resident_vars = {**variables}
-                    resident_vars["user_name"] = resident.get("full_name", "Sakin")
-                    
-                    # Daire bilgisi ekle
-                    if resident.get("apartment_id"):
-                        apartment = await db.apartments.find_one(
-                            {"id": resident["apartment_id"]},
-                            {"_id": 0, "apartment_number": 1}
-                        )
-                        if apartment:
-                            resident_vars["apartment_no"] = apartment.get("apartment_number", "-")
-                    
-                    await mail_service.send_with_template(
-                        to=[resident["email"]],
-                        template_name=template_name,
-                        variables=resident_vars
-                    )
-                    sent_count += 1
-                except Exception as e:
-                    print(f"Mail error for {resident['email']}: {e}")
-                    failed_count += 1
+                # Kişiye özel değişkenler ekle
+                resident_vars = {**variables}
+                resident_vars["user_name"] = resident.get("full_name", "Sakin")
+                
+                # Daire bilgisi ekle
+                apartment = await loaders.apartments.load(resident.get("apartment_id"))
+                if apartment:
+                    resident_vars["apartment_no"] = apartment.get("apartment_number", "-")
+                
+                subject, body_html = template.render(resident_vars)
+                mails.append({"to": [resident["email"]], "subject": subject, "body_html": body_html})
+        
+        # Tüm mailler havuzdaki tek bir SMTP oturumu üzerinden gönderilir
+        result = await mail_service.send_batch(mails)
+        sent_count = result["sent_count"]
+        failed_count = result["failed_count"]
         
         return {
             "success": True,
@@ -1582,6 +1644,8 @@ def get_mail_routes(db):
             if not existing:
                 await db.mail_templates.insert_one(template)
                 inserted_count += 1
+        if inserted_count:
+            await mail_template_cache.invalidate(db)
         
         return {"message": f"{inserted_count} varsayılan şablon eklendi", "total": len(default_templates)}
     
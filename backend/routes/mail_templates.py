@@ -0,0 +1,124 @@
+"""
+Mail Templates
+Derlenmiş mail şablonları ve (bina, şablon, sürüm) anahtarlı render önbelleği.
+
+`MailService.replace_variables` her değişken için şablonun tamamı üzerinde
+iki `str.replace` geçişi yapıyordu; `send_with_template` ise her alıcı için
+`building_mail_templates` / `mail_templates` sorgularını tekrarlayıp
+varsayılan şablonları yeniden kuruyordu.
+
+- `compile_template` metni bir kez tarar ve sabit metin / değişken adı
+  parçalarından oluşan bir liste üretir (`{{ad}}` ve `{{ ad }}` biçimleri).
+  Render tek bir `"".join` ile yapılır; değeri verilmeyen değişkenler
+  eskisi gibi olduğu yerde kalır.
+- `MailTemplateCache` çözülmüş (bina özel -> genel -> varsayılan) ve
+  derlenmiş şablonu (building_id, name, sürüm) anahtarıyla tutar. Sürümler
+  settings_registry üzerinden `settings_versions` koleksiyonundadır: genel
+  şablon CRUD'u `mail_templates`, bina şablonu güncellemesi
+  `mail_templates:<building_id>` sürümünü artırır; diğer süreçler sürüm
+  yoklamasıyla eski kayıtları kullanmayı bırakır.
+"""
+
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from cachetools import LRUCache
+
+from routes.settings_registry import settings_registry
+
+MAIL_TEMPLATE_CACHE_MAXSIZE = 2048
+TEMPLATE_VERSION_NAME = "mail_templates"
+
+_PLACEHOLDER = re.compile(r"\{\{(?: ([\w.-]+) |([\w.-]+))\}\}")
+
+
+class CompiledTemplate:
+    """Sabit metin parçaları ve aralarındaki değişkenler"""
+
+    __slots__ = ("literals", "names", "placeholders")
+
+    def __init__(self, text: str):
+        self.literals: List[str] = []
+        self.names: List[str] = []
+        self.placeholders: List[str] = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(text):
+            self.literals.append(text[position:match.start()])
+            self.names.append(match.group(1) or match.group(2))
+            self.placeholders.append(match.group(0))
+            position = match.end()
+        self.literals.append(text[position:])
+
+    def render(self, variables: Dict[str, Any]) -> str:
+        if not self.names:
+            return self.literals[0]
+        parts = [self.literals[0]]
+        for name, placeholder, literal in zip(self.names, self.placeholders, self.literals[1:]):
+            parts.append(str(variables[name]) if name in variables else placeholder)
+            parts.append(literal)
+        return "".join(parts)
+
+
+@lru_cache(maxsize=512)
+def compile_template(text: str) -> CompiledTemplate:
+    return CompiledTemplate(text)
+
+
+class CompiledMailTemplate:
+    __slots__ = ("subject", "body_html")
+
+    def __init__(self, subject: str, body_html: str):
+        self.subject = compile_template(subject or "")
+        self.body_html = compile_template(body_html or "")
+
+    def render(self, variables: Dict[str, Any]) -> Tuple[str, str]:
+        return self.subject.render(variables), self.body_html.render(variables)
+
+
+class MailTemplateCache:
+    """(building_id, name, genel sürüm, bina sürümü) -> CompiledMailTemplate"""
+
+    def __init__(self, maxsize: int = MAIL_TEMPLATE_CACHE_MAXSIZE):
+        self._cache: LRUCache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(
+        self,
+        db,
+        name: str,
+        building_id: Optional[str],
+        loader: Callable[[str, Optional[str]], Awaitable[Optional[dict]]]
+    ) -> Optional[CompiledMailTemplate]:
+        """Derlenmiş şablon; yoksa loader (subject, body_html) ile çözülüp derlenir"""
+        version = await settings_registry.version(db, TEMPLATE_VERSION_NAME)
+        building_version = await settings_registry.version(db, TEMPLATE_VERSION_NAME, building_id) if building_id else 0
+        key = (building_id, name, version, building_version)
+        with self._lock:
+            compiled = self._cache.get(key)
+            if compiled is not None:
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        template = await loader(name, building_id)
+        if template is None:
+            return None
+        compiled = CompiledMailTemplate(template["subject"], template["body_html"])
+        with self._lock:
+            self._cache[key] = compiled
+        return compiled
+
+    async def invalidate(self, db, building_id: Optional[str] = None) -> None:
+        """Genel (building_id=None) veya bina şablonları değişti"""
+        await settings_registry.invalidate(db, TEMPLATE_VERSION_NAME, building_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+mail_template_cache = MailTemplateCache()
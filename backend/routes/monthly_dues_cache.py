@@ -0,0 +1,67 @@
+"""
+Monthly Dues Cache
+Bina başına aylık aidat tanımlarının süreç içi önbelleği.
+
+Bir binadaki her sakin `/residents/my-dues` çağrısında aynı aidat
+tanımlarını okur. Tanımlar bina bazında TTL'li olarak önbelleğe alınır ve
+oluşturma / güncelleme / silme / gönderim yazmalarında açıkça geçersiz
+kılınır (diğer worker'lar en geç TTL sonunda güncel tanımları görür).
+Dönen liste paylaşılır; çağıranlar değiştirmemelidir.
+"""
+
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, List
+
+from cachetools import TTLCache
+
+MONTHLY_DUES_CACHE_TTL_SECONDS = int(os.environ.get("MONTHLY_DUES_CACHE_TTL_SECONDS", "60"))
+MONTHLY_DUES_CACHE_MAXSIZE = int(os.environ.get("MONTHLY_DUES_CACHE_MAXSIZE", "5000"))
+
+
+class MonthlyDuesCache:
+    """building_id -> aylık aidat tanımları listesi"""
+
+    def __init__(self, maxsize: int = MONTHLY_DUES_CACHE_MAXSIZE, ttl: int = MONTHLY_DUES_CACHE_TTL_SECONDS):
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, building_id: str, loader: Callable[[str], Awaitable[List[dict]]]) -> List[dict]:
+        """Önbellekteki tanımları döndür; yoksa loader ile yükle"""
+        with self._lock:
+            definitions = self._cache.get(building_id)
+            if definitions is not None:
+                self.hits += 1
+                return definitions
+            self.misses += 1
+            generation = self._generation
+
+        definitions = await loader(building_id)
+        with self._lock:
+            # Yükleme sırasında bir geçersiz kılma olduysa eski sonucu saklama
+            if generation == self._generation:
+                self._cache[building_id] = definitions
+        return definitions
+
+    def invalidate(self, building_id: str) -> None:
+        with self._lock:
+            self._generation += 1
+            if self._cache.pop(building_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "ttl_seconds": self._cache.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+monthly_dues_cache = MonthlyDuesCache()
@@ -6,6 +6,9 @@ import base64
 from typing import List, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from routes.rate_limiter import rate_limiter
+from routes.settings_registry import settings_registry
+
 class NetgsmService:
     """Netgsm SMS gönderme servisi"""
     
@@ -17,7 +20,7 @@ class NetgsmService:
     
     async def get_config(self) -> dict:
         """Netgsm ayarlarını getir"""
-        config = await self.db.netgsm_config.find_one({"id": "default"}, {"_id": 0})
+        config = await settings_registry.get(self.db, "netgsm")
         return config or {}
     
     async def save_config(self, config: dict) -> bool:
@@ -27,6 +30,7 @@ class NetgsmService:
             {"$set": {**config, "id": "default"}},
             upsert=True
         )
+        await settings_registry.invalidate(self.db, "netgsm")
         return True
     
     def _get_auth_header(self, username: str, password: str) -> str:
@@ -92,6 +96,8 @@ class NetgsmService:
         }
         
         try:
+            # İstek başına bir token; günlük bütçeye SMS adedi yazılır
+            await rate_limiter.acquire("netgsm", config["username"], usage=len(messages))
             async with httpx.AsyncClient(timeout=30.0) as client:
                 response = await client.post(self.API_URL, json=payload, headers=headers)
                 
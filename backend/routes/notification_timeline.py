@@ -0,0 +1,171 @@
+"""
+Notification Timeline
+Sakin bildirim akışı için bina bazlı, yazma anında doldurulan zaman çizelgesi.
+
+Mobil uygulama her yenilemede duyurular, bina durumu değişiklikleri ve
+gönderilmiş aylık aidatlar için üç ayrı sorgu çalıştırıp sonuçları Python'da
+birleştiriyordu. Artık bu kaynaklar yazıldıkları anda `notification_timeline`
+koleksiyonuna bir kayıt ekler; akış (building_id, created_at, id) index'i
+üzerinde tek bir aralık taramasıdır. Sayfalama `routes.pagination` cursor'ları
+ile yapılır, `since` ile yalnızca yeni kayıtlar çekilebilir.
+
+Kayıtlar (type, id) ile tekildir; kaynak güncellendiğinde aynı kayıt
+güncellenir. Mevcut veriler için: `python -m routes.notification_timeline`
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from routes.bson_dates import as_datetime
+from routes.pagination import fetch_page
+
+NOTIFICATION_FEED_DEFAULT_LIMIT = 30
+
+TIMELINE_PROJECTION = {"_id": 0, "building_id": 0}
+
+
+def announcement_entry(announcement: dict) -> dict:
+    return {
+        "id": announcement["id"],
+        "building_id": announcement["building_id"],
+        "type": "announcement",
+        "category": announcement.get("category", "general"),
+        "title": announcement.get("title"),
+        "content": announcement.get("content"),
+        "priority": announcement.get("priority", "normal"),
+        "created_at": as_datetime(announcement.get("created_at")),
+        "icon": "megaphone",
+    }
+
+
+def status_change_entry(building_id: str, name: str, label: str, created_at: Optional[datetime] = None, entry_id: Optional[str] = None) -> dict:
+    return {
+        "id": entry_id or str(uuid.uuid4()),
+        "building_id": building_id,
+        "type": "status_change",
+        "category": "building_status",
+        "title": f"Bina Durumu: {name}",
+        "content": f"{name} {label} olarak güncellendi.",
+        "priority": "normal",
+        "created_at": as_datetime(created_at) or datetime.now(timezone.utc),
+        "icon": "business",
+    }
+
+
+def monthly_due_entry(monthly_due: dict) -> dict:
+    return {
+        "id": monthly_due["id"],
+        "building_id": monthly_due["building_id"],
+        "type": "dues",
+        "category": "payment",
+        "title": f"Aidat Bildirimi - {monthly_due.get('month', '')}",
+        "content": f"₺{monthly_due.get('per_apartment_amount', 0):,.2f} tutarında aidat bildirimi.",
+        "priority": "high",
+        "created_at": as_datetime(monthly_due.get("sent_at") or monthly_due.get("created_at")),
+        "icon": "wallet",
+    }
+
+
+class NotificationTimeline:
+    """notification_timeline koleksiyonu üzerinde yazma / okuma servisi"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def append(self, entry: dict) -> None:
+        """Kaydı ekle veya (aynı kaynak için) güncelle"""
+        await self.db.notification_timeline.update_one(
+            {"type": entry["type"], "id": entry["id"]},
+            {"$set": entry},
+            upsert=True
+        )
+
+    async def remove(self, entry_type: str, entry_id: str) -> None:
+        await self.db.notification_timeline.delete_one({"type": entry_type, "id": entry_id})
+
+    async def sync_announcement(self, announcement: dict) -> None:
+        """Aktif duyuruyu akışa yaz, pasif duyuruyu akıştan çıkar"""
+        if announcement.get("is_active", True):
+            await self.append(announcement_entry(announcement))
+        else:
+            await self.remove("announcement", announcement["id"])
+
+    async def read(
+        self,
+        building_id: str,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        since: Optional[datetime] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """Binanın akışını yeniden eskiye, cursor ile sayfalı getir"""
+        query = {"building_id": building_id}
+        if since is not None:
+            query["created_at"] = {"$gt": since}
+        return await fetch_page(
+            self.db.notification_timeline,
+            query,
+            TIMELINE_PROJECTION,
+            limit or NOTIFICATION_FEED_DEFAULT_LIMIT,
+            cursor
+        )
+
+    async def delete_building(self, building_id: str) -> None:
+        await self.db.notification_timeline.delete_many({"building_id": building_id})
+
+    async def backfill(self, batch_size: int = 500) -> int:
+        """Mevcut duyuru, durum logu ve gönderilmiş aidatlardan akışı doldur (idempotent)"""
+        sources = [
+            (self.db.announcements, {"is_active": True}, announcement_entry),
+            (self.db.monthly_dues, {"is_sent": True}, monthly_due_entry),
+            (
+                self.db.notification_logs,
+                {},
+                lambda log: status_change_entry(
+                    log["building_id"],
+                    log.get("status_item", "Durum"),
+                    log.get("new_status", ""),
+                    created_at=log.get("sent_at"),
+                    entry_id=log.get("id") or str(log["_id"])
+                )
+            ),
+        ]
+
+        written = 0
+        for collection, query, to_entry in sources:
+            operations = []
+            async for doc in collection.find({**query, "building_id": {"$ne": None}}):
+                entry = to_entry(doc)
+                operations.append(UpdateOne({"type": entry["type"], "id": entry["id"]}, {"$set": entry}, upsert=True))
+                if len(operations) >= batch_size:
+                    await self.db.notification_timeline.bulk_write(operations, ordered=False)
+                    written += len(operations)
+                    operations = []
+            if operations:
+                await self.db.notification_timeline.bulk_write(operations, ordered=False)
+                written += len(operations)
+        return written
+
+
+async def _main() -> None:
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from routes.bson_dates import DATE_CODEC_OPTIONS
+
+    load_dotenv(Path(__file__).resolve().parent.parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client.get_database(os.environ["DB_NAME"], codec_options=DATE_CODEC_OPTIONS)
+    try:
+        written = await NotificationTimeline(db).backfill()
+    finally:
+        client.close()
+    print(f"{written} bildirim akış kaydı yazıldı")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,324 @@
+"""
+Outbox
+Mail ve push bildirimleri için Mongo tabanlı kalıcı gönderim kuyruğu.
+
+Bildirimler handler içinde sırayla gönderiliyordu: `update_building_status`
+SMTP ve Firebase çağrılarını, `send_monthly_due_mail` her sakine tek tek
+maili yanıt dönmeden önce yapıyordu; yavaş bir sağlayıcı isteği dakikalarca
+bekletiyordu. Handler'lar artık yalnızca `outbox` koleksiyonuna iş yazar,
+gönderimi ayrı süreçteki worker havuzu (`python outbox_worker.py`) yapar.
+
+- Kuyruk şeritleri: `priority` (urgent=0, normal=5, bulk=9). Worker her
+  zaman en düşük priority'deki, en eski `available_at` işi alır; bina durum
+  uyarıları toplu aidat maillerinin önüne geçer.
+- Lease: iş `find_one_and_update` ile tek atomik adımda sahiplenilir,
+  `available_at` lease bitişine ileri alınır. Worker ölürse lease dolunca iş
+  başka bir worker tarafından yeniden alınır (ayrı bir "running" durumu yok).
+  Gönderim sürerken (ör. rate limiter beklemesi) lease her
+  OUTBOX_LEASE_SECONDS / 3 saniyede bir uzatılır; lease kaybedilirse gönderim
+  iptal edilir, iş iki kez gönderilmez.
+- Çok alıcılı mailler OUTBOX_MAIL_CHUNK_SIZE alıcılık ayrı işlere bölünür
+  (`mail_jobs`); tek bir iş saatlerce token beklemez.
+- Retry: hata sonrası `available_at` üstel backoff ile ertelenir;
+  OUTBOX_MAX_ATTEMPTS denemeden sonra iş `dead` durumuna düşer ve
+  `/api/system/outbox/dead` üzerinden incelenip yeniden kuyruğa alınabilir.
+
+Her iş `kind` alanına göre kayıtlı bir gönderim fonksiyonuna yönlenir
+(`mail`, `template_mail`, `firebase_topic`).
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from routes.rate_limiter import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_LANES = {"urgent": 0, "normal": 5, "bulk": 9}
+OUTBOX_WORKERS = int(os.environ.get("OUTBOX_WORKERS", "4"))
+OUTBOX_INLINE_WORKERS = int(os.environ.get("OUTBOX_INLINE_WORKERS", "0"))
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", "120"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_BASE_SECONDS = int(os.environ.get("OUTBOX_BACKOFF_BASE_SECONDS", "30"))
+OUTBOX_BACKOFF_MAX_SECONDS = int(os.environ.get("OUTBOX_BACKOFF_MAX_SECONDS", "3600"))
+OUTBOX_POLL_SECONDS = float(os.environ.get("OUTBOX_POLL_SECONDS", "1.0"))
+OUTBOX_MAIL_CHUNK_SIZE = int(os.environ.get("OUTBOX_MAIL_CHUNK_SIZE", "20"))
+
+PENDING = "pending"
+SENT = "sent"
+DEAD = "dead"
+
+Handler = Callable[[dict], Awaitable[Any]]
+
+
+def backoff_seconds(attempts: int) -> int:
+    """1. hatadan sonra taban süre, her denemede iki katı (üst sınırlı)"""
+    return min(OUTBOX_BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0), OUTBOX_BACKOFF_MAX_SECONDS)
+
+
+class Outbox:
+    """outbox koleksiyonu: kuyruğa yazma, lease ile sahiplenme, retry / dead-letter"""
+
+    def __init__(self, db):
+        self.db = db
+        self.handlers: Dict[str, Handler] = {
+            "mail": self._send_mail,
+            "template_mail": self._send_template_mail,
+            "firebase_topic": self._send_firebase_topic,
+        }
+        self._processed = 0
+        self._failed = 0
+        self._dead = 0
+
+    # ---- Kuyruğa yazma ----
+
+    def job(self, kind: str, payload: dict, lane: str = "normal", building_id: Optional[str] = None) -> dict:
+        if kind not in self.handlers:
+            raise ValueError(f"Bilinmeyen outbox iş türü: {kind}")
+        now = datetime.now(timezone.utc)
+        return {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "lane": lane,
+            "priority": OUTBOX_LANES[lane],
+            "building_id": building_id,
+            "payload": payload,
+            "status": PENDING,
+            "attempts": 0,
+            "available_at": now,
+            "lease_owner": None,
+            "last_error": None,
+            "created_at": now,
+        }
+
+    def mail_jobs(self, recipients: List[str], payload: dict, lane: str = "normal",
+                  building_id: Optional[str] = None) -> List[dict]:
+        """Alıcı listesini OUTBOX_MAIL_CHUNK_SIZE'lık `mail` işlerine böl"""
+        return [
+            self.job("mail", {**payload, "to": recipients[i:i + OUTBOX_MAIL_CHUNK_SIZE]}, lane, building_id)
+            for i in range(0, len(recipients), OUTBOX_MAIL_CHUNK_SIZE)
+        ]
+
+    async def enqueue(self, kind: str, payload: dict, lane: str = "normal", building_id: Optional[str] = None) -> str:
+        job = self.job(kind, payload, lane, building_id)
+        await self.db.outbox.insert_one(job)
+        return job["id"]
+
+    async def enqueue_many(self, jobs: List[dict]) -> int:
+        if not jobs:
+            return 0
+        await self.db.outbox.insert_many(jobs, ordered=False)
+        return len(jobs)
+
+    # ---- Worker tarafı ----
+
+    async def claim(self, worker_id: str) -> Optional[dict]:
+        """Sıradaki işi lease ile sahiplen (priority, available_at sırası)"""
+        now = datetime.now(timezone.utc)
+        return await self.db.outbox.find_one_and_update(
+            {"status": PENDING, "available_at": {"$lte": now}},
+            {
+                "$set": {
+                    "available_at": now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+                    "lease_owner": worker_id,
+                    "leased_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", 1), ("available_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def complete(self, job: dict, worker_id: str) -> None:
+        await self.db.outbox.update_one(
+            {"id": job["id"], "lease_owner": worker_id},
+            {"$set": {"status": SENT, "lease_owner": None, "sent_at": datetime.now(timezone.utc)}}
+        )
+
+    async def extend_lease(self, job: dict, worker_id: str) -> bool:
+        """Lease'i uzat; iş artık bu worker'da değilse False"""
+        result = await self.db.outbox.update_one(
+            {"id": job["id"], "status": PENDING, "lease_owner": worker_id},
+            {"$set": {"available_at": datetime.now(timezone.utc) + timedelta(seconds=OUTBOX_LEASE_SECONDS)}}
+        )
+        return result.matched_count == 1
+
+    async def _keep_lease(self, job: dict, worker_id: str, send: asyncio.Future) -> bool:
+        """Gönderim bitene kadar lease'i yenile; lease kaybedilirse gönderimi iptal et"""
+        while True:
+            await asyncio.sleep(OUTBOX_LEASE_SECONDS / 3)
+            try:
+                if await self.extend_lease(job, worker_id):
+                    continue
+            except Exception as e:
+                # Geçici DB hatası: lease henüz dolmadı, bir sonraki turda yeniden dene
+                logger.warning(f"Outbox lease uzatılamadı ({job['id']}): {e}")
+                continue
+            logger.warning(f"Outbox lease kaybedildi, gönderim iptal ({job['kind']} {job['id']})")
+            send.cancel()
+            return False
+
+    async def fail(self, job: dict, worker_id: str, error: str) -> None:
+        now = datetime.now(timezone.utc)
+        update: Dict[str, Any] = {"lease_owner": None, "last_error": error[:1000], "failed_at": now}
+        if job["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+            update["status"] = DEAD
+            self._dead += 1
+        else:
+            update["available_at"] = now + timedelta(seconds=backoff_seconds(job["attempts"]))
+        await self.db.outbox.update_one({"id": job["id"], "lease_owner": worker_id}, {"$set": update})
+
+    async def process_one(self, worker_id: str) -> bool:
+        """Bir iş al ve gönder; kuyrukta hazır iş yoksa False"""
+        job = await self.claim(worker_id)
+        if job is None:
+            return False
+
+        handler = self.handlers.get(job["kind"])
+        keeper = None
+        try:
+            if handler is None:
+                raise ValueError(f"Bilinmeyen outbox iş türü: {job['kind']}")
+            send = asyncio.ensure_future(handler(job["payload"]))
+            keeper = asyncio.create_task(self._keep_lease(job, worker_id, send))
+            try:
+                await send
+            except asyncio.CancelledError:
+                if keeper.done() and not keeper.cancelled() and keeper.result() is False:
+                    # İş başka bir worker'a geçti; complete / fail onun işi
+                    return True
+                raise
+        except Exception as e:
+            self._failed += 1
+            error = getattr(e, "detail", None) or str(e) or type(e).__name__
+            logger.warning(f"Outbox işi başarısız ({job['kind']} {job['id']}, deneme {job['attempts']}): {error}")
+            await self.fail(job, worker_id, str(error))
+        else:
+            self._processed += 1
+            await self.complete(job, worker_id)
+        finally:
+            if keeper is not None:
+                keeper.cancel()
+        return True
+
+    async def run_worker(self, worker_id: str, stop: Optional[asyncio.Event] = None) -> None:
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            try:
+                if await self.process_one(worker_id):
+                    continue
+            except Exception as e:
+                logger.error(f"Outbox worker hatası ({worker_id}): {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_pool(self, workers: int = OUTBOX_WORKERS, stop: Optional[asyncio.Event] = None, prefix: Optional[str] = None) -> None:
+        """`workers` adet eşzamanlı worker döngüsü çalıştır"""
+        prefix = prefix or f"{os.uname().nodename}:{os.getpid()}"
+        await asyncio.gather(*(self.run_worker(f"{prefix}:{i}", stop) for i in range(workers)))
+
+    # ---- Yönetim ----
+
+    async def queue_stats(self) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc)
+        pipeline = [
+            {"$match": {"status": {"$in": [PENDING, DEAD]}}},
+            {"$group": {
+                "_id": {"status": "$status", "lane": "$lane"},
+                "count": {"$sum": 1},
+                "oldest": {"$min": "$created_at"},
+            }},
+        ]
+        lanes: Dict[str, Dict[str, Any]] = {}
+        async for row in self.db.outbox.aggregate(pipeline):
+            lane = lanes.setdefault(row["_id"]["lane"], {PENDING: 0, DEAD: 0, "oldest_pending_seconds": None})
+            lane[row["_id"]["status"]] = row["count"]
+            if row["_id"]["status"] == PENDING and row["oldest"]:
+                lane["oldest_pending_seconds"] = int((now - row["oldest"]).total_seconds())
+        return {"lanes": lanes, **self.stats()}
+
+    def stats(self) -> Dict[str, int]:
+        """Bu süreçteki worker sayaçları"""
+        return {"processed": self._processed, "failed_attempts": self._failed, "dead_lettered": self._dead}
+
+    async def dead_letters(self, limit: int = 50) -> List[dict]:
+        return await self.db.outbox.find(
+            {"status": DEAD}, {"_id": 0}
+        ).sort("failed_at", -1).limit(limit).to_list(limit)
+
+    async def retry(self, job_id: str) -> bool:
+        """Dead-letter işini deneme sayısını sıfırlayarak yeniden kuyruğa al"""
+        result = await self.db.outbox.update_one(
+            {"id": job_id, "status": DEAD},
+            {"$set": {"status": PENDING, "attempts": 0, "available_at": datetime.now(timezone.utc)}}
+        )
+        return result.modified_count == 1
+
+    # ---- Gönderim fonksiyonları ----
+
+    async def _send_mail(self, payload: dict) -> None:
+        from routes.mail_service import MailService
+        await MailService(self.db).send_mail(
+            to=payload["to"],
+            subject=payload["subject"],
+            body_html=payload["body_html"],
+            body_text=payload.get("body_text")
+        )
+
+    async def _send_template_mail(self, payload: dict) -> None:
+        from routes.mail_service import MailService
+        await MailService(self.db).send_with_template(
+            to=payload["to"],
+            template_name=payload["template_name"],
+            variables=payload.get("variables", {}),
+            building_id=payload.get("building_id")
+        )
+
+    async def _send_firebase_topic(self, payload: dict) -> None:
+        from routes.firebase_push import FIREBASE_INITIALIZED
+        if not FIREBASE_INITIALIZED:
+            raise RuntimeError("Firebase başlatılamadı")
+        from firebase_admin import messaging
+
+        android_config = None
+        apns_config = None
+        alert = payload.get("alert")
+        if alert:
+            android_config = messaging.AndroidConfig(
+                priority="high",
+                notification=messaging.AndroidNotification(
+                    icon="notification_icon",
+                    color=alert.get("color", "#EF4444"),
+                    sound="default",
+                    channel_id=alert.get("channel_id", "building_status")
+                )
+            )
+            apns_config = messaging.APNSConfig(
+                payload=messaging.APNSPayload(
+                    aps=messaging.Aps(
+                        alert=messaging.ApsAlert(title=alert["title"], body=alert["body"]),
+                        sound="default",
+                        badge=1
+                    )
+                )
+            )
+
+        message = messaging.Message(
+            notification=messaging.Notification(title=payload["title"], body=payload["body"]),
+            data={k: str(v) for k, v in (payload.get("data") or {}).items()},
+            topic=payload["topic"],
+            android=android_config,
+            apns=apns_config
+        )
+        await rate_limiter.acquire("firebase", None)
+        # firebase_admin senkron HTTP çağrısı yapar; event loop'u bloklamasın
+        await asyncio.to_thread(messaging.send, message)
@@ -0,0 +1,104 @@
+"""
+Keyset (cursor) Pagination
+Liste endpoint'leri için (created_at, id) üzerinde opak cursor'lı sayfalama.
+
+`limit` ve `cursor` verilmediğinde endpoint'ler eski davranışla (düz JSON
+dizisi) yanıt verir; admin panel bu uyumluluk modunu kullanır. `limit` veya
+`cursor` verildiğinde yanıt `{"items": [...], "next_cursor": "..."}` olur.
+Sorgular, her koleksiyondaki (building_id, created_at, id) / (created_at, id)
+bileşik index'leri ile desteklenir.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Generic, List, Optional, Tuple, TypeVar
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+
+KEYSET_SORT = [("created_at", -1), ("id", -1)]
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+
+def encode_cursor(doc: dict) -> str:
+    """Son dokümanın (created_at, id) değerlerinden opak cursor üret"""
+    created_at = doc.get("created_at")
+    payload = {"i": doc.get("id")}
+    if isinstance(created_at, datetime):
+        payload.update({"c": created_at.isoformat(), "t": "d"})
+    else:
+        payload["c"] = created_at
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    """Cursor'ı (created_at, id) ikilisine çöz"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = payload["c"]
+        if payload.get("t") == "d":
+            created_at = datetime.fromisoformat(created_at)
+        return created_at, payload["i"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Geçersiz cursor")
+
+
+def keyset_query(query: dict, cursor: Optional[str]) -> dict:
+    """Temel sorguya cursor'dan sonraki kayıtların koşulunu ekle"""
+    if not cursor:
+        return query
+    created_at, doc_id = decode_cursor(cursor)
+    branches = [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": doc_id}}
+    ]
+    if isinstance(created_at, datetime):
+        # Azalan sıralamada BSON date'ler string'lerden önce gelir; henüz
+        # migrate edilmemiş string kayıtlar date sayfalarından sonra döner
+        branches.append({"created_at": {"$type": "string"}})
+    after = {"$or": branches}
+    return {"$and": [query, after]} if query else after
+
+
+async def fetch_page(
+    collection,
+    query: dict,
+    projection: dict,
+    limit: Optional[int],
+    cursor: Optional[str]
+) -> Tuple[List[dict], Optional[str]]:
+    """Bir sayfa doküman ve sonraki sayfanın cursor'ını getir.
+
+    limit ve cursor yoksa (uyumluluk modu) tüm eşleşen dokümanları döndürür.
+    """
+    if limit is None and cursor is None:
+        docs = await collection.find(query, projection).sort(KEYSET_SORT).to_list(None)
+        return docs, None
+
+    limit = min(limit or DEFAULT_PAGE_LIMIT, MAX_PAGE_LIMIT)
+    docs = await collection.find(keyset_query(query, cursor), projection).sort(KEYSET_SORT).to_list(limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1])
+    return docs, next_cursor
+
+
+def page_response(items: List[Any], next_cursor: Optional[str], limit: Optional[int], cursor: Optional[str]):
+    """Uyumluluk modunda düz liste, sayfalı modda {items, next_cursor} döndür"""
+    if limit is None and cursor is None:
+        return items
+    return {"items": items, "next_cursor": next_cursor}
@@ -8,6 +8,8 @@ from typing import Optional
 from datetime import datetime, timezone
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from routes.settings_registry import settings_registry
+
 class ParatikaService:
     """Paratika ödeme sistemi servisi"""
     
@@ -21,7 +23,7 @@ class ParatikaService:
     
     async def get_config(self) -> dict:
         """Paratika ayarlarını getir"""
-        config = await self.db.paratika_config.find_one({"id": "default"}, {"_id": 0})
+        config = await settings_registry.get(self.db, "paratika")
         return config or {}
     
     async def save_config(self, config: dict) -> bool:
@@ -31,6 +33,7 @@ class ParatikaService:
             {"$set": {**config, "id": "default"}},
             upsert=True
         )
+        await settings_registry.invalidate(self.db, "paratika")
         return True
     
     def _get_api_url(self, is_live: bool = False) -> str:
@@ -0,0 +1,97 @@
+"""
+Password Hashing Service
+bcrypt hash / verify işlemlerini event loop dışında, sınırlı bir worker
+havuzunda çalıştırır.
+
+bcrypt her çağrıda ~100-300 ms CPU harcar; async handler içinde senkron
+çağrıldığında tüm uvicorn döngüsünü bloklar. Bu servis işleri bir
+ThreadPoolExecutor'a gönderir (bcrypt GIL'i serbest bırakır), kuyruk
+derinliğini sınırlar ve süre metriklerini tutar.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from fastapi import HTTPException, status
+
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+
+class PasswordHasher:
+    """passlib CryptContext'i saran async hash servisi"""
+
+    def __init__(self, pwd_context, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.pwd_context = pwd_context
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+        self._metrics: Dict[str, Dict[str, float]] = {
+            "hash": {"count": 0, "total_ms": 0.0, "max_ms": 0.0},
+            "verify": {"count": 0, "total_ms": 0.0, "max_ms": 0.0},
+        }
+        self.rejected = 0
+        self.peak_pending = 0
+
+    async def _run(self, operation: str, func: Callable, *args) -> Any:
+        if self._pending >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Sunucu yoğun, lütfen biraz sonra tekrar deneyin",
+                headers={"Retry-After": "1"},
+            )
+
+        self._pending += 1
+        self.peak_pending = max(self.peak_pending, self._pending)
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            metric = self._metrics[operation]
+            metric["count"] += 1
+            metric["total_ms"] += elapsed_ms
+            metric["max_ms"] = max(metric["max_ms"], elapsed_ms)
+
+    async def hash(self, password: str) -> str:
+        """Şifreyi hashle"""
+        return await self._run("hash", self.pwd_context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Şifreyi hash ile doğrula"""
+        return await self._run("verify", self.pwd_context.verify, plain_password, hashed_password)
+
+    async def hash_many(self, passwords: List[str]) -> List[str]:
+        """Birden çok şifreyi, kuyruk sınırını aşmadan havuz boyutunda gruplar halinde hashle"""
+        hashed: List[str] = []
+        window = max(1, min(self.workers, self.max_queue))
+        for start in range(0, len(passwords), window):
+            chunk = passwords[start:start + window]
+            hashed.extend(await asyncio.gather(*(self.hash(p) for p in chunk)))
+        return hashed
+
+    def stats(self) -> Dict[str, Any]:
+        """Kuyruk ve süre metrikleri"""
+        operations = {}
+        for name, metric in self._metrics.items():
+            count = metric["count"]
+            operations[name] = {
+                "count": int(count),
+                "avg_ms": round(metric["total_ms"] / count, 2) if count else 0.0,
+                "max_ms": round(metric["max_ms"], 2),
+            }
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "peak_pending": self.peak_pending,
+            "rejected": self.rejected,
+            "operations": operations,
+        }
@@ -0,0 +1,88 @@
+"""
+Principal Cache
+Doğrulanmış kullanıcı / sakin nesnelerinin süreç içi (in-process) önbelleği.
+
+get_current_user ve get_current_resident her istekte JWT çözümledikten sonra
+Mongo'dan belgeyi okuyup Pydantic modeli oluşturuyordu. Bu modül, subject id
+bazında sınırlı boyutlu ve TTL'li bir önbellek sağlar; kayıtlar yazma
+işlemlerinden açıkça geçersiz kılınır. Diğer worker'lardaki yazmalar
+(pasife alma, şifre değişikliği...) token sürüm tablosunun artımlı
+yenilemesiyle (bkz. token_versions.py) birkaç saniye içinde düşer.
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.environ.get("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAXSIZE = int(os.environ.get("PRINCIPAL_CACHE_MAXSIZE", "10000"))
+
+
+class PrincipalCache:
+    """Subject id -> doğrulanmış principal (User / Resident) önbelleği"""
+
+    def __init__(self, maxsize: int = PRINCIPAL_CACHE_MAXSIZE, ttl: int = PRINCIPAL_CACHE_TTL_SECONDS):
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(kind: str, subject_id: str) -> Tuple[str, str]:
+        return (kind, subject_id)
+
+    def get(self, kind: str, subject_id: str) -> Optional[Any]:
+        """Önbellekteki principal'ı döndür (yoksa None)"""
+        with self._lock:
+            principal = self._cache.get(self._key(kind, subject_id))
+            if principal is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return principal
+
+    def set(self, kind: str, subject_id: str, principal: Any) -> None:
+        """Principal'ı önbelleğe yaz"""
+        with self._lock:
+            self._cache[self._key(kind, subject_id)] = principal
+
+    def invalidate(self, kind: str, subject_id: str) -> None:
+        """Tek bir principal'ı önbellekten çıkar"""
+        with self._lock:
+            if self._cache.pop(self._key(kind, subject_id), None) is not None:
+                self.invalidations += 1
+
+    def invalidate_building(self, building_id: str) -> None:
+        """Bir binaya bağlı tüm principal'ları önbellekten çıkar"""
+        with self._lock:
+            stale = [
+                key for key, principal in self._cache.items()
+                if getattr(principal, "building_id", None) == building_id
+            ]
+            for key in stale:
+                self._cache.pop(key, None)
+            self.invalidations += len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss sayaçları ve doluluk bilgisi"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "ttl_seconds": self._cache.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+principal_cache = PrincipalCache()
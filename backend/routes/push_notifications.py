@@ -4,6 +4,8 @@ from typing import List, Optional
 import httpx
 import os
 
+from routes.rate_limiter import rate_limiter
+
 router = APIRouter(prefix="/api/push-notifications", tags=["push-notifications"])
 
 # Expo Push Notification URL
@@ -95,6 +97,7 @@ async def send_announcement_notification(
             return {"success": True, "message": "No valid push tokens found", "sent_count": 0}
         
         # Send to Expo
+        await rate_limiter.acquire("expo", None, tokens=len(messages))
         async with httpx.AsyncClient() as client:
             response = await client.post(
                 EXPO_PUSH_URL,
@@ -137,6 +140,7 @@ async def send_bulk_notification(request: BulkNotificationRequest):
         if not messages:
             return {"success": True, "message": "No valid push tokens", "sent_count": 0}
         
+        await rate_limiter.acquire("expo", None, tokens=len(messages))
         async with httpx.AsyncClient() as client:
             response = await client.post(
                 EXPO_PUSH_URL,
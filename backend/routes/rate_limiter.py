@@ -0,0 +1,177 @@
+"""
+Rate Limiter
+Sağlayıcı ve gönderici hesap başına, worker'lar arasında paylaşılan token
+bucket ve gönderim bütçesi.
+
+Gmail SMTP, Netgsm, Expo ve FCM gönderim hızını sınırlıyor; büyük bir bina
+gönderimi ya sağlayıcı tarafında throttling'e takılıyor ya da yarıda
+kalıyordu. Her (sağlayıcı, hesap) için `rate_limits` koleksiyonunda tek bir
+bucket dokümanı vardır. `acquire` bucket'ı tek bir atomik pipeline update ile
+günceller: geçen süre kadar token ekler (`rate`/sn, en fazla `capacity`),
+yeterli token varsa düşer ve günlük / aylık kullanım sayaçlarını artırır.
+Token yoksa çağıran eksik token dolana kadar bekler (hata dönmez).
+
+- Kapasiteden büyük bir istek (ör. 300 alıcılı tek mail) kapasite dolunca
+  geçer ve bucket'ı eksiye düşürür; sonraki gönderimler borç ödenene kadar
+  bekler, böylece ortalama hız korunur.
+- RATE_LIMIT_<SAĞLAYICI>_DAILY > 0 ise günlük bütçe de uygulanır (Gmail:
+  500, Workspace: 2000 alıcı/gün); bütçe bitince `SendBudgetExceeded`.
+- Kullanım `/api/system/rate-limits` altında görülebilir (ay sonu aidat
+  gönderimlerini planlamak için).
+
+Servisler modül seviyesindeki `rate_limiter`'ı kullanır; veritabanı
+startup'ta `set_db` ile bağlanır.
+"""
+
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+
+def _limits(provider: str, per_second: str, burst: str) -> Dict[str, float]:
+    prefix = f"RATE_LIMIT_{provider.upper()}"
+    return {
+        "rate": float(os.environ.get(f"{prefix}_PER_SECOND", per_second)),
+        "capacity": float(os.environ.get(f"{prefix}_BURST", burst)),
+        "daily_limit": int(os.environ.get(f"{prefix}_DAILY", "0")),
+    }
+
+
+# mail: alıcı, netgsm: API isteği (kullanım SMS adedi), expo: mesaj, firebase: topic gönderimi
+PROVIDER_LIMITS: Dict[str, Dict[str, float]] = {
+    "mail": _limits("mail", "2", "20"),
+    "netgsm": _limits("netgsm", "5", "10"),
+    "expo": _limits("expo", "500", "600"),
+    "firebase": _limits("firebase", "20", "50"),
+}
+
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.environ.get("RATE_LIMIT_MAX_WAIT_SECONDS", "600"))
+MIN_SLEEP_SECONDS = 0.05
+
+
+class SendBudgetExceeded(Exception):
+    """Günlük gönderim bütçesi bitti veya token beklemesi üst sınırı aştı"""
+
+
+class RateLimiter:
+    """Mongo paylaşımlı token bucket: (sağlayıcı, hesap) -> bucket"""
+
+    def __init__(self, db=None):
+        self.db = db
+        self.acquired = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def set_db(self, database) -> None:
+        self.db = database
+
+    def _pipeline(self, provider: str, account: str, tokens: float, usage: int, now: datetime) -> List[dict]:
+        limits = PROVIDER_LIMITS[provider]
+        capacity, rate, daily_limit = limits["capacity"], limits["rate"], limits["daily_limit"]
+        today, month = now.strftime("%Y-%m-%d"), now.strftime("%Y-%m")
+
+        within_budget: Any = True
+        if daily_limit > 0:
+            within_budget = {"$lte": [{"$add": ["$_day_used", usage]}, daily_limit]}
+
+        return [
+            {"$set": {
+                "_elapsed": {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]},
+                "_day_used": {"$cond": [{"$eq": ["$day", today]}, "$day_used", 0]},
+                "_month_used": {"$cond": [{"$eq": ["$month", month]}, "$month_used", 0]},
+            }},
+            {"$set": {"_tokens": {"$min": [
+                capacity,
+                {"$add": [{"$ifNull": ["$tokens", capacity]}, {"$multiply": [{"$max": ["$_elapsed", 0]}, rate]}]}
+            ]}}},
+            # Kapasiteden büyük istekler bucket dolunca geçer (borç)
+            {"$set": {"granted": {"$and": [{"$gte": ["$_tokens", min(tokens, capacity)]}, within_budget]}}},
+            {"$set": {
+                "tokens": {"$cond": ["$granted", {"$subtract": ["$_tokens", tokens]}, "$_tokens"]},
+                "day_used": {"$add": ["$_day_used", {"$cond": ["$granted", usage, 0]}]},
+                "month_used": {"$add": ["$_month_used", {"$cond": ["$granted", usage, 0]}]},
+                "day": today,
+                "month": month,
+                "updated_at": now,
+                "provider": {"$literal": provider},
+                "account": {"$literal": account},
+                "capacity": capacity,
+                "rate": rate,
+                "daily_limit": daily_limit,
+            }},
+            {"$project": {"_elapsed": 0, "_day_used": 0, "_month_used": 0, "_tokens": 0}},
+        ]
+
+    async def acquire(self, provider: str, account: Optional[str], tokens: float = 1, usage: Optional[int] = None) -> None:
+        """Token gelene kadar bekle; usage (varsayılan: tokens) bütçeye yazılır"""
+        if self.db is None:
+            return
+        account = account or "default"
+        usage = int(tokens) if usage is None else usage
+        rate = PROVIDER_LIMITS[provider]["rate"]
+        waited = 0.0
+
+        while True:
+            now = datetime.now(timezone.utc)
+            bucket = await self.db.rate_limits.find_one_and_update(
+                {"id": f"{provider}:{account}"},
+                self._pipeline(provider, account, tokens, usage, now),
+                projection={"_id": 0},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            if bucket["granted"]:
+                self.acquired += 1
+                if waited:
+                    self.wait_seconds += waited
+                return
+
+            daily_limit = bucket.get("daily_limit", 0)
+            if daily_limit and bucket["day_used"] + usage > daily_limit:
+                raise SendBudgetExceeded(
+                    f"{provider} ({account}) günlük gönderim bütçesi doldu: {bucket['day_used']}/{daily_limit}"
+                )
+
+            needed = min(tokens, bucket["capacity"]) - bucket["tokens"]
+            delay = max(needed / rate, MIN_SLEEP_SECONDS)
+            if waited + delay > RATE_LIMIT_MAX_WAIT_SECONDS:
+                raise SendBudgetExceeded(f"{provider} ({account}) için token beklemesi {RATE_LIMIT_MAX_WAIT_SECONDS:.0f} sn'yi aştı")
+            if not waited:
+                self.waits += 1
+            waited += delay
+            await asyncio.sleep(delay)
+
+    async def budget(self) -> List[Dict[str, Any]]:
+        """Bucket başına anlık token, günlük / aylık kullanım ve kalan günlük bütçe"""
+        if self.db is None:
+            return []
+        now = datetime.now(timezone.utc)
+        today, month = now.strftime("%Y-%m-%d"), now.strftime("%Y-%m")
+        rows = []
+        async for bucket in self.db.rate_limits.find({}, {"_id": 0}).sort("id", 1):
+            limits = PROVIDER_LIMITS.get(bucket.get("provider"), {})
+            elapsed = max((now - bucket["updated_at"]).total_seconds(), 0)
+            day_used = bucket.get("day_used", 0) if bucket.get("day") == today else 0
+            daily_limit = limits.get("daily_limit", bucket.get("daily_limit", 0))
+            rows.append({
+                "provider": bucket.get("provider"),
+                "account": bucket.get("account"),
+                "rate_per_second": limits.get("rate", bucket.get("rate")),
+                "capacity": limits.get("capacity", bucket.get("capacity")),
+                "tokens": round(min(bucket["capacity"], bucket["tokens"] + elapsed * bucket["rate"]), 2),
+                "day_used": day_used,
+                "daily_limit": daily_limit or None,
+                "day_remaining": max(daily_limit - day_used, 0) if daily_limit else None,
+                "month_used": bucket.get("month_used", 0) if bucket.get("month") == month else 0,
+            })
+        return rows
+
+    def stats(self) -> Dict[str, Any]:
+        """Bu süreçteki bekleme sayaçları"""
+        return {"acquired": self.acquired, "waits": self.waits, "wait_seconds": round(self.wait_seconds, 2)}
+
+
+rate_limiter = RateLimiter()
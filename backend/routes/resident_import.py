@@ -0,0 +1,370 @@
+"""
+Resident Import
+CSV / XLSX sakin listesinin satır satır okunup parça parça içe aktarılması.
+
+Yüklenen dosya belleğe alınmaz: CSV `csv.DictReader`, XLSX ise openpyxl'in
+`read_only` modu ile satır satır okunur ve satırlar
+RESIDENT_IMPORT_CHUNK_SIZE büyüklüğünde parçalar halinde işlenir. Her parça
+için:
+
+- telefon 5XXXXXXXXX biçimine, e-posta küçük harfe normalize edilir,
+- blok / daire sütunları içe aktarma başında bir kez kurulan daire index'i
+  ile `apartment_id`'ye eşlenir,
+- `ResidentCreate` doğrulaması ve `create_resident` kuralları (bina eşleşmesi,
+  e-posta tekilliği) uygulanır; e-posta kontrolü tek `$in` sorgusudur,
+- şifreler worker havuzunda hashlenir ve `insert_many(ordered=False)` ile yazılır.
+
+İlerleme `resident_imports` koleksiyonunda `import_id` ile tutulur. Sakin
+id'leri (import_id, satır no) üzerinden deterministik üretildiğinden, yarıda
+kalan bir içe aktarma aynı dosya ve aynı `import_id` ile yeniden
+başlatıldığında `last_row` sonrasından devam eder ve daha önce yazılmış
+satırlar tekrar oluşturulmaz.
+"""
+
+import asyncio
+import csv
+import io
+import os
+import re
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from openpyxl import load_workbook
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+RESIDENT_IMPORT_CHUNK_SIZE = int(os.environ.get("RESIDENT_IMPORT_CHUNK_SIZE", "500"))
+RESIDENT_IMPORT_MAX_ERRORS = 200
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Başlık -> alan eşlemesi (başlıklar küçük harfe çevrilip boşluklar '_' yapılır)
+COLUMN_ALIASES = {
+    "full_name": ("full_name", "ad_soyad", "adsoyad", "isim", "name"),
+    "phone": ("phone", "telefon", "tel", "gsm", "cep"),
+    "email": ("email", "e-posta", "eposta", "e_posta", "mail"),
+    "type": ("type", "tip", "tür", "tur", "sakin_tipi"),
+    "block": ("block", "blok"),
+    "apartment": ("apartment", "apartment_number", "daire", "daire_no", "kapı_no", "kapi_no"),
+    "tc_number": ("tc_number", "tc", "tc_no", "tckn"),
+    "password": ("password", "şifre", "sifre"),
+}
+
+RESIDENT_TYPES = {
+    "owner": "owner", "malik": "owner", "ev_sahibi": "owner", "ev sahibi": "owner",
+    "tenant": "tenant", "kiracı": "tenant", "kiraci": "tenant",
+}
+
+
+def normalize_phone(value: Any) -> Optional[str]:
+    """Telefonu 5XXXXXXXXX biçimine getir"""
+    if value is None:
+        return None
+    digits = re.sub(r"\D", "", str(value))
+    if digits.startswith("90") and len(digits) == 12:
+        digits = digits[2:]
+    elif digits.startswith("0") and len(digits) == 11:
+        digits = digits[1:]
+    return digits or None
+
+
+def normalize_email(value: Any) -> Optional[str]:
+    email = str(value or "").strip().lower()
+    return email or None
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _header_map(headers: List[Any]) -> Dict[int, str]:
+    lookup = {alias: field for field, aliases in COLUMN_ALIASES.items() for alias in aliases}
+    mapping = {}
+    for position, header in enumerate(headers):
+        key = _cell(header).lower().replace(" ", "_")
+        if key in lookup:
+            mapping[position] = lookup[key]
+    return mapping
+
+
+def iter_rows(file, filename: str) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Dosyayı satır satır oku; (satır no, alan -> değer) üret. Satır no başlıktan sonra 1'den başlar"""
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            mapping = _header_map(list(next(rows, [])))
+            for row_number, values in enumerate(rows, start=1):
+                yield row_number, {field: _cell(values[pos]) for pos, field in mapping.items() if pos < len(values)}
+        finally:
+            workbook.close()
+    else:
+        text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        try:
+            sample = text.read(4096)
+            text.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+            except csv.Error:
+                dialect = csv.excel
+            reader = csv.reader(text, dialect)
+            mapping = _header_map(next(reader, []))
+            for row_number, values in enumerate(reader, start=1):
+                yield row_number, {field: _cell(values[pos]) for pos, field in mapping.items() if pos < len(values)}
+        finally:
+            text.detach()
+
+
+def _next_chunk(rows: Iterator, size: int) -> List[Tuple[int, Dict[str, str]]]:
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            break
+    return chunk
+
+
+class ApartmentIndex:
+    """Blok adı / daire no -> apartment_id eşlemesi (içe aktarma başına bir kez kurulur)"""
+
+    def __init__(self, blocks: List[dict], apartments: List[dict]):
+        block_names = {block["id"]: block.get("name", "").strip().lower() for block in blocks}
+        self._by_number: Dict[str, str] = {}
+        self._by_block_door: Dict[Tuple[str, str], str] = {}
+        for apartment in apartments:
+            number = str(apartment.get("apartment_number", "")).strip().lower()
+            door = str(apartment.get("door_number", "")).strip().lower()
+            block = block_names.get(apartment.get("block_id"), "")
+            if number:
+                self._by_number[number] = apartment["id"]
+                self._by_block_door[(block, number)] = apartment["id"]
+            if door:
+                self._by_block_door[(block, door)] = apartment["id"]
+
+    @classmethod
+    async def build(cls, db, building_id: str) -> "ApartmentIndex":
+        blocks, apartments = await asyncio.gather(
+            db.blocks.find({"building_id": building_id}, {"_id": 0, "id": 1, "name": 1}).to_list(None),
+            db.apartments.find(
+                {"building_id": building_id},
+                {"_id": 0, "id": 1, "block_id": 1, "apartment_number": 1, "door_number": 1}
+            ).to_list(None)
+        )
+        return cls(blocks, apartments)
+
+    def resolve(self, block: str, apartment: str) -> Optional[str]:
+        block, apartment = block.strip().lower(), apartment.strip().lower()
+        if not apartment:
+            return None
+        return self._by_block_door.get((block, apartment)) or self._by_number.get(apartment)
+
+
+class ResidentImporter:
+    """Parça parça sakin içe aktarma; ilerleme resident_imports koleksiyonunda"""
+
+    def __init__(self, db, password_hasher, building_counters, create_model, db_model):
+        self.db = db
+        self.password_hasher = password_hasher
+        self.building_counters = building_counters
+        self.create_model = create_model
+        self.db_model = db_model
+
+    async def get(self, import_id: str, building_id: str) -> Optional[dict]:
+        return await self.db.resident_imports.find_one({"id": import_id, "building_id": building_id}, {"_id": 0})
+
+    async def _start(self, import_id: str, building_id: str, filename: str, user_id: str) -> dict:
+        now = datetime.now(timezone.utc)
+        job = await self.get(import_id, building_id)
+        if job is None:
+            # Başka binaya ait import_id: varlığını sızdırmadan 404
+            if await self.db.resident_imports.find_one({"id": import_id}, {"_id": 1}):
+                raise HTTPException(status_code=404, detail="İçe aktarma bulunamadı")
+            job = {
+                "id": import_id,
+                "building_id": building_id,
+                "filename": filename,
+                "status": "running",
+                "last_row": 0,
+                "created": 0,
+                "skipped": 0,
+                "failed": 0,
+                "errors": [],
+                "started_by": user_id,
+                "created_at": now,
+                "updated_at": now,
+                "finished_at": None,
+            }
+            try:
+                await self.db.resident_imports.insert_one(job)
+            except DuplicateKeyError:
+                raise HTTPException(status_code=409, detail="Bu import_id ile bir içe aktarma zaten başlatıldı")
+            job.pop("_id", None)
+        else:
+            await self.db.resident_imports.update_one(
+                {"id": import_id, "building_id": building_id}, {"$set": {"status": "running", "updated_at": now}}
+            )
+        return job
+
+    def _resident_id(self, import_id: str, row_number: int) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"resident-import:{import_id}:{row_number}"))
+
+    async def _process_chunk(
+        self,
+        import_id: str,
+        building_id: str,
+        chunk: List[Tuple[int, Dict[str, str]]],
+        apartments: ApartmentIndex,
+        default_password: Optional[str]
+    ) -> Dict[str, Any]:
+        errors: List[Dict[str, Any]] = []
+        candidates = []
+        seen_emails = set()
+
+        for row_number, row in chunk:
+            if not any(row.values()):
+                continue
+            email = normalize_email(row.get("email"))
+            data = {
+                "building_id": building_id,
+                "full_name": row.get("full_name", ""),
+                "phone": normalize_phone(row.get("phone")) or "",
+                "email": email,
+                "type": RESIDENT_TYPES.get(row.get("type", "").lower(), "owner"),
+                "tc_number": row.get("tc_number") or None,
+                "password": row.get("password") or default_password or "",
+                "apartment_id": apartments.resolve(row.get("block", ""), row.get("apartment", "")),
+            }
+            if row.get("apartment") and not data["apartment_id"]:
+                errors.append({"row": row_number, "error": "Daire bulunamadı"})
+                continue
+            if not data["full_name"] or not data["phone"] or not data["password"]:
+                errors.append({"row": row_number, "error": "Ad soyad, telefon ve şifre zorunludur"})
+                continue
+            try:
+                resident = self.create_model.model_validate(data)
+            except ValidationError as e:
+                errors.append({"row": row_number, "error": "; ".join(err["msg"] for err in e.errors())})
+                continue
+            if email and email in seen_emails:
+                errors.append({"row": row_number, "error": "Email already registered"})
+                continue
+            if email:
+                seen_emails.add(email)
+            candidates.append((row_number, resident))
+
+        # create_resident kuralı: e-posta tekilliği (parça başına tek $in sorgusu).
+        # Bu içe aktarmanın kendi yazdığı kayıtlar (devam etme durumu) hariç tutulur.
+        emails = [resident.email for _, resident in candidates if resident.email]
+        existing = set()
+        if emails:
+            own_ids = [self._resident_id(import_id, row_number) for row_number, _ in candidates]
+            existing = set(await self.db.residents.distinct(
+                "email", {"email": {"$in": emails}, "id": {"$nin": own_ids}}
+            ))
+        accepted = []
+        for row_number, resident in candidates:
+            if resident.email and resident.email in existing:
+                errors.append({"row": row_number, "error": "Email already registered"})
+            else:
+                accepted.append((row_number, resident))
+
+        hashed = await self.password_hasher.hash_many([resident.password for _, resident in accepted])
+        now = datetime.now(timezone.utc)
+        docs = [
+            self.db_model(
+                id=self._resident_id(import_id, row_number),
+                created_at=now,
+                hashed_password=hashed_password,
+                **resident.model_dump(exclude={"password"})
+            ).model_dump()
+            for (row_number, resident), hashed_password in zip(accepted, hashed)
+        ]
+
+        skipped = set()
+        other_failures = {}
+        if docs:
+            try:
+                await self.db.residents.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                for write_error in e.details.get("writeErrors", []):
+                    if write_error.get("code") == DUPLICATE_KEY_ERROR:
+                        # Önceki (yarıda kalmış) denemede yazılmış satır
+                        skipped.add(write_error["index"])
+                    else:
+                        other_failures[write_error["index"]] = write_error.get("errmsg")
+
+        inserted = []
+        for position, doc in enumerate(docs):
+            if position in other_failures:
+                errors.append({"row": accepted[position][0], "error": "Kayıt yazılamadı"})
+            elif position not in skipped:
+                inserted.append(doc)
+        await self.building_counters.apply_many("resident", inserted)
+
+        return {"created": len(inserted), "skipped": len(skipped), "errors": errors}
+
+    async def run(
+        self,
+        file,
+        filename: str,
+        building_id: str,
+        user_id: str,
+        import_id: Optional[str] = None,
+        default_password: Optional[str] = None,
+        chunk_size: Optional[int] = None
+    ) -> dict:
+        """Dosyayı içe aktar; aynı import_id ile çağrıldığında kaldığı yerden devam eder"""
+        import_id = import_id or str(uuid.uuid4())
+        chunk_size = chunk_size or RESIDENT_IMPORT_CHUNK_SIZE
+        job = await self._start(import_id, building_id, filename, user_id)
+        if job["status"] == "completed":
+            return job
+
+        apartments = await ApartmentIndex.build(self.db, building_id)
+        rows = iter_rows(file, filename)
+        resume_after = job["last_row"]
+
+        try:
+            while True:
+                # Dosya okuma senkron; event loop'u bloklamamak için thread'de
+                chunk = await asyncio.to_thread(_next_chunk, rows, chunk_size)
+                if not chunk:
+                    break
+                chunk = [(row_number, row) for row_number, row in chunk if row_number > resume_after]
+                if not chunk:
+                    continue
+
+                result = await self._process_chunk(import_id, building_id, chunk, apartments, default_password)
+                await self.db.resident_imports.update_one(
+                    {"id": import_id},
+                    {
+                        "$set": {"last_row": chunk[-1][0], "updated_at": datetime.now(timezone.utc)},
+                        "$inc": {
+                            "created": result["created"],
+                            "skipped": result["skipped"],
+                            "failed": len(result["errors"])
+                        },
+                        "$push": {"errors": {"$each": result["errors"], "$slice": RESIDENT_IMPORT_MAX_ERRORS}}
+                    }
+                )
+        except Exception as e:
+            await self.db.resident_imports.update_one(
+                {"id": import_id},
+                {"$set": {"status": "failed", "error": str(e), "updated_at": datetime.now(timezone.utc)}}
+            )
+            raise
+        finally:
+            rows.close()
+
+        now = datetime.now(timezone.utc)
+        await self.db.resident_imports.update_one(
+            {"id": import_id},
+            {"$set": {"status": "completed", "finished_at": now, "updated_at": now}}
+        )
+        return await self.get(import_id, building_id)
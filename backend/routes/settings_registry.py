@@ -0,0 +1,137 @@
+"""
+Settings Registry
+Mail, SMS, ödeme, sistem ve Google Calendar ayarları için süreç içi,
+sürüm damgalı tek ayar önbelleği.
+
+`MailService.get_config`, `NetgsmService.get_config`,
+`ParatikaService.get_config`, `get_settings` ve `get_google_config` her
+kullanımda Mongo'ya gidiyordu; toplu gönderimde `mail_config` alıcı başına
+yeniden okunuyordu. Registry bu tekil dokümanları süreç içinde tutar ve
+her çağrıya derin kopya döndürür (çağıran dokümanı değiştirse de önbellek
+bozulmaz).
+
+Geçersiz kılma: kaydeden endpoint `invalidate(db, name, scope)` çağırır;
+yerel kayıt düşer ve `settings_versions` koleksiyonunda ayarın sürümü
+artırılır. Diğer worker süreçleri en fazla SETTINGS_VERSION_POLL_SECONDS
+aralıkla, `get` sırasında artımlı bir sürüm sorgusu yapar (yalnızca son
+değişen sürüm dokümanları okunur) ve sürümü değişen kayıtları düşürür.
+"""
+
+import asyncio
+import copy
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+SETTINGS_VERSION_POLL_SECONDS = float(os.environ.get("SETTINGS_VERSION_POLL_SECONDS", "5"))
+
+# Süreç saatleri arasındaki farkları tolere etmek için artımlı okumada geriye bakma payı
+POLL_OVERLAP = timedelta(seconds=30)
+
+# ayar adı -> (koleksiyon, scope -> filtre)
+SETTINGS_SOURCES: Dict[str, Tuple[str, Callable[[Optional[str]], dict]]] = {
+    "mail": ("mail_config", lambda scope: {"_id": "main"}),
+    "netgsm": ("netgsm_config", lambda scope: {"id": "default"}),
+    "paratika": ("paratika_config", lambda scope: {"id": "default"}),
+    "system": ("system_settings", lambda scope: {"id": "system_settings"}),
+    "google_calendar": ("google_calendar_config", lambda scope: {"building_id": scope}),
+}
+
+
+def _version_id(name: str, scope: Optional[str]) -> str:
+    return f"{name}:{scope}" if scope else name
+
+
+class SettingsRegistry:
+    """(ayar, scope) -> (sürüm, doküman) önbelleği"""
+
+    def __init__(self, poll_interval: float = SETTINGS_VERSION_POLL_SECONDS):
+        self.poll_interval = poll_interval
+        self._entries: Dict[str, Tuple[int, Optional[dict]]] = {}
+        self._versions: Dict[str, int] = {}
+        self._watermark: Optional[datetime] = None
+        self._last_poll = 0.0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.polls = 0
+
+    async def _poll(self, db) -> None:
+        query = {}
+        if self._watermark:
+            query = {"updated_at": {"$gte": self._watermark - POLL_OVERLAP}}
+
+        async for doc in db.settings_versions.find(query, {"_id": 0}):
+            version_id = doc["id"]
+            self._versions[version_id] = doc.get("version", 0)
+            entry = self._entries.get(version_id)
+            if entry and entry[0] != self._versions[version_id]:
+                del self._entries[version_id]
+            updated_at = doc.get("updated_at")
+            if updated_at and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+
+        self._last_poll = time.monotonic()
+        self.polls += 1
+
+    async def maybe_poll(self, db) -> None:
+        """Yoklama aralığı dolduysa diğer süreçlerin sürüm artışlarını oku"""
+        if time.monotonic() - self._last_poll < self.poll_interval:
+            return
+        async with self._lock:
+            if time.monotonic() - self._last_poll < self.poll_interval:
+                return
+            await self._poll(db)
+
+    async def get(self, db, name: str, scope: Optional[str] = None) -> Optional[dict]:
+        """Ayar dokümanının kopyası (yoksa None)"""
+        await self.maybe_poll(db)
+        version_id = _version_id(name, scope)
+        entry = self._entries.get(version_id)
+        if entry is None:
+            self.misses += 1
+            # Sürüm dokümandan önce alınır: arada kaydedilen bir değişiklik sonraki yoklamada düşer
+            version = self._versions.get(version_id, 0)
+            collection, query = SETTINGS_SOURCES[name]
+            doc = await db[collection].find_one(query(scope), {"_id": 0})
+            entry = (version, doc)
+            self._entries[version_id] = entry
+        else:
+            self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    async def version(self, db, name: str, scope: Optional[str] = None) -> int:
+        """Bilinen güncel sürüm (ayar dokümanı registry dışında önbelleklenenler için)"""
+        await self.maybe_poll(db)
+        return self._versions.get(_version_id(name, scope), 0)
+
+    async def invalidate(self, db, name: str, scope: Optional[str] = None) -> None:
+        """Kayıt sonrası çağrılır: yerel kaydı düşür, süreçler arası sürümü artır"""
+        version_id = _version_id(name, scope)
+        self._entries.pop(version_id, None)
+        self.invalidations += 1
+        result = await db.settings_versions.find_one_and_update(
+            {"id": version_id},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+            projection={"_id": 0, "version": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if result:
+            self._versions[version_id] = result["version"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "polls": self.polls,
+        }
+
+
+settings_registry = SettingsRegistry()
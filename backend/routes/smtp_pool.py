@@ -0,0 +1,230 @@
+"""
+SMTP Pool
+MailService için kalıcı, kimliği doğrulanmış async SMTP bağlantı havuzu.
+
+`send_mail` her mesaj için bloklayan `smtplib.SMTP` ile yeni bir TCP
+bağlantısı açıp STARTTLS + LOGIN yapıyordu: alıcı başına birkaç round-trip
+ve bu süre boyunca bloklanan event loop. Havuz `aiosmtplib` bağlantılarını
+süreç içinde tutar ve mesajlar arasında yeniden kullanır:
+
+- En fazla SMTP_POOL_SIZE bağlantı; bağlantılar ihtiyaç oldukça açılır.
+- SMTP_IDLE_TIMEOUT_SECONDS'tan uzun boşta kalan bağlantı sunucu tarafından
+  düşürülmüş sayılır ve kullanılmadan önce yeniden açılır; gönderim
+  sırasında kopan bağlantı bir kez yeniden bağlanıp tekrar denenir.
+- SMTP_MAX_MESSAGES_PER_CONNECTION mesajdan sonra bağlantı yenilenir
+  (Gmail oturum başına mesaj sınırı uygular).
+- `send_many` bir grup mesajı tek bağlantıyı bırakmadan art arda gönderir.
+
+Havuz mail konfigürasyonuna (host, port, kullanıcı, şifre) bağlıdır;
+konfigürasyon değiştiğinde eski havuz kapatılıp yenisi açılır. Bağlantı
+bazlı throughput metrikleri `/api/system/metrics` altında görünür.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from email.message import Message
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import aiosmtplib
+
+logger = logging.getLogger(__name__)
+
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", "4"))
+SMTP_IDLE_TIMEOUT_SECONDS = float(os.environ.get("SMTP_IDLE_TIMEOUT_SECONDS", "60"))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.environ.get("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+SMTP_TIMEOUT_SECONDS = float(os.environ.get("SMTP_TIMEOUT_SECONDS", "30"))
+
+# (mesaj, gönderen, alıcılar)
+Envelope = Tuple[Message, str, Sequence[str]]
+
+
+def _config_key(config: dict) -> Tuple[Any, ...]:
+    password_digest = hashlib.sha256(str(config.get("smtp_password", "")).encode()).hexdigest()
+    return (config["smtp_host"], int(config["smtp_port"]), config["smtp_user"], password_digest)
+
+
+class SMTPConnection:
+    """Tek bir kalıcı SMTP oturumu ve throughput sayaçları"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, config: dict):
+        self.id = next(self._ids)
+        use_tls = int(config["smtp_port"]) == 465
+        self.client = aiosmtplib.SMTP(
+            hostname=config["smtp_host"],
+            port=int(config["smtp_port"]),
+            username=config["smtp_user"],
+            password=config["smtp_password"],
+            use_tls=use_tls,
+            start_tls=not use_tls,
+            timeout=SMTP_TIMEOUT_SECONDS,
+        )
+        self.last_used = 0.0
+        self.session_messages = 0
+        self.connects = 0
+        self.messages = 0
+        self.bytes = 0
+        self.errors = 0
+        self.send_seconds = 0.0
+
+    def _stale(self) -> bool:
+        return (
+            not self.client.is_connected
+            or time.monotonic() - self.last_used > SMTP_IDLE_TIMEOUT_SECONDS
+            or self.session_messages >= SMTP_MAX_MESSAGES_PER_CONNECTION
+        )
+
+    async def close(self) -> None:
+        if self.client.is_connected:
+            try:
+                await self.client.quit()
+            except aiosmtplib.SMTPException:
+                self.client.close()
+
+    async def ensure_connected(self) -> None:
+        if not self._stale():
+            return
+        await self.close()
+        await self.client.connect()  # connect + STARTTLS + LOGIN
+        self.connects += 1
+        self.session_messages = 0
+        self.last_used = time.monotonic()
+
+    async def send(self, message: Message, sender: str, recipients: Sequence[str]) -> None:
+        started = time.monotonic()
+        try:
+            await self.ensure_connected()
+            try:
+                await self.client.send_message(message, sender=sender, recipients=list(recipients))
+            except aiosmtplib.SMTPServerDisconnected:
+                # Sunucu boşta bağlantıyı düşürmüş; bir kez yeniden bağlanıp dene
+                self.client.close()
+                await self.ensure_connected()
+                await self.client.send_message(message, sender=sender, recipients=list(recipients))
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.send_seconds += time.monotonic() - started
+            self.last_used = time.monotonic()
+        self.session_messages += 1
+        self.messages += 1
+        self.bytes += len(message.as_bytes())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "connected": self.client.is_connected,
+            "connects": self.connects,
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "errors": self.errors,
+            "messages_per_second": round(self.messages / self.send_seconds, 2) if self.send_seconds else 0.0,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1) if self.last_used else None,
+        }
+
+
+class SMTPPool:
+    """Tek bir mail konfigürasyonu için bağlantı havuzu"""
+
+    def __init__(self, config: dict, size: int = SMTP_POOL_SIZE):
+        self.config = config
+        self.size = size
+        self.connections: List[SMTPConnection] = []
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._waits = 0
+
+    @asynccontextmanager
+    async def connection(self):
+        if self._idle.empty() and len(self.connections) < self.size:
+            conn = SMTPConnection(self.config)
+            self.connections.append(conn)
+        else:
+            if self._idle.empty():
+                self._waits += 1
+            conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def send(self, message: Message, sender: str, recipients: Sequence[str]) -> None:
+        async with self.connection() as conn:
+            await conn.send(message, sender, recipients)
+
+    async def send_many(
+        self,
+        envelopes: List[Envelope],
+        throttle: Optional[Callable[[Sequence[str]], Awaitable[None]]] = None
+    ) -> List[Optional[Exception]]:
+        """Mesajları tek oturumda art arda gönder; her mesaj için None veya hata
+
+        throttle verilirse her mesajdan önce beklenir (hız sınırı); hata verirse
+        kalan mesajlar gönderilmez.
+        """
+        results: List[Optional[Exception]] = []
+        async with self.connection() as conn:
+            for index, (message, sender, recipients) in enumerate(envelopes):
+                if throttle is not None:
+                    try:
+                        await throttle(recipients)
+                    except Exception as e:
+                        results.extend([e] * (len(envelopes) - index))
+                        break
+                try:
+                    await conn.send(message, sender, recipients)
+                    results.append(None)
+                except aiosmtplib.SMTPAuthenticationError:
+                    raise
+                except Exception as e:
+                    results.append(e)
+        return results
+
+    async def close(self) -> None:
+        for conn in self.connections:
+            await conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "host": self.config["smtp_host"],
+            "size": self.size,
+            "open": sum(1 for conn in self.connections if conn.client.is_connected),
+            "waits": self._waits,
+            "connections": [conn.stats() for conn in self.connections],
+        }
+
+
+class SMTPPoolRegistry:
+    """Güncel mail konfigürasyonunun havuzu; konfigürasyon değişince yenilenir"""
+
+    def __init__(self):
+        self._key: Optional[Tuple[Any, ...]] = None
+        self._pool: Optional[SMTPPool] = None
+
+    def get(self, config: dict) -> SMTPPool:
+        key = _config_key(config)
+        if self._pool is None or key != self._key:
+            if self._pool is not None:
+                logger.info("Mail konfigürasyonu değişti, SMTP havuzu yenileniyor")
+                asyncio.ensure_future(self._pool.close())
+            self._key = key
+            self._pool = SMTPPool(config)
+        return self._pool
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+            self._key = None
+
+    def stats(self) -> Dict[str, Any]:
+        return self._pool.stats() if self._pool else {"size": SMTP_POOL_SIZE, "open": 0, "connections": []}
+
+
+smtp_pool = SMTPPoolRegistry()
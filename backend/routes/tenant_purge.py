@@ -0,0 +1,235 @@
+"""
+Tenant Purge
+Silinen binanın tenant verisini arka planda, parça parça temizleyen iş.
+
+`delete_building` yalnızca bina ve kullanıcı kayıtlarını siliyordu; bloklar,
+daireler, sakinler, aidatlar, duyurular vb. sahipsiz kalıyordu. Bina
+silindiğinde artık `purge_jobs` koleksiyonuna bir iş yazılır ve iş
+TENANT_COLLECTIONS içindeki her koleksiyonu `building_id` ile sınırlı
+partiler halinde siler:
+
+- her partide en fazla PURGE_BATCH_SIZE doküman `_id` ile silinir,
+- partiler arasında PURGE_BATCH_PAUSE_MS kadar beklenir (Mongo gecikmesini
+  zıplatmamak için),
+- koleksiyon bazında silinen doküman sayısı işin `progress` alanına yazılır.
+
+İş bir lease ile sahiplenilir; süreç yeniden başladığında yarım kalan işler
+`resume_pending` ile kaldığı yerden devam eder. Geçici bir hata (ör. Mongo
+bağlantısı) işi durdurmaz: `run` lease'i tutarak üstel beklemeyle
+(PURGE_RETRY_BASE_SECONDS, en fazla PURGE_RETRY_MAX_SECONDS) yeniden dener;
+PURGE_MAX_ATTEMPTS denemeden sonra iş `failed` olur ve bir sonraki
+başlangıçta `resume_pending` ile yeniden çalıştırılır. `preview` silinecek
+doküman sayılarını hiçbir şey silmeden döndürür (dry-run).
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from routes.mail_templates import mail_template_cache
+from routes.settings_registry import settings_registry
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = int(os.environ.get("PURGE_BATCH_SIZE", "500"))
+PURGE_BATCH_PAUSE_MS = int(os.environ.get("PURGE_BATCH_PAUSE_MS", "100"))
+PURGE_LEASE_SECONDS = int(os.environ.get("PURGE_LEASE_SECONDS", "60"))
+PURGE_MAX_ATTEMPTS = int(os.environ.get("PURGE_MAX_ATTEMPTS", "10"))
+PURGE_RETRY_BASE_SECONDS = float(os.environ.get("PURGE_RETRY_BASE_SECONDS", "5"))
+PURGE_RETRY_MAX_SECONDS = float(os.environ.get("PURGE_RETRY_MAX_SECONDS", "300"))
+
+# Lease'i dolunca yeniden çalıştırılabilen iş durumları
+RESUMABLE_STATUSES = ["pending", "running", "failed"]
+
+# building_id alanı taşıyan tüm tenant koleksiyonları (silme sırası)
+TENANT_COLLECTIONS: List[str] = [
+    "due_payments",
+    "dues",
+    "monthly_dues",
+    "apartment_ledger",
+    "apartment_ledger_archive",
+    "apartment_ledger_snapshots",
+    "apartment_balances",
+    "bank_reconciliation_items",
+    "bank_statement_imports",
+    "late_fee_runs",
+    "requests",
+    "announcements",
+    "surveys",
+    "votings",
+    "meetings",
+    "decisions",
+    "notification_logs",
+    "notification_timeline",
+    "push_tokens",
+    "outbox",
+    "resident_imports",
+    "residents",
+    "apartments",
+    "blocks",
+    "building_status",
+    "building_counters",
+    "building_payments",
+    "building_mail_templates",
+    "google_calendar_config",
+    "google_tokens",
+]
+
+
+class TenantPurge:
+    """purge_jobs koleksiyonu üzerinde tenant temizleme servisi"""
+
+    def __init__(self, db, batch_size: int = PURGE_BATCH_SIZE, pause_ms: int = PURGE_BATCH_PAUSE_MS):
+        self.db = db
+        self.batch_size = batch_size
+        self.pause_ms = pause_ms
+        self._tasks: set = set()
+
+    async def preview(self, building_id: str) -> Dict[str, int]:
+        """Silinecek doküman sayıları (dry-run)"""
+        counts = await asyncio.gather(*(
+            self.db[name].count_documents({"building_id": building_id}) for name in TENANT_COLLECTIONS
+        ))
+        return {name: count for name, count in zip(TENANT_COLLECTIONS, counts) if count}
+
+    async def start(self, building_id: str, requested_by: Optional[str] = None) -> dict:
+        """Temizleme işini oluştur ve arka planda başlat"""
+        now = datetime.now(timezone.utc)
+        job = {
+            "id": str(uuid.uuid4()),
+            "building_id": building_id,
+            "status": "pending",
+            "collections": TENANT_COLLECTIONS,
+            "progress": {},
+            "deleted_total": 0,
+            "current_collection": None,
+            "requested_by": requested_by,
+            "lease_until": now,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+            "error": None,
+        }
+        await self.db.purge_jobs.insert_one(job)
+        job.pop("_id", None)
+        self._schedule(job["id"])
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.db.purge_jobs.find_one({"id": job_id}, {"_id": 0})
+
+    def _schedule(self, job_id: str) -> None:
+        task = asyncio.create_task(self.run(job_id))
+        # Task referansı tutulmazsa GC tarafından toplanabilir
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _claim(self, job_id: str) -> Optional[dict]:
+        """İşi lease ile sahiplen (başka bir süreç çalıştırıyorsa None)"""
+        now = datetime.now(timezone.utc)
+        return await self.db.purge_jobs.find_one_and_update(
+            {"id": job_id, "status": {"$in": RESUMABLE_STATUSES}, "lease_until": {"$lte": now}},
+            {"$set": {
+                "status": "running",
+                "lease_until": now + timedelta(seconds=PURGE_LEASE_SECONDS),
+                "updated_at": now
+            }},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _purge_collection(self, job: dict, name: str) -> None:
+        collection = self.db[name]
+        query = {"building_id": job["building_id"]}
+        while True:
+            batch = await collection.find(query, {"_id": 1}).limit(self.batch_size).to_list(self.batch_size)
+            if not batch:
+                return
+            result = await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+
+            now = datetime.now(timezone.utc)
+            await self.db.purge_jobs.update_one(
+                {"id": job["id"]},
+                {
+                    "$inc": {f"progress.{name}": result.deleted_count, "deleted_total": result.deleted_count},
+                    "$set": {
+                        "current_collection": name,
+                        "lease_until": now + timedelta(seconds=PURGE_LEASE_SECONDS),
+                        "updated_at": now
+                    }
+                }
+            )
+            if len(batch) < self.batch_size:
+                return
+            await asyncio.sleep(self.pause_ms / 1000)
+
+    async def run(self, job_id: str) -> Optional[dict]:
+        """İşi çalıştır; koleksiyonlar sırayla, partiler halinde silinir"""
+        job = await self._claim(job_id)
+        while job is None:
+            # Başka bir süreç çalıştırıyor ya da önceki sürecin lease'i henüz dolmadı
+            current = await self.get(job_id)
+            if not current or current["status"] not in RESUMABLE_STATUSES:
+                return None
+            wait = (current["lease_until"] - datetime.now(timezone.utc)).total_seconds()
+            await asyncio.sleep(max(wait, 1))
+            job = await self._claim(job_id)
+
+        attempt = 0
+        while True:
+            try:
+                # Silme building_id ile sınırlı ve idempotent; yeniden deneme baştan başlar
+                for name in job["collections"]:
+                    await self._purge_collection(job, name)
+                break
+            except Exception as e:
+                attempt += 1
+                now = datetime.now(timezone.utc)
+                if attempt >= PURGE_MAX_ATTEMPTS:
+                    logger.error(f"Tenant purge başarısız ({job['building_id']}, {attempt} deneme): {e}")
+                    await self.db.purge_jobs.update_one(
+                        {"id": job_id},
+                        {"$set": {"status": "failed", "error": str(e), "attempts": attempt, "lease_until": now, "updated_at": now}}
+                    )
+                    return None
+
+                delay = min(PURGE_RETRY_BASE_SECONDS * 2 ** (attempt - 1), PURGE_RETRY_MAX_SECONDS)
+                logger.warning(f"Tenant purge hatası ({job['building_id']}, deneme {attempt}), {delay:.0f} sn sonra yeniden denenecek: {e}")
+                try:
+                    # Beklerken lease tutulur; başka bir süreç işi almaz
+                    await self.db.purge_jobs.update_one(
+                        {"id": job_id},
+                        {"$set": {
+                            "error": str(e),
+                            "attempts": attempt,
+                            "lease_until": now + timedelta(seconds=delay + PURGE_LEASE_SECONDS),
+                            "updated_at": now
+                        }}
+                    )
+                except Exception:
+                    pass
+                await asyncio.sleep(delay)
+
+        # Silinen binanın önbellekteki Google Calendar ayarı ve mail şablonları da düşsün
+        await settings_registry.invalidate(self.db, "google_calendar", job["building_id"])
+        await mail_template_cache.invalidate(self.db, job["building_id"])
+
+        now = datetime.now(timezone.utc)
+        return await self.db.purge_jobs.find_one_and_update(
+            {"id": job_id},
+            {"$set": {"status": "completed", "current_collection": None, "error": None, "finished_at": now, "updated_at": now}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def resume_pending(self) -> int:
+        """Yarım kalmış ve başarısız işleri (lease süresi dolmuş) yeniden başlat"""
+        job_ids = await self.db.purge_jobs.distinct("id", {"status": {"$in": RESUMABLE_STATUSES}})
+        for job_id in job_ids:
+            self._schedule(job_id)
+        return len(job_ids)
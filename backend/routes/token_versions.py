@@ -0,0 +1,153 @@
+"""
+Token Version Table
+Claims taşıyan access token'lar için süreç içi iptal / sürüm tablosu.
+
+Opt-in claims modunda (AUTH_CLAIMS_TOKENS=true) JWT; rol, bina ve aktiflik
+bilgisini ve principal başına bir token sürümünü (tv) imzalı olarak taşır.
+Yetkilendirme DB'ye gitmeden yapılır; yalnızca bu tablo kontrol edilir.
+
+Tablo sadece sürümü artırılmış (şifre değişikliği, pasife alma, silme...)
+principal'ları tutar, bu yüzden küçüktür. Her worker tabloyu birkaç saniyede
+bir `token_versions` koleksiyonundan artımlı olarak yeniler; böylece bir
+worker'da yapılan iptal diğerlerinde de saniyeler içinde etkili olur.
+
+Yenileme sırasında sürümü değişen principal'lar `on_change(kind, id)` ile
+bildirilir; server bunu süreç içi principal önbelleğini düşürmek için
+kullanır (claims modu kapalıyken de).
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+from routes.bson_dates import as_datetime
+
+AUTH_CLAIMS_TOKENS = os.environ.get("AUTH_CLAIMS_TOKENS", "false").lower() in ("1", "true", "yes")
+TOKEN_VERSION_REFRESH_SECONDS = float(os.environ.get("TOKEN_VERSION_REFRESH_SECONDS", "5"))
+
+# Worker saatleri arasındaki farkları tolere etmek için artımlı okumada geriye bakma payı
+REFRESH_OVERLAP = timedelta(seconds=30)
+
+
+class TokenVersionTable:
+    """principal_id -> (token_version, is_active) tablosu"""
+
+    def __init__(
+        self,
+        db,
+        refresh_interval: float = TOKEN_VERSION_REFRESH_SECONDS,
+        on_change: Optional[Callable[[str, str], None]] = None
+    ):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.on_change = on_change
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._watermark: Optional[datetime] = None
+        self._last_refresh = 0.0
+        self._lock = asyncio.Lock()
+        self.refresh_count = 0
+        self.rejected = 0
+
+    def _apply(self, doc: dict) -> None:
+        entry = {
+            "token_version": doc.get("token_version", 0),
+            "is_active": doc.get("is_active", True),
+        }
+        previous = self._entries.get(doc["id"])
+        self._entries[doc["id"]] = entry
+        if previous != entry and self.on_change is not None:
+            self.on_change(doc.get("kind"), doc["id"])
+        updated_at = as_datetime(doc.get("updated_at"))
+        if updated_at and (self._watermark is None or updated_at > self._watermark):
+            self._watermark = updated_at
+
+    async def refresh(self, full: bool = False) -> None:
+        """Tabloyu Mongo'dan yenile (varsayılan: yalnızca son değişiklikler)"""
+        query = {}
+        if not full and self._watermark:
+            query = {"updated_at": {"$gte": self._watermark - REFRESH_OVERLAP}}
+
+        async for doc in self.db.token_versions.find(query, {"_id": 0}):
+            self._apply(doc)
+
+        self._last_refresh = time.monotonic()
+        self.refresh_count += 1
+
+    async def maybe_refresh(self) -> None:
+        """Yenileme aralığı dolduysa tek bir istekle tabloyu yenile"""
+        if time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        async with self._lock:
+            if time.monotonic() - self._last_refresh < self.refresh_interval:
+                return
+            await self.refresh()
+
+    async def current_version(self, principal_id: str) -> int:
+        """Login sırasında token'a yazılacak güncel sürümü getir"""
+        doc = await self.db.token_versions.find_one({"id": principal_id}, {"_id": 0})
+        if doc:
+            self._apply(doc)
+            return doc.get("token_version", 0)
+        return 0
+
+    async def bump(self, principal_id: str, kind: str, is_active: bool = True) -> int:
+        """Principal'ın sürümünü artır; eski token'lar geçersiz olur"""
+        doc = await self.db.token_versions.find_one_and_update(
+            {"id": principal_id},
+            {
+                "$inc": {"token_version": 1},
+                "$set": {
+                    "kind": kind,
+                    "is_active": is_active,
+                    "updated_at": datetime.now(timezone.utc)
+                }
+            },
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._apply(doc)
+        return doc["token_version"]
+
+    async def bump_many(self, principal_ids: Iterable[str], kind: str, is_active: bool = True) -> None:
+        """Birden çok principal'ın sürümünü tek bulk_write ile artır"""
+        principal_ids = list(principal_ids)
+        if not principal_ids:
+            return
+        now = datetime.now(timezone.utc)
+        await self.db.token_versions.bulk_write([
+            UpdateOne(
+                {"id": principal_id},
+                {
+                    "$inc": {"token_version": 1},
+                    "$set": {"kind": kind, "is_active": is_active, "updated_at": now}
+                },
+                upsert=True
+            )
+            for principal_id in principal_ids
+        ], ordered=False)
+        async for doc in self.db.token_versions.find({"id": {"$in": principal_ids}}, {"_id": 0}):
+            self._apply(doc)
+
+    def is_token_valid(self, principal_id: str, token_version: int) -> bool:
+        """Token sürümü güncel ve principal aktif mi?"""
+        entry = self._entries.get(principal_id)
+        if entry is None:
+            return True
+        valid = entry["is_active"] and token_version >= entry["token_version"]
+        if not valid:
+            self.rejected += 1
+        return valid
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": AUTH_CLAIMS_TOKENS,
+            "entries": len(self._entries),
+            "refresh_interval_seconds": self.refresh_interval,
+            "refresh_count": self.refresh_count,
+            "rejected": self.rejected,
+        }
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query, File, Form, UploadFile, status
+from fastapi import Request as HTTPRequest
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -6,28 +7,67 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from typing import Dict, List, Optional, Union
 from datetime import datetime, timezone, timedelta
+import asyncio
 import os
 import logging
 import uuid
 from pathlib import Path
 
 ROOT_DIR = Path(__file__).parent
+# routes.* modülleri ayarlarını import sırasında okur; .env önce yüklenmeli
 load_dotenv(ROOT_DIR / '.env')
 
+from routes.principal_cache import principal_cache
+from routes.password_hasher import PasswordHasher
+from routes.token_versions import TokenVersionTable, AUTH_CLAIMS_TOKENS
+from routes.login_admission import login_admission, client_ip
+from routes.index_manifest import reconcile_indexes, check_query_plans, INDEX_PLAN_CHECK
+from routes.bson_dates import DATE_CODEC_OPTIONS, MIGRATE_BSON_DATES_ON_STARTUP, as_datetime, decode_dates, migrate_dates
+from routes.batch_loader import RequestLoaders
+from routes.dashboard_stats import dashboard_cache, aggregate_superadmin_stats, SUPERADMIN_DASHBOARD_KEY
+from routes.building_counters import BuildingCounters
+from routes.notification_timeline import NotificationTimeline, monthly_due_entry, status_change_entry
+from routes.monthly_dues_cache import monthly_dues_cache
+from routes.apartment_ledger import ApartmentLedger
+from routes.tenant_purge import TenantPurge
+from routes.bulk_insert import BULK_MAX_ROWS, BulkReport, validate_rows, mark_duplicates, insert_rows
+from routes.resident_import import ResidentImporter
+from routes.due_generation import DueGenerator
+from routes.due_allocation import allocate, allocation_report, apartment_amounts, load_allocation_apartments
+from routes.late_fees import LateFeeJob, LATE_FEE_JOB_ENABLED
+from routes.bank_reconciliation import BankReconciliation
+from routes.outbox import Outbox, OUTBOX_INLINE_WORKERS
+from routes.smtp_pool import smtp_pool
+from routes.settings_registry import settings_registry
+from routes.mail_templates import mail_template_cache
+from routes.rate_limiter import rate_limiter
+from routes.pagination import Page, MAX_PAGE_LIMIT, fetch_page, page_response
+
 # Security
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(pwd_context)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+db = client.get_database(os.environ['DB_NAME'], codec_options=DATE_CODEC_OPTIONS)
+token_versions = TokenVersionTable(db, on_change=principal_cache.invalidate)
+building_counters = BuildingCounters(db)
+notification_timeline = NotificationTimeline(db)
+apartment_ledger = ApartmentLedger(db)
+tenant_purge = TenantPurge(db)
+due_generator = DueGenerator(db)
+late_fee_job = LateFeeJob(db, apartment_ledger)
+bank_reconciliation = BankReconciliation(db)
+outbox = Outbox(db)
+rate_limiter.set_db(db)
 
 app = FastAPI(title="Süperadmin Panel API")
 api_router = APIRouter(prefix="/api")
@@ -182,6 +222,7 @@ class ApartmentBase(BaseModel):
     door_number: str  # e.g., "1", "2", "A", "B"
     apartment_number: str  # Full number like "A-301"
     square_meters: Optional[float] = None
+    land_share: Optional[float] = None  # Arsa payı
     room_count: Optional[str] = None  # "2+1", "3+1", etc.
     status: str = "empty"  # empty, rented, owner_occupied
 
@@ -192,6 +233,7 @@ class ApartmentUpdate(BaseModel):
     floor: Optional[int] = None
     door_number: Optional[str] = None
     square_meters: Optional[float] = None
+    land_share: Optional[float] = None
     room_count: Optional[str] = None
     status: Optional[str] = None
 
@@ -235,6 +277,9 @@ class Resident(ResidentBase):
 class ResidentInDB(Resident):
     hashed_password: str
 
+class BulkCreateRequest(BaseModel):
+    items: List[dict] = Field(..., min_length=1, max_length=BULK_MAX_ROWS)
+
 class DueBase(BaseModel):
     building_id: str
     apartment_id: str
@@ -258,6 +303,7 @@ class DueUpdate(BaseModel):
 class Due(DueBase):
     model_config = ConfigDict(extra="ignore")
     id: str
+    monthly_due_id: Optional[str] = None
     paid_date: Optional[datetime] = None
     created_at: datetime
 
@@ -267,6 +313,8 @@ class ExpenseItem(BaseModel):
     """Gider kalemi"""
     name: str  # Hizmet/Ürün adı (Elektrik, Su, Temizlik vb.)
     amount: float  # Tutar
+    allocation: str = "equal"  # equal, land_share, square_meters
+    block_ids: Optional[List[str]] = None  # Yalnızca bu bloklara dağıt
 
 class MonthlyDueDefinitionBase(BaseModel):
     """Aylık aidat tanımı"""
@@ -281,6 +329,20 @@ class MonthlyDueDefinitionBase(BaseModel):
 class MonthlyDueDefinitionCreate(MonthlyDueDefinitionBase):
     pass
 
+class MonthlyDueDefinitionUpdate(BaseModel):
+    """Aidat tanımında güncellenebilen alanlar"""
+    month: Optional[str] = None
+    expense_items: Optional[List[ExpenseItem]] = None
+    total_amount: Optional[float] = None
+    per_apartment_amount: Optional[float] = None
+    due_date: Optional[datetime] = None
+
+# Değişirse daire borçları yeniden yazılır
+MONTHLY_DUE_REPRICING_FIELDS = ("expense_items", "per_apartment_amount", "due_date")
+
+class AllocationPreviewRequest(BaseModel):
+    expense_items: List[ExpenseItem]
+
 class MonthlyDueDefinition(MonthlyDueDefinitionBase):
     model_config = ConfigDict(extra="ignore")
     id: str
@@ -437,11 +499,11 @@ async def test_reload():
     """Test if code reload works - VERSION 3"""
     return {"message": "VERSION 3 - Code reload working!", "timestamp": str(datetime.now(timezone.utc))}
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.verify(plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -453,6 +515,82 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _claim_datetime(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+async def build_user_token_data(user_doc: dict) -> dict:
+    """Yönetici token'ı için claim'leri hazırla (claims modunda principal bilgisiyle)"""
+    data = {"sub": user_doc["id"]}
+    if AUTH_CLAIMS_TOKENS:
+        data.update({
+            "role": user_doc.get("role"),
+            "building_id": user_doc.get("building_id"),
+            "is_active": user_doc.get("is_active", True),
+            "email": user_doc.get("email"),
+            "full_name": user_doc.get("full_name"),
+            "created_at": _claim_datetime(user_doc.get("created_at")),
+            "tv": await token_versions.current_version(user_doc["id"])
+        })
+    return data
+
+async def build_resident_token_data(resident_doc: dict) -> dict:
+    """Sakin token'ı için claim'leri hazırla (claims modunda principal bilgisiyle)"""
+    data = {"sub": resident_doc["id"], "role": "resident", "building_id": resident_doc.get("building_id")}
+    if AUTH_CLAIMS_TOKENS:
+        data.update({
+            "apartment_id": resident_doc.get("apartment_id"),
+            "full_name": resident_doc.get("full_name"),
+            "phone": resident_doc.get("phone"),
+            "email": resident_doc.get("email"),
+            "type": resident_doc.get("type"),
+            "is_active": resident_doc.get("is_active", True),
+            "created_at": _claim_datetime(resident_doc.get("created_at")),
+            "tv": await token_versions.current_version(resident_doc["id"])
+        })
+    return data
+
+async def authorize_claims(payload: dict) -> bool:
+    """Claims taşıyan token'ı sürüm tablosuna göre DB'ye gitmeden doğrula"""
+    await token_versions.maybe_refresh()
+    return payload.get("is_active", True) and token_versions.is_token_valid(payload["sub"], payload["tv"])
+
+async def load_user_principal(user_id: str) -> Optional[User]:
+    # Diğer worker'larda sürümü artırılan principal'lar önbellekten düşer
+    await token_versions.maybe_refresh()
+    cached_user = principal_cache.get("user", user_id)
+    if cached_user is not None:
+        return cached_user
+    
+    user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
+    if user_doc is None:
+        return None
+    
+    decode_dates(user_doc, 'created_at')
+    
+    user = User(**user_doc)
+    principal_cache.set("user", user_id, user)
+    return user
+
+async def load_resident_principal(resident_id: str) -> Optional[Resident]:
+    await token_versions.maybe_refresh()
+    cached_resident = principal_cache.get("resident", resident_id)
+    if cached_resident is not None:
+        return cached_resident
+    
+    # Find resident by ID
+    resident_doc = await db.residents.find_one({"id": resident_id}, {"_id": 0})
+    if resident_doc is None:
+        return None
+    
+    # Convert datetime strings if needed
+    decode_dates(resident_doc, 'created_at', 'move_in_date', 'move_out_date')
+    
+    resident = Resident(**resident_doc)
+    principal_cache.set("resident", resident_id, resident)
+    return resident
+
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -467,14 +605,23 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     except JWTError:
         raise credentials_exception
     
-    user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
-    if user_doc is None:
-        raise credentials_exception
-    
-    if isinstance(user_doc.get('created_at'), str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
+    if AUTH_CLAIMS_TOKENS and "tv" in payload:
+        if payload.get("role") == "resident" or not await authorize_claims(payload):
+            raise credentials_exception
+        return User(
+            id=user_id,
+            email=payload["email"],
+            full_name=payload["full_name"],
+            role=payload["role"],
+            is_active=payload.get("is_active", True),
+            building_id=payload.get("building_id"),
+            created_at=payload["created_at"]
+        )
     
-    return User(**user_doc)
+    user = await load_user_principal(user_id)
+    if user is None:
+        raise credentials_exception
+    return user
 
 async def get_current_superadmin(current_user: User = Depends(get_current_user)) -> User:
     if current_user.role != "superadmin":
@@ -513,20 +660,25 @@ async def get_current_resident(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
     
-    # Find resident by ID
-    resident_doc = await db.residents.find_one({"id": user_id}, {"_id": 0})
-    if resident_doc is None:
-        raise credentials_exception
-    
-    # Convert datetime strings if needed
-    if isinstance(resident_doc.get('created_at'), str):
-        resident_doc['created_at'] = datetime.fromisoformat(resident_doc['created_at'])
-    if isinstance(resident_doc.get('move_in_date'), str):
-        resident_doc['move_in_date'] = datetime.fromisoformat(resident_doc['move_in_date'])
-    if resident_doc.get('move_out_date') and isinstance(resident_doc.get('move_out_date'), str):
-        resident_doc['move_out_date'] = datetime.fromisoformat(resident_doc['move_out_date'])
+    if AUTH_CLAIMS_TOKENS and "tv" in payload:
+        if not await authorize_claims(payload):
+            raise credentials_exception
+        return Resident(
+            id=user_id,
+            building_id=payload["building_id"],
+            apartment_id=payload.get("apartment_id"),
+            full_name=payload["full_name"],
+            phone=payload["phone"],
+            email=payload.get("email"),
+            type=payload["type"],
+            is_active=payload.get("is_active", True),
+            created_at=payload["created_at"]
+        )
     
-    return Resident(**resident_doc)
+    resident = await load_resident_principal(user_id)
+    if resident is None:
+        raise credentials_exception
+    return resident
 
 # ============ AUTH ROUTES ============
 
@@ -534,14 +686,17 @@ async def get_current_resident(token: str = Depends(oauth2_scheme)):
 @api_router.get("/residents/me", response_model=Resident)
 async def get_current_resident_info(current_resident: Resident = Depends(get_current_resident)):
     """Get current logged-in resident information"""
-    return current_resident
+    # Claims modunda token yalnızca özet bilgi taşır; tam kaydı önbellek üzerinden getir
+    resident = await load_resident_principal(current_resident.id)
+    if resident is None:
+        raise HTTPException(status_code=404, detail="Resident not found")
+    return resident
 
 @api_router.get("/users/me", response_model=User)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
     """Get current logged-in user information"""
     return current_user
 
-
 # Mobile App - Resident Login
 class ResidentLoginRequest(BaseModel):
     phone: str
@@ -549,85 +704,88 @@ class ResidentLoginRequest(BaseModel):
 
 
 @api_router.post("/auth/resident-login-v2", response_model=Token)
-async def resident_login_v2(login_data: ResidentLoginRequest):
+async def resident_login_v2(login_data: ResidentLoginRequest, request: HTTPRequest):
     """New version for debugging"""
-    # Find resident by phone
-    resident = await db.residents.find_one({"phone": login_data.phone, "is_active": True}, {"_id": 0})
+    async with login_admission.admit("resident-login-v2", client_ip(request), login_data.phone):
+        # Find resident by phone
+        resident = await db.residents.find_one({"phone": login_data.phone, "is_active": True}, {"_id": 0})
+    
+        if not resident:
+            raise HTTPException(
+                status_code=404,
+                detail=f"DEBUG: Telefon '{login_data.phone}' bulunamadı"
+            )
     
-    if not resident:
-        raise HTTPException(
-            status_code=404,
-            detail=f"DEBUG: Telefon '{login_data.phone}' bulunamadı"
-        )
+        # Verify password
+        if not await verify_password(login_data.password, resident.get("hashed_password", "")):
+            raise HTTPException(
+                status_code=401,
+                detail="DEBUG: Şifre yanlış"
+            )
     
-    # Verify password
-    if not pwd_context.verify(login_data.password, resident.get("hashed_password", "")):
-        raise HTTPException(
-            status_code=401,
-            detail="DEBUG: Şifre yanlış"
+        # Create access token
+        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        access_token = create_access_token(
+            data=await build_resident_token_data(resident),
+            expires_delta=access_token_expires
         )
     
-    # Create access token
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": resident["id"], "role": "resident", "building_id": resident.get("building_id")},
-        expires_delta=access_token_expires
-    )
-    
-    return {"access_token": access_token, "token_type": "bearer"}
+        return {"access_token": access_token, "token_type": "bearer"}
 
 @api_router.post("/auth/resident-login", response_model=Token)
-async def resident_login(login_data: ResidentLoginRequest):
-    # Find resident by phone
-    resident = await db.residents.find_one({"phone": login_data.phone, "is_active": True}, {"_id": 0})
+async def resident_login(login_data: ResidentLoginRequest, request: HTTPRequest):
+    async with login_admission.admit("resident-login", client_ip(request), login_data.phone):
+        # Find resident by phone
+        resident = await db.residents.find_one({"phone": login_data.phone, "is_active": True}, {"_id": 0})
+    
+        if not resident:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="HATA_1: Telefon bulunamadı"
+            )
     
-    if not resident:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="HATA_1: Telefon bulunamadı"
-        )
+        # Verify password
+        if not await verify_password(login_data.password, resident.get("hashed_password", "")):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="HATA_2: Şifre yanlış"
+            )
     
-    # Verify password
-    if not pwd_context.verify(login_data.password, resident.get("hashed_password", "")):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="HATA_2: Şifre yanlış"
+        # Create access token
+        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        access_token = create_access_token(
+            data=await build_resident_token_data(resident),
+            expires_delta=access_token_expires
         )
     
-    # Create access token
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": resident["id"], "role": "resident", "building_id": resident.get("building_id")},
-        expires_delta=access_token_expires
-    )
-    
-    return {"access_token": access_token, "token_type": "bearer"}
+        return {"access_token": access_token, "token_type": "bearer"}
 
 @api_router.post("/auth/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user_doc = await db.users.find_one({"email": form_data.username}, {"_id": 0})
-    if not user_doc:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect email or password",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+async def login(request: HTTPRequest, form_data: OAuth2PasswordRequestForm = Depends()):
+    async with login_admission.admit("login", client_ip(request), form_data.username):
+        user_doc = await db.users.find_one({"email": form_data.username}, {"_id": 0})
+        if not user_doc:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Incorrect email or password",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
     
-    if not verify_password(form_data.password, user_doc["hashed_password"]):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect email or password",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        if not await verify_password(form_data.password, user_doc["hashed_password"]):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Incorrect email or password",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
     
-    if not user_doc.get("is_active", True):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User account is inactive"
-        )
+        if not user_doc.get("is_active", True):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="User account is inactive"
+            )
     
-    access_token = create_access_token(data={"sub": user_doc["id"]})
-    return {"access_token": access_token, "token_type": "bearer"}
+        access_token = create_access_token(data=await build_user_token_data(user_doc))
+        return {"access_token": access_token, "token_type": "bearer"}
 
 @api_router.get("/auth/me", response_model=User)
 async def get_me(current_user: User = Depends(get_current_user)):
@@ -635,18 +793,15 @@ async def get_me(current_user: User = Depends(get_current_user)):
 
 # ============ BUILDING ROUTES ============
 
-@api_router.get("/buildings", response_model=List[Building])
-async def get_buildings(current_user: User = Depends(get_current_superadmin)):
-    buildings = await db.buildings.find({}, {"_id": 0}).to_list(1000)
+@api_router.get("/buildings", response_model=Union[List[Building], Page[Building]])
+async def get_buildings(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT), cursor: Optional[str] = None, current_user: User = Depends(get_current_superadmin)):
+    buildings, next_cursor = await fetch_page(db.buildings, {}, {"_id": 0}, limit, cursor)
     for building in buildings:
-        if isinstance(building.get('created_at'), str):
-            building['created_at'] = datetime.fromisoformat(building['created_at'])
-        if isinstance(building.get('subscription_end_date'), str):
-            building['subscription_end_date'] = datetime.fromisoformat(building['subscription_end_date'])
+        decode_dates(building, 'created_at', 'subscription_end_date')
         # Backward compatibility: map old field names to new ones
         if 'total_apartments' in building and 'apartment_count' not in building:
             building['apartment_count'] = building.pop('total_apartments')
-    return buildings
+    return page_response(buildings, next_cursor, limit, cursor)
 
 @api_router.get("/buildings/{building_id}", response_model=Building)
 async def get_building(building_id: str, current_user: User = Depends(get_current_superadmin)):
@@ -654,10 +809,7 @@ async def get_building(building_id: str, current_user: User = Depends(get_curren
     if not building:
         raise HTTPException(status_code=404, detail="Building not found")
     
-    if isinstance(building.get('created_at'), str):
-        building['created_at'] = datetime.fromisoformat(building['created_at'])
-    if isinstance(building.get('subscription_end_date'), str):
-        building['subscription_end_date'] = datetime.fromisoformat(building['subscription_end_date'])
+    decode_dates(building, 'created_at', 'subscription_end_date')
     # Backward compatibility: map old field names to new ones
     if 'total_apartments' in building and 'apartment_count' not in building:
         building['apartment_count'] = building.pop('total_apartments')
@@ -693,9 +845,6 @@ async def create_building(building_data: BuildingCreate, current_user: User = De
     )
     
     building_doc = building.model_dump()
-    building_doc['created_at'] = building_doc['created_at'].isoformat()
-    if building_doc['subscription_end_date']:
-        building_doc['subscription_end_date'] = building_doc['subscription_end_date'].isoformat()
     
     await db.buildings.insert_one(building_doc)
     
@@ -708,13 +857,13 @@ async def create_building(building_data: BuildingCreate, current_user: User = De
         role="building_admin",
         is_active=True,
         building_id=building_id,
-        hashed_password=get_password_hash(building_data.admin_password),
+        hashed_password=await get_password_hash(building_data.admin_password),
         created_at=datetime.now(timezone.utc)
     )
     
     admin_doc = admin_user.model_dump()
-    admin_doc['created_at'] = admin_doc['created_at'].isoformat()
     await db.users.insert_one(admin_doc)
+    dashboard_cache.invalidate(SUPERADMIN_DASHBOARD_KEY)
     
     return building
 
@@ -728,36 +877,59 @@ async def update_building(building_id: str, building_data: BuildingUpdate, curre
     
     if update_data:
         await db.buildings.update_one({"id": building_id}, {"$set": update_data})
+        dashboard_cache.invalidate(SUPERADMIN_DASHBOARD_KEY)
     
     updated_building = await db.buildings.find_one({"id": building_id}, {"_id": 0})
     
-    if isinstance(updated_building.get('created_at'), str):
-        updated_building['created_at'] = datetime.fromisoformat(updated_building['created_at'])
-    if isinstance(updated_building.get('subscription_end_date'), str):
-        updated_building['subscription_end_date'] = datetime.fromisoformat(updated_building['subscription_end_date'])
+    decode_dates(updated_building, 'created_at', 'subscription_end_date')
     
     return Building(**updated_building)
 
 @api_router.delete("/buildings/{building_id}")
-async def delete_building(building_id: str, current_user: User = Depends(get_current_superadmin)):
+async def delete_building(building_id: str, dry_run: bool = False, current_user: User = Depends(get_current_superadmin)):
+    if dry_run:
+        building = await db.buildings.find_one({"id": building_id}, {"_id": 0, "id": 1})
+        if not building:
+            raise HTTPException(status_code=404, detail="Building not found")
+        counts = await tenant_purge.preview(building_id)
+        counts["users"] = await db.users.count_documents({"building_id": building_id})
+        return {"dry_run": True, "building_id": building_id, "counts": counts, "total": sum(counts.values())}
+    
     result = await db.buildings.delete_one({"id": building_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Building not found")
     
     # Also delete associated users
+    building_user_ids = await db.users.distinct("id", {"building_id": building_id})
+    building_resident_ids = await db.residents.distinct("id", {"building_id": building_id})
     await db.users.delete_many({"building_id": building_id})
+    principal_cache.invalidate_building(building_id)
+    await token_versions.bump_many(building_user_ids, "user", is_active=False)
+    # Sakinler arka planda silinir; claims token'ları hemen geçersiz olmalı
+    await token_versions.bump_many(building_resident_ids, "resident", is_active=False)
+    dashboard_cache.invalidate(SUPERADMIN_DASHBOARD_KEY)
     
-    return {"message": "Building deleted successfully"}
+    # Kalan tenant verisi arka planda partiler halinde silinir
+    job = await tenant_purge.start(building_id, requested_by=current_user.id)
+    
+    return {"message": "Building deleted successfully", "purge_job_id": job["id"]}
+
+@api_router.get("/system/purge-jobs/{job_id}")
+async def get_purge_job(job_id: str, current_user: User = Depends(get_current_superadmin)):
+    """Tenant temizleme işinin durumu"""
+    job = await tenant_purge.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Temizleme işi bulunamadı")
+    return job
 
 # ============ USER ROUTES ============
 
-@api_router.get("/users", response_model=List[User])
-async def get_users(current_user: User = Depends(get_current_superadmin)):
-    users = await db.users.find({}, {"_id": 0, "hashed_password": 0}).to_list(1000)
+@api_router.get("/users", response_model=Union[List[User], Page[User]])
+async def get_users(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT), cursor: Optional[str] = None, current_user: User = Depends(get_current_superadmin)):
+    users, next_cursor = await fetch_page(db.users, {}, {"_id": 0, "hashed_password": 0}, limit, cursor)
     for user in users:
-        if isinstance(user.get('created_at'), str):
-            user['created_at'] = datetime.fromisoformat(user['created_at'])
-    return users
+        decode_dates(user, 'created_at')
+    return page_response(users, next_cursor, limit, cursor)
 
 @api_router.get("/users/{user_id}", response_model=User)
 async def get_user(user_id: str, current_user: User = Depends(get_current_superadmin)):
@@ -765,8 +937,7 @@ async def get_user(user_id: str, current_user: User = Depends(get_current_supera
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    if isinstance(user.get('created_at'), str):
-        user['created_at'] = datetime.fromisoformat(user['created_at'])
+    decode_dates(user, 'created_at')
     
     return user
 
@@ -785,13 +956,13 @@ async def create_user(user_data: UserCreate, current_user: User = Depends(get_cu
         role=user_data.role,
         is_active=user_data.is_active,
         building_id=user_data.building_id,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=await get_password_hash(user_data.password),
         created_at=datetime.now(timezone.utc)
     )
     
     user_doc = new_user.model_dump()
-    user_doc['created_at'] = user_doc['created_at'].isoformat()
     await db.users.insert_one(user_doc)
+    dashboard_cache.invalidate(SUPERADMIN_DASHBOARD_KEY)
     
     # Return without password
     return User(**{k: v for k, v in new_user.model_dump().items() if k != 'hashed_password'})
@@ -806,16 +977,17 @@ async def update_user(user_id: str, user_data: UserUpdate, current_user: User =
     
     # Hash password if provided
     if 'password' in update_data:
-        update_data['hashed_password'] = get_password_hash(update_data['password'])
+        update_data['hashed_password'] = await get_password_hash(update_data['password'])
         del update_data['password']
     
     if update_data:
         await db.users.update_one({"id": user_id}, {"$set": update_data})
+    principal_cache.invalidate("user", user_id)
     
     updated_user = await db.users.find_one({"id": user_id}, {"_id": 0, "hashed_password": 0})
+    await token_versions.bump(user_id, "user", is_active=updated_user.get("is_active", True))
     
-    if isinstance(updated_user.get('created_at'), str):
-        updated_user['created_at'] = datetime.fromisoformat(updated_user['created_at'])
+    decode_dates(updated_user, 'created_at')
     
     return User(**updated_user)
 
@@ -824,6 +996,9 @@ async def delete_user(user_id: str, current_user: User = Depends(get_current_sup
     result = await db.users.delete_one({"id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    principal_cache.invalidate("user", user_id)
+    await token_versions.bump(user_id, "user", is_active=False)
+    dashboard_cache.invalidate(SUPERADMIN_DASHBOARD_KEY)
     return {"message": "User deleted successfully"}
 
 # ============ REGISTRATION REQUEST ROUTES ============
@@ -848,7 +1023,6 @@ async def create_registration_request(request_data: RegistrationRequest):
     
     request_doc = request_data.model_dump()
     request_doc['id'] = str(uuid.uuid4())
-    request_doc['created_at'] = request_doc['created_at'].isoformat()
     
     await db.registration_requests.insert_one(request_doc)
     
@@ -900,10 +1074,10 @@ async def create_registration_request(request_data: RegistrationRequest):
     return {"success": True, "message": "Başvurunuz alındı", "request_id": request_doc['id']}
 
 @api_router.get("/registration-requests")
-async def get_registration_requests(current_user: User = Depends(get_current_superadmin)):
+async def get_registration_requests(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT), cursor: Optional[str] = None, current_user: User = Depends(get_current_superadmin)):
     """Tüm kayıt başvurularını listele (superadmin only)"""
-    requests = await db.registration_requests.find({}, {"_id": 0}).to_list(1000)
-    return requests
+    requests, next_cursor = await fetch_page(db.registration_requests, {}, {"_id": 0}, limit, cursor)
+    return page_response(requests, next_cursor, limit, cursor)
 
 @api_router.put("/registration-requests/{request_id}/approve")
 async def approve_registration(request_id: str, current_user: User = Depends(get_current_superadmin)):
@@ -929,8 +1103,8 @@ async def approve_registration(request_id: str, current_user: User = Depends(get
         "admin_phone": request_doc["phone"],
         "is_active": True,
         "subscription_status": "trial",
-        "subscription_end_date": (datetime.now(timezone.utc) + timedelta(days=30)).isoformat(),
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "subscription_end_date": datetime.now(timezone.utc) + timedelta(days=30),
+        "created_at": datetime.now(timezone.utc)
     }
     await db.buildings.insert_one(building)
     
@@ -941,19 +1115,20 @@ async def approve_registration(request_id: str, current_user: User = Depends(get
         "id": user_id,
         "email": request_doc["email"],
         "full_name": request_doc["manager_name"],
-        "hashed_password": pwd_context.hash(temp_password),
+        "hashed_password": await get_password_hash(temp_password),
         "role": "building_admin",
         "building_id": building_id,
         "phone": request_doc["phone"],
         "is_active": True,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
     await db.users.insert_one(user)
+    dashboard_cache.invalidate(SUPERADMIN_DASHBOARD_KEY)
     
     # Update request status
     await db.registration_requests.update_one(
         {"id": request_id},
-        {"$set": {"status": "approved", "approved_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"status": "approved", "approved_at": datetime.now(timezone.utc)}}
     )
     
     return {
@@ -974,7 +1149,7 @@ async def reject_registration(request_id: str, current_user: User = Depends(get_
     # Update request status
     await db.registration_requests.update_one(
         {"id": request_id},
-        {"$set": {"status": "rejected", "rejected_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"status": "rejected", "rejected_at": datetime.now(timezone.utc)}}
     )
     
     return {"success": True, "message": "Başvuru reddedildi"}
@@ -994,8 +1169,7 @@ async def delete_registration_request(request_id: str, current_user: User = Depe
 async def get_subscriptions(current_user: User = Depends(get_current_superadmin)):
     plans = await db.subscription_plans.find({}, {"_id": 0}).to_list(1000)
     for plan in plans:
-        if isinstance(plan.get('created_at'), str):
-            plan['created_at'] = datetime.fromisoformat(plan['created_at'])
+        decode_dates(plan, 'created_at')
     return plans
 
 @api_router.get("/subscriptions/public")
@@ -1017,12 +1191,12 @@ async def get_public_subscriptions():
     return result
 
 @api_router.get("/subscription-payments")
-async def get_subscription_payments(current_user: User = Depends(get_current_superadmin)):
+async def get_subscription_payments(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT), cursor: Optional[str] = None, current_user: User = Depends(get_current_superadmin)):
     """Abonelik ödemelerini getir"""
-    payments = await db.subscription_payments.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    payments, next_cursor = await fetch_page(db.subscription_payments, {}, {"_id": 0}, limit, cursor)
     
     # Eğer veri yoksa binaların abonelik durumlarını döndür
-    if not payments:
+    if not payments and not cursor:
         buildings = await db.buildings.find({}, {"_id": 0}).to_list(1000)
         payments = []
         for building in buildings:
@@ -1037,7 +1211,7 @@ async def get_subscription_payments(current_user: User = Depends(get_current_sup
                 "created_at": building.get("created_at")
             })
     
-    return payments
+    return page_response(payments, next_cursor, limit, cursor)
 
 @api_router.post("/subscription-payments")
 async def create_subscription_payment(data: dict, current_user: User = Depends(get_current_superadmin)):
@@ -1051,8 +1225,8 @@ async def create_subscription_payment(data: dict, current_user: User = Depends(g
         "period": data.get("period"),
         "amount": data.get("amount"),
         "status": data.get("status", "pending"),
-        "payment_date": data.get("payment_date"),
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "payment_date": as_datetime(data.get("payment_date")),
+        "created_at": datetime.now(timezone.utc)
     }
     
     await db.subscription_payments.insert_one(payment_doc)
@@ -1085,7 +1259,6 @@ async def create_subscription(plan_data: SubscriptionPlanCreate, current_user: U
     )
     
     plan_doc = new_plan.model_dump()
-    plan_doc['created_at'] = plan_doc['created_at'].isoformat()
     await db.subscription_plans.insert_one(plan_doc)
     
     return new_plan
@@ -1103,8 +1276,7 @@ async def update_subscription(plan_id: str, plan_data: SubscriptionPlanUpdate, c
     
     updated_plan = await db.subscription_plans.find_one({"id": plan_id}, {"_id": 0})
     
-    if isinstance(updated_plan.get('created_at'), str):
-        updated_plan['created_at'] = datetime.fromisoformat(updated_plan['created_at'])
+    decode_dates(updated_plan, 'created_at')
     
     return SubscriptionPlan(**updated_plan)
 
@@ -1119,64 +1291,54 @@ async def delete_subscription(plan_id: str, current_user: User = Depends(get_cur
 
 @api_router.get("/dashboard/stats", response_model=DashboardStats)
 async def get_dashboard_stats(current_user: User = Depends(get_current_superadmin)):
-    # Get building stats
-    all_buildings = await db.buildings.find({}, {"_id": 0}).to_list(1000)
-    total_buildings = len(all_buildings)
-    active_buildings = len([b for b in all_buildings if b.get('is_active', True)])
-    inactive_buildings = total_buildings - active_buildings
-    total_apartments = sum(b.get('apartment_count', 0) for b in all_buildings)
-    
-    # Get user count
-    total_users = await db.users.count_documents({})
-    
-    # Calculate revenue (mock for now)
-    total_revenue = 0.0
-    for building in all_buildings:
-        if building.get('subscription_status') == 'active':
-            total_revenue += 500.0  # Mock monthly revenue per building
-    
-    # Get recent buildings
-    recent = sorted(all_buildings, key=lambda x: x.get('created_at', ''), reverse=True)[:5]
+    cached = dashboard_cache.get(SUPERADMIN_DASHBOARD_KEY)
+    if cached is not None:
+        return cached
+    
+    # Bina istatistikleri tek $facet aggregation ile, kullanıcı sayısı paralel
+    stats, total_users = await asyncio.gather(
+        aggregate_superadmin_stats(db),
+        db.users.count_documents({})
+    )
+    
+    recent = stats["recent_buildings"]
     for building in recent:
-        if isinstance(building.get('created_at'), str):
-            building['created_at'] = datetime.fromisoformat(building['created_at'])
-        if isinstance(building.get('subscription_end_date'), str):
-            building['subscription_end_date'] = datetime.fromisoformat(building['subscription_end_date'])
-    
-    return DashboardStats(
-        total_buildings=total_buildings,
-        active_buildings=active_buildings,
-        inactive_buildings=inactive_buildings,
+        decode_dates(building, 'created_at', 'subscription_end_date')
+    
+    result = DashboardStats(
+        total_buildings=stats["total_buildings"],
+        active_buildings=stats["active_buildings"],
+        inactive_buildings=stats["inactive_buildings"],
         total_users=total_users,
-        total_apartments=total_apartments,
-        total_revenue=total_revenue,
+        total_apartments=stats["total_apartments"],
+        total_revenue=stats["total_revenue"],
         recent_buildings=[Building(**b) for b in recent]
     )
+    dashboard_cache.set(SUPERADMIN_DASHBOARD_KEY, result)
+    return result
 
 # ============ SETTINGS ROUTES ============
 
 @api_router.get("/settings", response_model=SystemSettings)
 async def get_settings(current_user: User = Depends(get_current_superadmin)):
-    settings = await db.system_settings.find_one({"id": "system_settings"}, {"_id": 0})
+    settings = await settings_registry.get(db, "system")
     if not settings:
         # Create default settings
         default_settings = SystemSettings(
             id="system_settings",
             updated_at=datetime.now(timezone.utc)
         )
-        settings_doc = default_settings.model_dump()
-        settings_doc['updated_at'] = settings_doc['updated_at'].isoformat()
-        await db.system_settings.insert_one(settings_doc)
+        await db.system_settings.insert_one(default_settings.model_dump())
+        await settings_registry.invalidate(db, "system")
         return default_settings
     
-    if isinstance(settings.get('updated_at'), str):
-        settings['updated_at'] = datetime.fromisoformat(settings['updated_at'])
+    decode_dates(settings, 'updated_at')
     
     return SystemSettings(**settings)
 
 @api_router.put("/settings", response_model=SystemSettings)
 async def update_settings(settings_data: dict, current_user: User = Depends(get_current_superadmin)):
-    settings_data['updated_at'] = datetime.now(timezone.utc).isoformat()
+    settings_data['updated_at'] = datetime.now(timezone.utc)
     settings_data['id'] = "system_settings"
     
     await db.system_settings.update_one(
@@ -1184,22 +1346,72 @@ async def update_settings(settings_data: dict, current_user: User = Depends(get_
         {"$set": settings_data},
         upsert=True
     )
+    await settings_registry.invalidate(db, "system")
     
-    updated_settings = await db.system_settings.find_one({"id": "system_settings"}, {"_id": 0})
+    updated_settings = await settings_registry.get(db, "system")
     
-    if isinstance(updated_settings.get('updated_at'), str):
-        updated_settings['updated_at'] = datetime.fromisoformat(updated_settings['updated_at'])
+    decode_dates(updated_settings, 'updated_at')
     
     return SystemSettings(**updated_settings)
 
+# ============ SYSTEM METRICS ROUTES ============
+
+@api_router.get("/system/metrics")
+async def get_system_metrics(current_user: User = Depends(get_current_superadmin)):
+    """Süreç içi önbellek ve servis metriklerini getir"""
+    return {
+        "principal_cache": principal_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "token_versions": token_versions.stats(),
+        "login_admission": login_admission.stats(),
+        "dashboard_cache": dashboard_cache.stats(),
+        "monthly_dues_cache": monthly_dues_cache.stats(),
+        "outbox": await outbox.queue_stats(),
+        "smtp_pool": smtp_pool.stats(),
+        "settings_registry": settings_registry.stats(),
+        "mail_template_cache": mail_template_cache.stats(),
+        "rate_limiter": rate_limiter.stats()
+    }
+
+@api_router.post("/system/building-counters/reconcile")
+async def reconcile_building_counters(building_id: Optional[str] = None, current_user: User = Depends(get_current_superadmin)):
+    """Bina sayaçlarını kaynak koleksiyonlardan yeniden hesapla"""
+    if building_id:
+        counters = await building_counters.rebuild(building_id)
+        return {"success": True, "rebuilt": 1, "counters": counters}
+    rebuilt = await building_counters.reconcile_all()
+    return {"success": True, "rebuilt": rebuilt}
+
+@api_router.post("/system/late-fees/run")
+async def run_late_fees(building_id: Optional[str] = None, current_user: User = Depends(get_current_superadmin)):
+    """Vadesi geçmiş borçların içinde bulunduğu dönemin gecikme zamlarını yaz (dönem başına idempotent)"""
+    report = await late_fee_job.run(building_id=building_id)
+    return {"success": True, **report}
+
+@api_router.get("/system/rate-limits")
+async def get_rate_limit_budget(current_user: User = Depends(get_current_superadmin)):
+    """Sağlayıcı / hesap başına anlık token, günlük ve aylık gönderim kullanımı"""
+    return await rate_limiter.budget()
+
+@api_router.get("/system/outbox/dead")
+async def get_outbox_dead_letters(limit: int = Query(50, ge=1, le=500), current_user: User = Depends(get_current_superadmin)):
+    """Deneme hakkı biten (dead-letter) bildirim işlerini listele"""
+    return await outbox.dead_letters(limit)
+
+@api_router.post("/system/outbox/{job_id}/retry")
+async def retry_outbox_job(job_id: str, current_user: User = Depends(get_current_superadmin)):
+    """Dead-letter işini yeniden kuyruğa al"""
+    if not await outbox.retry(job_id):
+        raise HTTPException(status_code=404, detail="Dead-letter işi bulunamadı")
+    return {"success": True, "message": "İş yeniden kuyruğa alındı"}
+
 # ============ BLOCK ROUTES (Building Admin) ============
 
 @api_router.get("/blocks", response_model=List[Block])
 async def get_blocks(current_user: User = Depends(get_current_building_admin)):
     blocks = await db.blocks.find({"building_id": current_user.building_id}, {"_id": 0}).to_list(1000)
     for block in blocks:
-        if isinstance(block.get('created_at'), str):
-            block['created_at'] = datetime.fromisoformat(block['created_at'])
+        decode_dates(block, 'created_at')
     return blocks
 
 
@@ -1210,8 +1422,7 @@ async def get_block_by_id(block_id: str):
     if not block:
         raise HTTPException(status_code=404, detail="Block not found")
     
-    if isinstance(block.get('created_at'), str):
-        block['created_at'] = datetime.fromisoformat(block['created_at'])
+    decode_dates(block, 'created_at')
     
     return Block(**block)
 
@@ -1231,11 +1442,39 @@ async def create_block(block_data: BlockCreate, current_user: User = Depends(get
     )
     
     block_doc = new_block.model_dump()
-    block_doc['created_at'] = block_doc['created_at'].isoformat()
     await db.blocks.insert_one(block_doc)
     
     return new_block
 
+@api_router.post("/blocks/bulk")
+async def create_blocks_bulk(data: BulkCreateRequest, current_user: User = Depends(get_current_building_admin)):
+    """Toplu blok oluştur (satır bazlı sonuç raporu döner)"""
+    report = BulkReport(len(data.items))
+    rows = [{"building_id": current_user.building_id, **item} for item in data.items]
+    blocks = validate_rows(rows, BlockCreate, report)
+    
+    for row, block in blocks:
+        if block.building_id != current_user.building_id:
+            report.error(row, "Cannot create block for another building")
+    mark_duplicates(blocks, lambda b: b.name, report, "Aynı blok adı listede birden fazla kez geçiyor")
+    
+    # Var olan blok adları tek sorguda
+    names = [block.name for row, block in blocks if not report.failed(row)]
+    existing_names = set(await db.blocks.distinct("name", {"building_id": current_user.building_id, "name": {"$in": names}}))
+    
+    now = datetime.now(timezone.utc)
+    docs = []
+    for row, block in blocks:
+        if report.failed(row):
+            continue
+        if block.name in existing_names:
+            report.error(row, f"'{block.name}' bloğu zaten mevcut")
+            continue
+        docs.append((row, Block(id=str(uuid.uuid4()), created_at=now, **block.model_dump()).model_dump()))
+    
+    await insert_rows(db.blocks, docs, report)
+    return report.as_dict()
+
 @api_router.put("/blocks/{block_id}", response_model=Block)
 async def update_block(block_id: str, block_data: BlockUpdate, current_user: User = Depends(get_current_building_admin)):
     existing_block = await db.blocks.find_one({"id": block_id, "building_id": current_user.building_id})
@@ -1249,8 +1488,7 @@ async def update_block(block_id: str, block_data: BlockUpdate, current_user: Use
     
     updated_block = await db.blocks.find_one({"id": block_id}, {"_id": 0})
     
-    if isinstance(updated_block.get('created_at'), str):
-        updated_block['created_at'] = datetime.fromisoformat(updated_block['created_at'])
+    decode_dates(updated_block, 'created_at')
     
     return Block(**updated_block)
 
@@ -1263,13 +1501,12 @@ async def delete_block(block_id: str, current_user: User = Depends(get_current_b
 
 # ============ APARTMENT ROUTES (Building Admin) ============
 
-@api_router.get("/apartments", response_model=List[Apartment])
-async def get_apartments(current_user: User = Depends(get_current_building_admin)):
-    apartments = await db.apartments.find({"building_id": current_user.building_id}, {"_id": 0}).to_list(1000)
+@api_router.get("/apartments", response_model=Union[List[Apartment], Page[Apartment]])
+async def get_apartments(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT), cursor: Optional[str] = None, current_user: User = Depends(get_current_building_admin)):
+    apartments, next_cursor = await fetch_page(db.apartments, {"building_id": current_user.building_id}, {"_id": 0}, limit, cursor)
     for apartment in apartments:
-        if isinstance(apartment.get('created_at'), str):
-            apartment['created_at'] = datetime.fromisoformat(apartment['created_at'])
-    return apartments
+        decode_dates(apartment, 'created_at')
+    return page_response(apartments, next_cursor, limit, cursor)
 
 
 @api_router.get("/apartments/{apartment_id}", response_model=Apartment)
@@ -1279,8 +1516,7 @@ async def get_apartment_by_id(apartment_id: str):
     if not apartment:
         raise HTTPException(status_code=404, detail="Apartment not found")
     
-    if isinstance(apartment.get('created_at'), str):
-        apartment['created_at'] = datetime.fromisoformat(apartment['created_at'])
+    decode_dates(apartment, 'created_at')
     
     return Apartment(**apartment)
 
@@ -1298,17 +1534,61 @@ async def create_apartment(apartment_data: ApartmentCreate, current_user: User =
         door_number=apartment_data.door_number,
         apartment_number=apartment_data.apartment_number,
         square_meters=apartment_data.square_meters,
+        land_share=apartment_data.land_share,
         room_count=apartment_data.room_count,
         status=apartment_data.status,
         created_at=datetime.now(timezone.utc)
     )
     
     apartment_doc = new_apartment.model_dump()
-    apartment_doc['created_at'] = apartment_doc['created_at'].isoformat()
     await db.apartments.insert_one(apartment_doc)
+    await building_counters.apply("apartment", new=apartment_doc)
     
     return new_apartment
 
+@api_router.post("/apartments/bulk")
+async def create_apartments_bulk(data: BulkCreateRequest, current_user: User = Depends(get_current_building_admin)):
+    """Toplu daire oluştur (satır bazlı sonuç raporu döner)"""
+    report = BulkReport(len(data.items))
+    rows = [{"building_id": current_user.building_id, **item} for item in data.items]
+    apartments = validate_rows(rows, ApartmentCreate, report)
+    
+    for row, apartment in apartments:
+        if apartment.building_id != current_user.building_id:
+            report.error(row, "Cannot create apartment for another building")
+    mark_duplicates(apartments, lambda a: a.apartment_number, report, "Aynı daire numarası listede birden fazla kez geçiyor")
+    
+    # Blok ve daire numarası kontrolleri tek $in sorgusu ile
+    candidates = [apartment for row, apartment in apartments if not report.failed(row)]
+    block_ids, existing_numbers = await asyncio.gather(
+        db.blocks.distinct("id", {
+            "building_id": current_user.building_id,
+            "id": {"$in": list({a.block_id for a in candidates})}
+        }),
+        db.apartments.distinct("apartment_number", {
+            "building_id": current_user.building_id,
+            "apartment_number": {"$in": [a.apartment_number for a in candidates]}
+        })
+    )
+    block_ids, existing_numbers = set(block_ids), set(existing_numbers)
+    
+    now = datetime.now(timezone.utc)
+    docs = []
+    for row, apartment in apartments:
+        if report.failed(row):
+            continue
+        if apartment.block_id not in block_ids:
+            report.error(row, "Blok bulunamadı")
+            continue
+        if apartment.apartment_number in existing_numbers:
+            report.error(row, f"'{apartment.apartment_number}' numaralı daire zaten mevcut")
+            continue
+        docs.append((row, Apartment(id=str(uuid.uuid4()), created_at=now, **apartment.model_dump()).model_dump()))
+    
+    inserted = await insert_rows(db.apartments, docs, report)
+    await building_counters.apply_many("apartment", inserted)
+    return report.as_dict()
+
 @api_router.put("/apartments/{apartment_id}", response_model=Apartment)
 async def update_apartment(apartment_id: str, apartment_data: ApartmentUpdate, current_user: User = Depends(get_current_building_admin)):
     existing_apartment = await db.apartments.find_one({"id": apartment_id, "building_id": current_user.building_id})
@@ -1321,32 +1601,28 @@ async def update_apartment(apartment_id: str, apartment_data: ApartmentUpdate, c
         await db.apartments.update_one({"id": apartment_id}, {"$set": update_data})
     
     updated_apartment = await db.apartments.find_one({"id": apartment_id}, {"_id": 0})
+    await building_counters.apply("apartment", existing_apartment, updated_apartment)
     
-    if isinstance(updated_apartment.get('created_at'), str):
-        updated_apartment['created_at'] = datetime.fromisoformat(updated_apartment['created_at'])
+    decode_dates(updated_apartment, 'created_at')
     
     return Apartment(**updated_apartment)
 
 @api_router.delete("/apartments/{apartment_id}")
 async def delete_apartment(apartment_id: str, current_user: User = Depends(get_current_building_admin)):
-    result = await db.apartments.delete_one({"id": apartment_id, "building_id": current_user.building_id})
-    if result.deleted_count == 0:
+    deleted = await db.apartments.find_one_and_delete({"id": apartment_id, "building_id": current_user.building_id})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Apartment not found")
+    await building_counters.apply("apartment", old=deleted)
     return {"message": "Apartment deleted successfully"}
 
 # ============ RESIDENT ROUTES (Building Admin) ============
 
-@api_router.get("/residents", response_model=List[Resident])
-async def get_residents(current_user: User = Depends(get_current_building_admin)):
-    residents = await db.residents.find({"building_id": current_user.building_id}, {"_id": 0, "hashed_password": 0}).to_list(1000)
+@api_router.get("/residents", response_model=Union[List[Resident], Page[Resident]])
+async def get_residents(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT), cursor: Optional[str] = None, current_user: User = Depends(get_current_building_admin)):
+    residents, next_cursor = await fetch_page(db.residents, {"building_id": current_user.building_id}, {"_id": 0, "hashed_password": 0}, limit, cursor)
     for resident in residents:
-        if isinstance(resident.get('created_at'), str):
-            resident['created_at'] = datetime.fromisoformat(resident['created_at'])
-        if isinstance(resident.get('move_in_date'), str):
-            resident['move_in_date'] = datetime.fromisoformat(resident['move_in_date'])
-        if resident.get('move_out_date') and isinstance(resident.get('move_out_date'), str):
-            resident['move_out_date'] = datetime.fromisoformat(resident['move_out_date'])
-    return residents
+        decode_dates(resident, 'created_at', 'move_in_date', 'move_out_date')
+    return page_response(residents, next_cursor, limit, cursor)
 
 @api_router.post("/residents", response_model=Resident)
 async def create_resident(resident_data: ResidentCreate, current_user: User = Depends(get_current_building_admin)):
@@ -1372,22 +1648,111 @@ async def create_resident(resident_data: ResidentCreate, current_user: User = De
         move_in_date=resident_data.move_in_date,
         move_out_date=resident_data.move_out_date,
         is_active=resident_data.is_active,
-        hashed_password=get_password_hash(resident_data.password),
+        hashed_password=await get_password_hash(resident_data.password),
         created_at=datetime.now(timezone.utc)
     )
     
     resident_doc = new_resident.model_dump()
-    resident_doc['created_at'] = resident_doc['created_at'].isoformat()
-    if resident_doc.get('move_in_date'):
-        resident_doc['move_in_date'] = resident_doc['move_in_date'].isoformat()
-    if resident_doc.get('move_out_date'):
-        resident_doc['move_out_date'] = resident_doc['move_out_date'].isoformat()
     
     await db.residents.insert_one(resident_doc)
+    await building_counters.apply("resident", new=resident_doc)
     
     # Return without password
     return Resident(**{k: v for k, v in new_resident.model_dump().items() if k != 'hashed_password'})
 
+@api_router.post("/residents/bulk")
+async def create_residents_bulk(data: BulkCreateRequest, current_user: User = Depends(get_current_building_admin)):
+    """Toplu sakin oluştur (satır bazlı sonuç raporu döner)"""
+    report = BulkReport(len(data.items))
+    rows = [{"building_id": current_user.building_id, **item} for item in data.items]
+    residents = validate_rows(rows, ResidentCreate, report)
+    
+    for row, resident in residents:
+        if resident.building_id != current_user.building_id:
+            report.error(row, "Cannot create resident for another building")
+    mark_duplicates(residents, lambda r: r.email, report, "Aynı e-posta listede birden fazla kez geçiyor")
+    
+    # E-posta ve daire kontrolleri tek $in sorgusu ile
+    candidates = [resident for row, resident in residents if not report.failed(row)]
+    existing_emails, apartment_ids = await asyncio.gather(
+        db.residents.distinct("email", {"email": {"$in": [r.email for r in candidates if r.email]}}),
+        db.apartments.distinct("id", {
+            "building_id": current_user.building_id,
+            "id": {"$in": list({r.apartment_id for r in candidates if r.apartment_id})}
+        })
+    )
+    existing_emails, apartment_ids = set(existing_emails), set(apartment_ids)
+    
+    accepted = []
+    for row, resident in residents:
+        if report.failed(row):
+            continue
+        if resident.email and resident.email in existing_emails:
+            report.error(row, "Email already registered")
+            continue
+        if resident.apartment_id and resident.apartment_id not in apartment_ids:
+            report.error(row, "Daire bulunamadı")
+            continue
+        accepted.append((row, resident))
+    
+    # bcrypt hash'leri worker havuzunda
+    hashed_passwords = await password_hasher.hash_many([resident.password for row, resident in accepted])
+    
+    now = datetime.now(timezone.utc)
+    docs = [
+        (row, ResidentInDB(
+            id=str(uuid.uuid4()),
+            created_at=now,
+            hashed_password=hashed_password,
+            **resident.model_dump(exclude={"password"})
+        ).model_dump())
+        for (row, resident), hashed_password in zip(accepted, hashed_passwords)
+    ]
+    
+    inserted = await insert_rows(db.residents, docs, report)
+    await building_counters.apply_many("resident", inserted)
+    return report.as_dict()
+
+resident_importer = ResidentImporter(db, password_hasher, building_counters, ResidentCreate, ResidentInDB)
+
+@api_router.post("/residents/import")
+async def import_residents(
+    file: UploadFile = File(...),
+    import_id: Optional[str] = Form(None),
+    default_password: Optional[str] = Form(None),
+    chunk_size: Optional[int] = Form(None, ge=1, le=BULK_MAX_ROWS),
+    current_user: User = Depends(get_current_building_admin)
+):
+    """CSV / XLSX sakin listesini içe aktar (aynı import_id ile kaldığı yerden devam eder)"""
+    filename = file.filename or ""
+    if not filename.lower().endswith((".csv", ".txt", ".xlsx", ".xlsm")):
+        raise HTTPException(status_code=400, detail="Yalnızca CSV veya XLSX dosyaları desteklenir")
+    
+    import_id = import_id or str(uuid.uuid4())
+    try:
+        return await resident_importer.run(
+            file.file,
+            filename,
+            current_user.building_id,
+            current_user.id,
+            import_id=import_id,
+            default_password=default_password,
+            chunk_size=chunk_size
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Resident import error: {e}")
+        raise HTTPException(status_code=500, detail=f"İçe aktarma yarıda kaldı, import_id={import_id} ile tekrar deneyin: {str(e)}")
+
+@api_router.get("/residents/import/{import_id}")
+async def get_resident_import(import_id: str, current_user: User = Depends(get_current_building_admin)):
+    """İçe aktarma ilerlemesi"""
+    job = await resident_importer.get(import_id, current_user.building_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="İçe aktarma bulunamadı")
+    return job
+
 @api_router.put("/residents/{resident_id}", response_model=Resident)
 async def update_resident(resident_id: str, resident_data: ResidentUpdate, current_user: User = Depends(get_current_building_admin)):
     existing_resident = await db.residents.find_one({"id": resident_id, "building_id": current_user.building_id})
@@ -1398,49 +1763,39 @@ async def update_resident(resident_id: str, resident_data: ResidentUpdate, curre
     
     # Hash password if provided
     if 'password' in update_data:
-        update_data['hashed_password'] = get_password_hash(update_data['password'])
+        update_data['hashed_password'] = await get_password_hash(update_data['password'])
         del update_data['password']
     
-    # Convert datetime fields
-    if 'move_in_date' in update_data and update_data['move_in_date']:
-        update_data['move_in_date'] = update_data['move_in_date'].isoformat()
-    if 'move_out_date' in update_data and update_data['move_out_date']:
-        update_data['move_out_date'] = update_data['move_out_date'].isoformat()
-    
     if update_data:
         await db.residents.update_one({"id": resident_id}, {"$set": update_data})
+    principal_cache.invalidate("resident", resident_id)
     
     updated_resident = await db.residents.find_one({"id": resident_id}, {"_id": 0, "hashed_password": 0})
+    await token_versions.bump(resident_id, "resident", is_active=updated_resident.get("is_active", True))
+    await building_counters.apply("resident", existing_resident, updated_resident)
     
-    if isinstance(updated_resident.get('created_at'), str):
-        updated_resident['created_at'] = datetime.fromisoformat(updated_resident['created_at'])
-    if isinstance(updated_resident.get('move_in_date'), str):
-        updated_resident['move_in_date'] = datetime.fromisoformat(updated_resident['move_in_date'])
-    if updated_resident.get('move_out_date') and isinstance(updated_resident.get('move_out_date'), str):
-        updated_resident['move_out_date'] = datetime.fromisoformat(updated_resident['move_out_date'])
+    decode_dates(updated_resident, 'created_at', 'move_in_date', 'move_out_date')
     
     return Resident(**updated_resident)
 
 @api_router.delete("/residents/{resident_id}")
 async def delete_resident(resident_id: str, current_user: User = Depends(get_current_building_admin)):
-    result = await db.residents.delete_one({"id": resident_id, "building_id": current_user.building_id})
-    if result.deleted_count == 0:
+    deleted = await db.residents.find_one_and_delete({"id": resident_id, "building_id": current_user.building_id})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Resident not found")
+    await building_counters.apply("resident", old=deleted)
+    principal_cache.invalidate("resident", resident_id)
+    await token_versions.bump(resident_id, "resident", is_active=False)
     return {"message": "Resident deleted successfully"}
 
 # ============ DUE ROUTES (Building Admin) ============
 
-@api_router.get("/dues", response_model=List[Due])
-async def get_dues(current_user: User = Depends(get_current_building_admin)):
-    dues = await db.dues.find({"building_id": current_user.building_id}, {"_id": 0}).to_list(1000)
+@api_router.get("/dues", response_model=Union[List[Due], Page[Due]])
+async def get_dues(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT), cursor: Optional[str] = None, current_user: User = Depends(get_current_building_admin)):
+    dues, next_cursor = await fetch_page(db.dues, {"building_id": current_user.building_id}, {"_id": 0}, limit, cursor)
     for due in dues:
-        if isinstance(due.get('created_at'), str):
-            due['created_at'] = datetime.fromisoformat(due['created_at'])
-        if isinstance(due.get('due_date'), str):
-            due['due_date'] = datetime.fromisoformat(due['due_date'])
-        if due.get('paid_date') and isinstance(due.get('paid_date'), str):
-            due['paid_date'] = datetime.fromisoformat(due['paid_date'])
-    return dues
+        decode_dates(due, 'created_at', 'due_date', 'paid_date')
+    return page_response(dues, next_cursor, limit, cursor)
 
 @api_router.post("/dues", response_model=Due)
 async def create_due(due_data: DueCreate, current_user: User = Depends(get_current_building_admin)):
@@ -1461,11 +1816,11 @@ async def create_due(due_data: DueCreate, current_user: User = Depends(get_curre
         created_at=datetime.now(timezone.utc)
     )
     
-    due_doc = new_due.model_dump()
-    due_doc['created_at'] = due_doc['created_at'].isoformat()
-    due_doc['due_date'] = due_doc['due_date'].isoformat()
+    # monthly_due_id yazılmaz: tanımdan üretilen aidatların tekil index'i yalnızca dolu değerleri kapsar
+    due_doc = new_due.model_dump(exclude={"monthly_due_id"})
     
     await db.dues.insert_one(due_doc)
+    await building_counters.apply("due", new=due_doc)
     
     return new_due
 
@@ -1477,52 +1832,41 @@ async def update_due(due_id: str, due_data: DueUpdate, current_user: User = Depe
     
     update_data = {k: v for k, v in due_data.model_dump().items() if v is not None}
     
-    # Convert datetime fields
-    if 'due_date' in update_data and update_data['due_date']:
-        update_data['due_date'] = update_data['due_date'].isoformat()
-    if 'paid_date' in update_data and update_data['paid_date']:
-        update_data['paid_date'] = update_data['paid_date'].isoformat()
-    
     if update_data:
         await db.dues.update_one({"id": due_id}, {"$set": update_data})
     
     updated_due = await db.dues.find_one({"id": due_id}, {"_id": 0})
+    await building_counters.apply("due", existing_due, updated_due)
     
-    if isinstance(updated_due.get('created_at'), str):
-        updated_due['created_at'] = datetime.fromisoformat(updated_due['created_at'])
-    if isinstance(updated_due.get('due_date'), str):
-        updated_due['due_date'] = datetime.fromisoformat(updated_due['due_date'])
-    if updated_due.get('paid_date') and isinstance(updated_due.get('paid_date'), str):
-        updated_due['paid_date'] = datetime.fromisoformat(updated_due['paid_date'])
+    decode_dates(updated_due, 'created_at', 'due_date', 'paid_date')
     
     return Due(**updated_due)
 
 @api_router.delete("/dues/{due_id}")
 async def delete_due(due_id: str, current_user: User = Depends(get_current_building_admin)):
-    result = await db.dues.delete_one({"id": due_id, "building_id": current_user.building_id})
-    if result.deleted_count == 0:
+    deleted = await db.dues.find_one_and_delete({"id": due_id, "building_id": current_user.building_id})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Due not found")
+    await building_counters.apply("due", old=deleted)
     return {"message": "Due deleted successfully"}
 
 # ============ MONTHLY DUE DEFINITION ROUTES (Aylık Aidat Tanımı) ============
 
 @api_router.get("/monthly-dues")
-async def get_monthly_dues(current_user: User = Depends(get_current_building_admin)):
+async def get_monthly_dues(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT), cursor: Optional[str] = None, current_user: User = Depends(get_current_building_admin)):
     """Aylık aidat tanımlarını listele"""
-    monthly_dues = await db.monthly_dues.find(
-        {"building_id": current_user.building_id}, 
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
+    monthly_dues, next_cursor = await fetch_page(
+        db.monthly_dues,
+        {"building_id": current_user.building_id},
+        {"_id": 0},
+        limit,
+        cursor
+    )
     
     for md in monthly_dues:
-        if isinstance(md.get('created_at'), str):
-            md['created_at'] = datetime.fromisoformat(md['created_at'])
-        if isinstance(md.get('due_date'), str):
-            md['due_date'] = datetime.fromisoformat(md['due_date'])
-        if md.get('sent_at') and isinstance(md.get('sent_at'), str):
-            md['sent_at'] = datetime.fromisoformat(md['sent_at'])
+        decode_dates(md, 'created_at', 'due_date', 'sent_at')
     
-    return monthly_dues
+    return page_response(monthly_dues, next_cursor, limit, cursor)
 
 @api_router.get("/monthly-dues/{monthly_due_id}")
 async def get_monthly_due(monthly_due_id: str, current_user: User = Depends(get_current_building_admin)):
@@ -1534,10 +1878,7 @@ async def get_monthly_due(monthly_due_id: str, current_user: User = Depends(get_
     if not monthly_due:
         raise HTTPException(status_code=404, detail="Aidat tanımı bulunamadı")
     
-    if isinstance(monthly_due.get('created_at'), str):
-        monthly_due['created_at'] = datetime.fromisoformat(monthly_due['created_at'])
-    if isinstance(monthly_due.get('due_date'), str):
-        monthly_due['due_date'] = datetime.fromisoformat(monthly_due['due_date'])
+    decode_dates(monthly_due, 'created_at', 'due_date')
     
     return monthly_due
 
@@ -1555,63 +1896,163 @@ async def create_monthly_due(data: MonthlyDueDefinitionCreate, current_user: Use
     if existing:
         raise HTTPException(status_code=400, detail=f"'{data.month}' için zaten aidat tanımı mevcut")
     
+    # Arsa payı / m² / blok bazlı gider kalemleri daire bazında dağıtılır
+    expense_items = [item.model_dump() for item in data.expense_items]
+    try:
+        amounts = await apartment_amounts(db, {"building_id": data.building_id, "expense_items": expense_items})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     monthly_due_id = str(uuid.uuid4())
     monthly_due_doc = {
         "id": monthly_due_id,
         "building_id": data.building_id,
         "month": data.month,
-        "expense_items": [item.model_dump() for item in data.expense_items],
+        "expense_items": expense_items,
         "total_amount": data.total_amount,
         "per_apartment_amount": data.per_apartment_amount,
-        "due_date": data.due_date.isoformat(),
+        "due_date": data.due_date,
         "is_sent": False,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": datetime.now(timezone.utc),
         "sent_at": None
     }
     
-    await db.monthly_dues.insert_one(monthly_due_doc)
+    # Tanım ve binadaki her dairenin defter borcu tek transaction'da yazılır
+    apartment_ids = await db.apartments.distinct("id", {"building_id": data.building_id})
+    
+    async def write_definition(session):
+        await db.monthly_dues.insert_one(dict(monthly_due_doc), session=session)
+        await apartment_ledger.charge_monthly_due(monthly_due_doc, apartment_ids, amounts, session=session)
+    
+    await apartment_ledger.transaction(write_definition)
+    monthly_dues_cache.invalidate(data.building_id)
     
     return {"success": True, "id": monthly_due_id, "message": "Aidat tanımı oluşturuldu"}
 
+@api_router.post("/monthly-dues/allocation-preview")
+async def preview_due_allocation(data: AllocationPreviewRequest, current_user: User = Depends(get_current_building_admin)):
+    """Gider kalemlerinin daire bazlı dağıtım önizlemesi (kayıt yazmaz)"""
+    expense_items = [item.model_dump() for item in data.expense_items]
+    apartments = await load_allocation_apartments(db, current_user.building_id)
+    try:
+        matrix = allocate(apartments, expense_items)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return allocation_report(apartments, expense_items, matrix)
+
+@api_router.post("/monthly-dues/{monthly_due_id}/generate-dues")
+async def generate_dues_from_monthly_due(monthly_due_id: str, current_user: User = Depends(get_current_building_admin)):
+    """Aidat tanımından dolu her daire için aidat kaydı üret (tekrar çalıştırılabilir)"""
+    monthly_due = await db.monthly_dues.find_one(
+        {"id": monthly_due_id, "building_id": current_user.building_id},
+        {"_id": 0}
+    )
+    if not monthly_due:
+        raise HTTPException(status_code=404, detail="Aidat tanımı bulunamadı")
+    
+    try:
+        amounts = await apartment_amounts(db, monthly_due)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    report, inserted = await due_generator.generate(monthly_due, amounts)
+    await building_counters.apply_many("due", inserted)
+    
+    return {"success": True, **report}
+
 @api_router.put("/monthly-dues/{monthly_due_id}")
-async def update_monthly_due(monthly_due_id: str, data: dict, current_user: User = Depends(get_current_building_admin)):
-    """Aylık aidat tanımını güncelle"""
+async def update_monthly_due(monthly_due_id: str, data: MonthlyDueDefinitionUpdate, current_user: User = Depends(get_current_building_admin)):
+    """Aylık aidat tanımını güncelle (tutar / vade değişirse daire borçları yeniden yazılır)"""
     existing = await db.monthly_dues.find_one({
         "id": monthly_due_id, 
         "building_id": current_user.building_id
-    })
+    }, {"_id": 0})
     if not existing:
         raise HTTPException(status_code=404, detail="Aidat tanımı bulunamadı")
     
-    # due_date'i isoformat'a çevir
-    if 'due_date' in data and data['due_date']:
-        if isinstance(data['due_date'], str):
-            data['due_date'] = data['due_date']
-        else:
-            data['due_date'] = data['due_date'].isoformat()
+    update_data = {k: v for k, v in data.model_dump().items() if v is not None}
+    if not update_data:
+        raise HTTPException(status_code=400, detail="Güncellenecek alan yok")
+    
+    # due_date'i BSON date olarak sakla
+    if update_data.get('due_date'):
+        update_data['due_date'] = as_datetime(update_data['due_date'])
+    
+    month = update_data.get("month")
+    if month and month != existing.get("month"):
+        if await db.monthly_dues.find_one({"building_id": current_user.building_id, "month": month}, {"_id": 1}):
+            raise HTTPException(status_code=400, detail=f"'{month}' için zaten aidat tanımı mevcut")
+    
+    updated = {**existing, **update_data}
+    reprice = any(updated.get(field) != existing.get(field) for field in MONTHLY_DUE_REPRICING_FIELDS)
+    
+    amounts = None
+    apartment_ids: List[str] = []
+    # Ödenmemiş aidat kayıtları: güncelleme öncesi / sonrası (sayaç farkı için)
+    repriced: Dict[str, List[dict]] = {"old": [], "new": []}
+    if reprice:
+        # Ödeme alınmış tanımın tutarı / vadesi değişirse tahsilat ile borç ayrışır
+        if await db.due_payments.find_one({"monthly_due_id": monthly_due_id, "status": "paid"}, {"_id": 1}):
+            raise HTTPException(status_code=409, detail="Ödeme alınmış aidatın tutarı veya son ödeme tarihi değiştirilemez")
+        try:
+            amounts = await apartment_amounts(db, updated)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        apartment_ids = await db.apartments.distinct("id", {"building_id": current_user.building_id})
+    
+    async def write_update(session):
+        await db.monthly_dues.update_one({"id": monthly_due_id}, {"$set": update_data}, session=session)
+        if month and month != existing.get("month"):
+            await db.dues.update_many(
+                {"monthly_due_id": monthly_due_id},
+                {"$set": {"month": month, "description": f"{month} aidatı"}},
+                session=session
+            )
+        if reprice:
+            await apartment_ledger.repost_monthly_due(updated, apartment_ids, amounts, session=session)
+            repriced["old"], repriced["new"] = await due_generator.reprice(updated, amounts, session=session)
     
-    await db.monthly_dues.update_one(
-        {"id": monthly_due_id},
-        {"$set": data}
-    )
+    await apartment_ledger.transaction(write_update)
+    monthly_dues_cache.invalidate(current_user.building_id)
+    await building_counters.apply_many("due", repriced["new"], old=repriced["old"])
+    # Gönderilmiş aidat akışta görünür; tutar / ay değiştiyse kayıt güncellenir
+    if existing.get("is_sent"):
+        await notification_timeline.append(monthly_due_entry(updated))
     
-    return {"success": True, "message": "Aidat tanımı güncellendi"}
+    return {"success": True, "message": "Aidat tanımı güncellendi", "reposted": reprice}
 
 @api_router.delete("/monthly-dues/{monthly_due_id}")
 async def delete_monthly_due(monthly_due_id: str, current_user: User = Depends(get_current_building_admin)):
-    """Aylık aidat tanımını sil"""
-    result = await db.monthly_dues.delete_one({
-        "id": monthly_due_id,
-        "building_id": current_user.building_id
-    })
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Aidat tanımı bulunamadı")
+    """Aylık aidat tanımını, üretilmiş aidat kayıtlarını ve açık defter borçlarını sil"""
+    removed_dues: List[dict] = []
+    
+    async def delete_definition(session):
+        nonlocal removed_dues
+        result = await db.monthly_dues.delete_one({
+            "id": monthly_due_id,
+            "building_id": current_user.building_id
+        }, session=session)
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=404, detail="Aidat tanımı bulunamadı")
+        removed_dues = await db.dues.find(
+            {"monthly_due_id": monthly_due_id, "building_id": current_user.building_id}, {"_id": 0}, session=session
+        ).to_list(None)
+        if removed_dues:
+            await db.dues.delete_many(
+                {"monthly_due_id": monthly_due_id, "building_id": current_user.building_id}, session=session
+            )
+        await apartment_ledger.reverse_monthly_due(monthly_due_id, session=session)
+    
+    await apartment_ledger.transaction(delete_definition)
+    monthly_dues_cache.invalidate(current_user.building_id)
+    await building_counters.apply_many("due", old=removed_dues)
+    await notification_timeline.remove("dues", monthly_due_id)
     
     return {"success": True, "message": "Aidat tanımı silindi"}
 
 @api_router.post("/monthly-dues/{monthly_due_id}/send-mail")
 async def send_monthly_due_mail(monthly_due_id: str, current_user: User = Depends(get_current_building_admin)):
-    """Aylık aidat bildirimini tüm sakinlere mail olarak gönder"""
+    """Aylık aidat bildirimini tüm sakinler için mail kuyruğuna al"""
     # Aidat tanımını getir
     monthly_due = await db.monthly_dues.find_one({
         "id": monthly_due_id,
@@ -1620,8 +2061,10 @@ async def send_monthly_due_mail(monthly_due_id: str, current_user: User = Depend
     if not monthly_due:
         raise HTTPException(status_code=404, detail="Aidat tanımı bulunamadı")
     
+    loaders = RequestLoaders(db)
+    
     # Bina bilgisini getir
-    building = await db.buildings.find_one({"id": current_user.building_id}, {"_id": 0})
+    building = await loaders.buildings.load(current_user.building_id)
     building_name = building.get("name", "Bina") if building else "Bina"
     
     # Aktif sakinleri getir
@@ -1633,72 +2076,64 @@ async def send_monthly_due_mail(monthly_due_id: str, current_user: User = Depend
     if not residents:
         return {"success": False, "message": "Mail adresi olan aktif sakin bulunamadı", "sent_count": 0}
     
-    # Mail service'i import et
-    from routes.mail_service import MailService
-    mail_service = MailService(db)
+    # Sakinlerin dairelerini ve daire bazlı aidat tutarlarını tek sorguda önceden yükle
+    apartment_ids = list({r["apartment_id"] for r in residents if r.get("apartment_id")})
+    await loaders.apartments.load_many(apartment_ids)
+    charge_amounts = await apartment_ledger.charge_amounts(monthly_due_id, apartment_ids)
     
     # Gider kalemleri HTML tablosu oluştur
     expense_html = ""
     for item in monthly_due.get("expense_items", []):
         expense_html += f'<tr><td>{item["name"]}</td><td style="text-align: right;">₺{item["amount"]:,.2f}</td></tr>'
     
-    sent_count = 0
-    failed_count = 0
+    due_date = as_datetime(monthly_due.get("due_date"))
+    due_date_str = due_date.strftime("%d.%m.%Y") if due_date else ""
     
+    # Her sakin için bir mail işi; gönderimi outbox worker'ı yapar
+    jobs = []
     for resident in residents:
-        if resident.get("email"):
-            try:
-                # Daire bilgisini getir
-                apartment_no = "-"
-                if resident.get("apartment_id"):
-                    apartment = await db.apartments.find_one(
-                        {"id": resident["apartment_id"]},
-                        {"_id": 0, "apartment_number": 1}
-                    )
-                    if apartment:
-                        apartment_no = apartment.get("apartment_number", "-")
-                
-                # Due date format
-                due_date_str = monthly_due.get("due_date", "")
-                if isinstance(due_date_str, str):
-                    try:
-                        due_date_obj = datetime.fromisoformat(due_date_str.replace('Z', '+00:00'))
-                        due_date_str = due_date_obj.strftime("%d.%m.%Y")
-                    except:
-                        pass
-                
-                await mail_service.send_with_template(
-                    to=[resident["email"]],
-                    template_name="dues_notification",
-                    variables={
-                        "user_name": resident.get("full_name", "Sakin"),
-                        "building_name": building_name,
-                        "month": monthly_due.get("month", ""),
-                        "amount": f"₺{monthly_due.get('per_apartment_amount', 0):,.2f}",
-                        "due_date": due_date_str,
-                        "expense_details": expense_html,
-                        "apartment_no": apartment_no,
-                        "previous_balance": "₺0",
-                        "total_amount": f"₺{monthly_due.get('per_apartment_amount', 0):,.2f}"
-                    }
-                )
-                sent_count += 1
-            except Exception as e:
-                print(f"Mail error for {resident['email']}: {e}")
-                failed_count += 1
+        if not resident.get("email"):
+            continue
+        apartment = await loaders.apartments.load(resident.get("apartment_id"))
+        apartment_no = apartment.get("apartment_number", "-") if apartment else "-"
+        amount = charge_amounts.get(resident.get("apartment_id"), monthly_due.get("per_apartment_amount", 0))
+        jobs.append(outbox.job(
+            "template_mail",
+            {
+                "to": [resident["email"]],
+                "template_name": "dues_notification",
+                "variables": {
+                    "user_name": resident.get("full_name", "Sakin"),
+                    "building_name": building_name,
+                    "month": monthly_due.get("month", ""),
+                    "amount": f"₺{amount:,.2f}",
+                    "due_date": due_date_str,
+                    "expense_details": expense_html,
+                    "apartment_no": apartment_no,
+                    "previous_balance": "₺0",
+                    "total_amount": f"₺{amount:,.2f}"
+                }
+            },
+            lane="bulk",
+            building_id=current_user.building_id
+        ))
+    sent_count = await outbox.enqueue_many(jobs)
     
     # is_sent ve sent_at güncelle
     if sent_count > 0:
+        sent_at = datetime.now(timezone.utc)
         await db.monthly_dues.update_one(
             {"id": monthly_due_id},
-            {"$set": {"is_sent": True, "sent_at": datetime.now(timezone.utc).isoformat()}}
+            {"$set": {"is_sent": True, "sent_at": sent_at}}
         )
+        monthly_dues_cache.invalidate(current_user.building_id)
+        await notification_timeline.append(monthly_due_entry({**monthly_due, "sent_at": sent_at}))
     
     return {
         "success": True,
-        "message": f"{sent_count} sakin'e mail gönderildi",
+        "message": f"{sent_count} sakin için mail gönderim kuyruğuna alındı",
         "sent_count": sent_count,
-        "failed_count": failed_count
+        "queued_count": sent_count
     }
 
 # ============ BUILDING MANAGER MAIL TEMPLATES ============
@@ -1764,10 +2199,11 @@ async def update_building_manager_mail_template(
             "name": template_name,
             "subject": data.get("subject"),
             "body": data.get("body"),
-            "updated_at": datetime.now(timezone.utc).isoformat()
+            "updated_at": datetime.now(timezone.utc)
         }},
         upsert=True
     )
+    await mail_template_cache.invalidate(db, current_user.building_id)
     
     return {"success": True, "message": "Şablon güncellendi"}
 
@@ -1784,6 +2220,7 @@ async def reset_building_manager_mail_template(
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Özel şablon bulunamadı")
+    await mail_template_cache.invalidate(db, current_user.building_id)
     
     return {"success": True, "message": "Şablon varsayılana sıfırlandı"}
 
@@ -1798,10 +2235,7 @@ async def get_surveys(current_user: User = Depends(get_current_building_admin)):
     ).sort("created_at", -1).to_list(100)
     
     for survey in surveys:
-        if isinstance(survey.get('created_at'), str):
-            survey['created_at'] = datetime.fromisoformat(survey['created_at'])
-        if isinstance(survey.get('end_date'), str):
-            survey['end_date'] = datetime.fromisoformat(survey['end_date'])
+        decode_dates(survey, 'created_at', 'end_date')
     
     return surveys
 
@@ -1831,7 +2265,7 @@ async def create_survey(data: dict, current_user: User = Depends(get_current_bui
         "status": data.get("status", "active"),
         "created_by": current_user.id,
         "responses": 0,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
     
     await db.surveys.insert_one(survey_doc)
@@ -1872,10 +2306,7 @@ async def get_votings(current_user: User = Depends(get_current_building_admin)):
     ).sort("created_at", -1).to_list(100)
     
     for voting in votings:
-        if isinstance(voting.get('created_at'), str):
-            voting['created_at'] = datetime.fromisoformat(voting['created_at'])
-        if isinstance(voting.get('end_date'), str):
-            voting['end_date'] = datetime.fromisoformat(voting['end_date'])
+        decode_dates(voting, 'created_at', 'end_date')
     
     return votings
 
@@ -1905,7 +2336,7 @@ async def create_voting(data: dict, current_user: User = Depends(get_current_bui
         "yes_votes": 0,
         "no_votes": 0,
         "abstain_votes": 0,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
     
     await db.votings.insert_one(voting_doc)
@@ -1966,10 +2397,7 @@ async def get_meetings(current_user: User = Depends(get_current_building_admin))
     ).sort("date", -1).to_list(100)
     
     for meeting in meetings:
-        if isinstance(meeting.get('created_at'), str):
-            meeting['created_at'] = datetime.fromisoformat(meeting['created_at'])
-        if isinstance(meeting.get('date'), str):
-            meeting['date'] = datetime.fromisoformat(meeting['date'])
+        decode_dates(meeting, 'created_at', 'date')
     
     return meetings
 
@@ -2004,7 +2432,7 @@ async def create_meeting(data: dict, current_user: User = Depends(get_current_bu
         "duration_minutes": data.get("duration_minutes", 60),
         "attendees": [],
         "notes": None,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
     
     await db.meetings.insert_one(meeting_doc)
@@ -2045,10 +2473,7 @@ async def get_decisions(current_user: User = Depends(get_current_building_admin)
     ).sort("decision_date", -1).to_list(100)
     
     for decision in decisions:
-        if isinstance(decision.get('created_at'), str):
-            decision['created_at'] = datetime.fromisoformat(decision['created_at'])
-        if isinstance(decision.get('decision_date'), str):
-            decision['decision_date'] = datetime.fromisoformat(decision['decision_date'])
+        decode_dates(decision, 'created_at', 'decision_date')
     
     return decisions
 
@@ -2077,7 +2502,7 @@ async def create_decision(data: dict, current_user: User = Depends(get_current_b
         "decision_date": data.get("decision_date"),
         "decision_number": data.get("decision_number"),
         "created_by": current_user.id,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
     
     await db.decisions.insert_one(decision_doc)
@@ -2109,13 +2534,12 @@ async def delete_decision(decision_id: str, current_user: User = Depends(get_cur
 
 # ============ ANNOUNCEMENT ROUTES (Building Admin) ============
 
-@api_router.get("/announcements", response_model=List[Announcement])
-async def get_announcements(current_user: User = Depends(get_current_building_admin)):
-    announcements = await db.announcements.find({"building_id": current_user.building_id}, {"_id": 0}).to_list(1000)
+@api_router.get("/announcements", response_model=Union[List[Announcement], Page[Announcement]])
+async def get_announcements(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT), cursor: Optional[str] = None, current_user: User = Depends(get_current_building_admin)):
+    announcements, next_cursor = await fetch_page(db.announcements, {"building_id": current_user.building_id}, {"_id": 0}, limit, cursor)
     for announcement in announcements:
-        if isinstance(announcement.get('created_at'), str):
-            announcement['created_at'] = datetime.fromisoformat(announcement['created_at'])
-    return announcements
+        decode_dates(announcement, 'created_at')
+    return page_response(announcements, next_cursor, limit, cursor)
 
 @api_router.post("/announcements", response_model=Announcement)
 async def create_announcement(announcement_data: AnnouncementCreate, current_user: User = Depends(get_current_building_admin)):
@@ -2134,8 +2558,8 @@ async def create_announcement(announcement_data: AnnouncementCreate, current_use
     )
     
     announcement_doc = new_announcement.model_dump()
-    announcement_doc['created_at'] = announcement_doc['created_at'].isoformat()
     await db.announcements.insert_one(announcement_doc)
+    await notification_timeline.sync_announcement(announcement_doc)
     
     return new_announcement
 
@@ -2151,9 +2575,9 @@ async def update_announcement(announcement_id: str, announcement_data: Announcem
         await db.announcements.update_one({"id": announcement_id}, {"$set": update_data})
     
     updated_announcement = await db.announcements.find_one({"id": announcement_id}, {"_id": 0})
+    await notification_timeline.sync_announcement(updated_announcement)
     
-    if isinstance(updated_announcement.get('created_at'), str):
-        updated_announcement['created_at'] = datetime.fromisoformat(updated_announcement['created_at'])
+    decode_dates(updated_announcement, 'created_at')
     
     return Announcement(**updated_announcement)
 
@@ -2162,19 +2586,17 @@ async def delete_announcement(announcement_id: str, current_user: User = Depends
     result = await db.announcements.delete_one({"id": announcement_id, "building_id": current_user.building_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Announcement not found")
+    await notification_timeline.remove("announcement", announcement_id)
     return {"message": "Announcement deleted successfully"}
 
 # ============ REQUEST ROUTES (Building Admin) ============
 
-@api_router.get("/requests", response_model=List[Request])
-async def get_requests(current_user: User = Depends(get_current_building_admin)):
-    requests = await db.requests.find({"building_id": current_user.building_id}, {"_id": 0}).to_list(1000)
+@api_router.get("/requests", response_model=Union[List[Request], Page[Request]])
+async def get_requests(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT), cursor: Optional[str] = None, current_user: User = Depends(get_current_building_admin)):
+    requests, next_cursor = await fetch_page(db.requests, {"building_id": current_user.building_id}, {"_id": 0}, limit, cursor)
     for request in requests:
-        if isinstance(request.get('created_at'), str):
-            request['created_at'] = datetime.fromisoformat(request['created_at'])
-        if request.get('resolved_at') and isinstance(request.get('resolved_at'), str):
-            request['resolved_at'] = datetime.fromisoformat(request['resolved_at'])
-    return requests
+        decode_dates(request, 'created_at', 'resolved_at')
+    return page_response(requests, next_cursor, limit, cursor)
 
 @api_router.post("/requests", response_model=Request)
 async def create_request(request_data: RequestCreate, current_user: User = Depends(get_current_building_admin)):
@@ -2197,8 +2619,8 @@ async def create_request(request_data: RequestCreate, current_user: User = Depen
     )
     
     request_doc = new_request.model_dump()
-    request_doc['created_at'] = request_doc['created_at'].isoformat()
     await db.requests.insert_one(request_doc)
+    await building_counters.apply("request", new=request_doc)
     
     return new_request
 
@@ -2212,103 +2634,50 @@ async def update_request(request_id: str, request_data: RequestUpdate, current_u
     
     # If status is being changed to resolved, set resolved_at
     if update_data.get('status') == 'resolved' and not existing_request.get('resolved_at'):
-        update_data['resolved_at'] = datetime.now(timezone.utc).isoformat()
+        update_data['resolved_at'] = datetime.now(timezone.utc)
     
     if update_data:
         await db.requests.update_one({"id": request_id}, {"$set": update_data})
     
     updated_request = await db.requests.find_one({"id": request_id}, {"_id": 0})
+    await building_counters.apply("request", existing_request, updated_request)
     
-    if isinstance(updated_request.get('created_at'), str):
-        updated_request['created_at'] = datetime.fromisoformat(updated_request['created_at'])
-    if updated_request.get('resolved_at') and isinstance(updated_request.get('resolved_at'), str):
-        updated_request['resolved_at'] = datetime.fromisoformat(updated_request['resolved_at'])
+    decode_dates(updated_request, 'created_at', 'resolved_at')
     
     return Request(**updated_request)
 
 @api_router.delete("/requests/{request_id}")
 async def delete_request(request_id: str, current_user: User = Depends(get_current_building_admin)):
-    result = await db.requests.delete_one({"id": request_id, "building_id": current_user.building_id})
-    if result.deleted_count == 0:
+    deleted = await db.requests.find_one_and_delete({"id": request_id, "building_id": current_user.building_id})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Request not found")
+    await building_counters.apply("request", old=deleted)
     return {"message": "Request deleted successfully"}
 
 # ============ RESIDENT NOTIFICATIONS (Mobile App) ============
 
 @api_router.get("/residents/notifications")
-async def get_resident_notifications(current_resident: Resident = Depends(get_current_resident)):
-    """Sakin'in tüm bildirimlerini getir (duyurular, durum değişiklikleri, vb.)"""
-    notifications = []
-    
-    # 1. Duyuruları al
-    announcements = await db.announcements.find(
-        {"building_id": current_resident.building_id, "is_active": True},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(20)
-    
-    for ann in announcements:
-        notifications.append({
-            "id": ann.get("id"),
-            "type": "announcement",
-            "category": ann.get("category", "general"),
-            "title": ann.get("title"),
-            "content": ann.get("content"),
-            "priority": ann.get("priority", "normal"),
-            "created_at": ann.get("created_at"),
-            "icon": "megaphone"
-        })
-    
-    # 2. Bina durumu değişikliklerini al (notification_logs)
-    status_logs = await db.notification_logs.find(
-        {"building_id": current_resident.building_id},
-        {"_id": 0}
-    ).sort("sent_at", -1).to_list(20)
-    
-    for log in status_logs:
-        notifications.append({
-            "id": log.get("id", str(uuid.uuid4())),
-            "type": "status_change",
-            "category": "building_status",
-            "title": f"Bina Durumu: {log.get('status_item', 'Durum')}",
-            "content": f"{log.get('status_item', 'Durum')} {log.get('new_status', '')} olarak güncellendi.",
-            "priority": "normal",
-            "created_at": log.get("sent_at"),
-            "icon": "business"
-        })
-    
-    # 3. Aylık aidat bildirimlerini al
-    monthly_dues = await db.monthly_dues.find(
-        {"building_id": current_resident.building_id, "is_sent": True},
-        {"_id": 0}
-    ).sort("sent_at", -1).to_list(10)
-    
-    for due in monthly_dues:
-        notifications.append({
-            "id": due.get("id"),
-            "type": "dues",
-            "category": "payment",
-            "title": f"Aidat Bildirimi - {due.get('month', '')}",
-            "content": f"₺{due.get('per_apartment_amount', 0):,.2f} tutarında aidat bildirimi.",
-            "priority": "high",
-            "created_at": due.get("sent_at") or due.get("created_at"),
-            "icon": "wallet"
-        })
-    
-    # Tarihe göre sırala
-    def parse_date(item):
-        date_str = item.get("created_at")
-        if not date_str:
-            return datetime.min.replace(tzinfo=timezone.utc)
-        if isinstance(date_str, str):
-            try:
-                return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-            except:
-                return datetime.min.replace(tzinfo=timezone.utc)
-        return date_str
-    
-    notifications.sort(key=parse_date, reverse=True)
+async def get_resident_notifications(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    current_resident: Resident = Depends(get_current_resident)
+):
+    """Sakin'in tüm bildirimlerini getir (duyurular, durum değişiklikleri, vb.)
+    
+    Parametresiz çağrıda son 30 bildirim düz liste olarak döner. limit / cursor
+    ile sayfalı, since ile yalnızca o tarihten sonraki bildirimler istenebilir.
+    """
+    notifications, next_cursor = await notification_timeline.read(
+        current_resident.building_id,
+        limit=limit,
+        cursor=cursor,
+        since=as_datetime(since)
+    )
     
-    return notifications[:30]
+    if limit is None and cursor is None and since is None:
+        return notifications
+    return {"items": notifications, "next_cursor": next_cursor}
 
 # ============ RESIDENT BUILDING INFO (Mobile App) ============
 
@@ -2373,67 +2742,57 @@ async def create_resident_request(request_data: dict, current_resident: Resident
         "status": "pending",
         "response": None,
         "resolved_at": None,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
     
     await db.requests.insert_one(new_request)
+    await building_counters.apply("request", new=new_request)
+    
+    # Bildirimler outbox'a yazılır; push ve mail'i worker gönderir
+    jobs = [outbox.job(
+        "firebase_topic",
+        {
+            "topic": f"manager_{current_resident.building_id}",
+            "title": "📝 Yeni Talep",
+            "body": f"{new_request['title']}",
+            "data": {"type": "new_request", "request_id": request_id}
+        },
+        building_id=current_resident.building_id
+    )]
     
-    # Bildirim - Yöneticiye haber ver (Push)
-    try:
-        from routes.firebase_push import get_topic_name, FIREBASE_INITIALIZED
-        import firebase_admin
-        from firebase_admin import messaging
-        
-        if FIREBASE_INITIALIZED:
-            # Yönetici topic'ine bildirim gönder
-            manager_topic = f"manager_{current_resident.building_id}"
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title="📝 Yeni Talep",
-                    body=f"{new_request['title']}"
-                ),
-                data={"type": "new_request", "request_id": request_id},
-                topic=manager_topic
-            )
-            messaging.send(message)
-    except Exception as e:
-        print(f"Talep push bildirimi gönderilemedi: {e}")
+    # Yöneticiyi bul
+    manager = await db.users.find_one(
+        {"building_id": current_resident.building_id, "role": "building_admin"},
+        {"_id": 0, "email": 1, "full_name": 1}
+    )
     
-    # Bildirim - Yöneticiye mail gönder
-    try:
-        # Yöneticiyi bul
-        manager = await db.users.find_one(
-            {"building_id": current_resident.building_id, "role": "building_admin"},
-            {"_id": 0, "email": 1, "full_name": 1}
-        )
+    if manager and manager.get("email"):
+        # Bina adını al
+        building = await db.buildings.find_one({"id": current_resident.building_id}, {"_id": 0, "name": 1})
+        building_name = building.get("name", "Bina") if building else "Bina"
         
-        if manager and manager.get("email"):
-            from routes.mail_service import MailService
-            mail_service = MailService(db)
-            
-            # Bina adını al
-            building = await db.buildings.find_one({"id": current_resident.building_id}, {"_id": 0, "name": 1})
-            building_name = building.get("name", "Bina") if building else "Bina"
-            
-            # Sakin adını al
-            resident_name = current_resident.full_name or "Sakin"
-            
-            await mail_service.send_with_template(
-                to=[manager["email"]],
-                template_name="request_received",
-                variables={
+        jobs.append(outbox.job(
+            "template_mail",
+            {
+                "to": [manager["email"]],
+                "template_name": "request_received",
+                "variables": {
                     "user_name": manager.get("full_name", "Yönetici"),
                     "building_name": building_name,
                     "request_title": new_request['title'],
-                    "resident_name": resident_name,
+                    "resident_name": current_resident.full_name or "Sakin",
                     "category": new_request['category'],
                     "priority": new_request['priority'],
                 },
-                building_id=current_resident.building_id
-            )
-            print(f"✅ Yöneticiye talep maili gönderildi: {manager['email']}")
+                "building_id": current_resident.building_id
+            },
+            building_id=current_resident.building_id
+        ))
+    
+    try:
+        await outbox.enqueue_many(jobs)
     except Exception as e:
-        print(f"Talep mail bildirimi gönderilemedi: {e}")
+        print(f"Talep bildirimleri kuyruğa alınamadı: {e}")
     
     # _id'yi response'dan kaldır
     response_request = {k: v for k, v in new_request.items() if k != "_id"}
@@ -2455,54 +2814,58 @@ async def get_resident_requests_by_id(resident_id: str, current_user: User = Dep
 
 # ============ RESIDENT DUES (Mobile App) ============
 
-@api_router.get("/residents/my-dues")
-async def get_resident_dues(current_resident: Resident = Depends(get_current_resident)):
-    """Sakin'in aidat borç bilgilerini getir"""
-    building_id = current_resident.building_id
-    
-    # Aylık aidat tanımlarını al
+async def load_monthly_due_definitions(building_id: str) -> List[dict]:
+    """Binanın aylık aidat tanımlarını (en yeni 100) getir"""
     monthly_dues = await db.monthly_dues.find(
         {"building_id": building_id},
         {"_id": 0}
     ).sort("created_at", -1).to_list(100)
+    for md in monthly_dues:
+        decode_dates(md, 'created_at', 'due_date', 'sent_at')
+    return monthly_dues
+
+@api_router.get("/residents/my-dues")
+async def get_resident_dues(current_resident: Resident = Depends(get_current_resident)):
+    """Sakin'in aidat borç bilgilerini getir"""
+    # Aidat tanımları bina başına önbellekte; ödenen tanımlar index üzerinden distinct
+    monthly_dues, paid_due_ids, charges, late_fees = await asyncio.gather(
+        monthly_dues_cache.get(current_resident.building_id, load_monthly_due_definitions),
+        db.due_payments.distinct("monthly_due_id", {"resident_id": current_resident.id, "status": "paid"}),
+        resident_due_charges(current_resident),
+        resident_late_fees(current_resident)
+    )
+    paid_due_ids = set(paid_due_ids)
     
-    # Sakin'in ödeme kayıtlarını al
-    payments = await db.due_payments.find(
-        {"resident_id": current_resident.id},
-        {"_id": 0}
-    ).to_list(100)
-    
-    paid_due_ids = [p.get("monthly_due_id") for p in payments if p.get("status") == "paid"]
+    # Ödenmemiş gecikme zamları aidat bazında; aidatla birlikte ödenir
+    late_fee_by_due = {}
+    for fee in late_fees:
+        late_fee_by_due[fee.get("monthly_due_id")] = late_fee_by_due.get(fee.get("monthly_due_id"), 0) + fee["amount"]
+    late_fee_total = round(sum(fee["amount"] for fee in late_fees), 2)
     
     # Borç hesapla
     total_debt = 0
     dues_list = []
     overdue_count = 0
+    now = datetime.now(timezone.utc)
     
     for due in monthly_dues:
-        per_apartment = due.get("per_apartment_amount", 0)
-        is_paid = due.get("id") in paid_due_ids
+        # Dağıtımlı kalemlerde dairenin tutarı defterdeki borç kaydındadır
+        charge = charges.get(due.get("id"))
+        per_apartment = charge["amount"] if charge else due.get("per_apartment_amount", 0)
+        is_paid = due.get("id") in paid_due_ids or bool(charge and charge.get("settled"))
         
         # Ödeme durumunu belirle
-        due_date_str = due.get("due_date")
-        is_overdue = False
-        if due_date_str and not is_paid:
-            try:
-                if isinstance(due_date_str, str):
-                    due_date = datetime.fromisoformat(due_date_str.replace('Z', '+00:00'))
-                else:
-                    due_date = due_date_str
-                is_overdue = due_date < datetime.now(timezone.utc)
-            except:
-                pass
+        due_date = due.get("due_date")
+        is_overdue = bool(due_date and not is_paid and due_date < now)
         
         status = "paid" if is_paid else ("overdue" if is_overdue else "pending")
         
         dues_list.append({
             "id": due.get("id"),
             "month": due.get("month"),
-            "due_date": due.get("due_date"),
+            "due_date": due_date,
             "amount": per_apartment,
+            "late_fee": round(late_fee_by_due.get(due.get("id"), 0), 2),
             "is_paid": is_paid,
             "status": status,
             "expense_items": due.get("expense_items", [])
@@ -2514,12 +2877,50 @@ async def get_resident_dues(current_resident: Resident = Depends(get_current_res
                 overdue_count += 1
     
     return {
-        "total_debt": total_debt,
+        "total_debt": round(total_debt + late_fee_total, 2),
+        "late_fee_total": late_fee_total,
+        "late_fees": late_fees,
         "overdue_count": overdue_count,
         "dues": dues_list,
         "payment_count": len(paid_due_ids)
     }
 
+async def resident_due_charges(resident: Resident) -> Dict[str, dict]:
+    """Sakinin dairesindeki aidat borçları (monthly_due_id -> defter kaydı)"""
+    if not resident.apartment_id:
+        return {}
+    return await apartment_ledger.monthly_due_charges(resident.apartment_id)
+
+async def resident_late_fees(resident: Resident, monthly_due_id: Optional[str] = None) -> List[dict]:
+    """Sakinin dairesindeki ödenmemiş gecikme zamları"""
+    if not resident.apartment_id:
+        return []
+    return await apartment_ledger.open_late_fees(resident.apartment_id, monthly_due_id)
+
+async def record_due_payments(payments: List[dict]) -> List[dict]:
+    """Aidat ödemelerini kaydet: due_payments, bina sayaçları ve daire defteri
+    
+    Borcu bu arada başka bir ödemeyle kapanmış ödemeler yazılmaz; kaydedilenler döner.
+    """
+    if not payments:
+        return []
+    
+    # Borçlar koşullu kapatılır; ödeme kayıtları ve defter alacakları aynı transaction'da yazılır
+    async def write_payments(session):
+        recorded = await apartment_ledger.record_payments(payments, session=session)
+        if recorded:
+            await db.due_payments.insert_many([dict(payment) for payment in recorded], session=session)
+        return recorded
+    
+    recorded = await apartment_ledger.transaction(write_payments)
+    
+    collected = {}
+    for payment in recorded:
+        collected[payment["building_id"]] = collected.get(payment["building_id"], 0) + payment["amount"]
+    for building_id, amount in collected.items():
+        await building_counters.record_payment(building_id, amount)
+    return recorded
+
 @api_router.post("/residents/dues/{due_id}/pay")
 async def pay_resident_due(due_id: str, current_resident: Resident = Depends(get_current_resident)):
     """Sakin aidat ödemesi kaydet (simülasyon)"""
@@ -2534,61 +2935,205 @@ async def pay_resident_due(due_id: str, current_resident: Resident = Depends(get
         "resident_id": current_resident.id,
         "status": "paid"
     })
-    if existing:
+    
+    # Tutar dairenin defterdeki borcu (arsa payı / m² / blok dağıtımı); kayıt yoksa daire başı tutar
+    charges, late_fees = await asyncio.gather(
+        resident_due_charges(current_resident),
+        resident_late_fees(current_resident, due_id)
+    )
+    charge = charges.get(due_id)
+    due_open = not existing and not (charge and charge.get("settled"))
+    # Aidat ödenmiş olsa da açık gecikme zammı kaldıysa yalnızca o ödenir
+    if not due_open and not late_fees:
         raise HTTPException(status_code=400, detail="Bu aidat zaten ödenmiş")
     
+    due_amount = (charge["amount"] if charge else due.get("per_apartment_amount", 0)) if due_open else 0
+    late_fee_amount = round(sum(fee["amount"] for fee in late_fees), 2)
+    
     # Ödeme kaydı oluştur
     payment = {
         "id": str(uuid.uuid4()),
         "monthly_due_id": due_id,
         "resident_id": current_resident.id,
         "building_id": current_resident.building_id,
-        "amount": due.get("per_apartment_amount", 0),
+        "apartment_id": current_resident.apartment_id,
+        "amount": round(due_amount + late_fee_amount, 2),
+        "late_fee_amount": late_fee_amount,
+        "late_fee_ids": [fee["id"] for fee in late_fees],
         "status": "paid",
-        "payment_date": datetime.now(timezone.utc).isoformat(),
+        "payment_date": datetime.now(timezone.utc),
         "payment_method": "online"
     }
     
-    await db.due_payments.insert_one(payment)
+    if not await record_due_payments([payment]):
+        raise HTTPException(status_code=400, detail="Bu aidat zaten ödenmiş")
     
     return {"success": True, "message": "Ödeme kaydedildi", "payment": payment}
 
+@api_router.get("/residents/my-balance")
+async def get_resident_balance(current_resident: Resident = Depends(get_current_resident)):
+    """Sakin'in dairesinin defter bakiyesi ve açık borç kalemleri"""
+    if not current_resident.apartment_id:
+        raise HTTPException(status_code=404, detail="Sakine atanmış daire bulunamadı")
+    
+    balance, open_charges = await asyncio.gather(
+        apartment_ledger.get_balance(current_resident.apartment_id),
+        apartment_ledger.open_charges(current_resident.apartment_id)
+    )
+    return {"balance": balance, "open_charges": open_charges}
+
+# ============ BUILDING MANAGER LEDGER ROUTES ============
+
+@api_router.get("/building-manager/ledger/balances")
+async def get_apartment_balances(current_user: User = Depends(get_current_building_admin)):
+    """Binadaki dairelerin güncel defter bakiyeleri"""
+    return await db.apartment_balances.find(
+        {"building_id": current_user.building_id}, {"_id": 0}
+    ).sort("balance", -1).to_list(None)
+
+@api_router.get("/building-manager/ledger/report")
+async def get_ledger_report(current_user: User = Depends(get_current_building_admin)):
+    """Tahsilat oranı ve vadesi geçmiş açık borçlar"""
+    report, overdue = await asyncio.gather(
+        apartment_ledger.collection_report(current_user.building_id),
+        apartment_ledger.overdue_charges(current_user.building_id)
+    )
+    report["overdue_count"] = len(overdue)
+    report["overdue_amount"] = round(sum(charge["amount"] for charge in overdue), 2)
+    report["overdue_charges"] = overdue
+    return report
+
+@api_router.get("/building-manager/ledger/apartments/{apartment_id}")
+async def get_apartment_ledger(
+    apartment_id: str,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_LIMIT),
+    before_seq: Optional[int] = None,
+    current_user: User = Depends(get_current_building_admin)
+):
+    """Dairenin defter kayıtları (seq ile geriye doğru sayfalı)"""
+    apartment = await db.apartments.find_one({"id": apartment_id, "building_id": current_user.building_id}, {"_id": 0, "id": 1})
+    if not apartment:
+        raise HTTPException(status_code=404, detail="Daire bulunamadı")
+    
+    balance, entries = await asyncio.gather(
+        apartment_ledger.get_balance(apartment_id),
+        apartment_ledger.entries(apartment_id, limit=limit, before_seq=before_seq)
+    )
+    next_before_seq = entries[-1]["seq"] if len(entries) == limit else None
+    return {"balance": balance, "entries": entries, "next_before_seq": next_before_seq}
+
+@api_router.post("/building-manager/ledger/compact/{year}")
+async def compact_ledger_year(year: int, current_user: User = Depends(get_current_building_admin)):
+    """Kapanmış yılın kapatılmış defter kayıtlarını arşivle"""
+    try:
+        result = await apartment_ledger.compact_year(current_user.building_id, year)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, **result}
+
+# ============ BANK RECONCILIATION ROUTES ============
+
+class ReconciliationDecision(BaseModel):
+    item_ids: List[str] = Field(..., min_length=1)
+
+@api_router.post("/building-manager/bank-statements/import")
+async def import_bank_statement(file: UploadFile = File(...), current_user: User = Depends(get_current_building_admin)):
+    """Banka ekstresini (CSV / MT940) içe aktar ve açık aidatlarla eşleştir"""
+    content = await file.read()
+    if not content:
+        raise HTTPException(status_code=400, detail="Dosya boş")
+    return await bank_reconciliation.import_statement(content, file.filename or "", current_user.building_id, current_user.id)
+
+@api_router.get("/building-manager/bank-statements/{import_id}")
+async def get_bank_statement_import(
+    import_id: str,
+    item_status: Optional[str] = Query(None, alias="status"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_building_admin)
+):
+    """İçe aktarma özeti ve onay kuyruğu (status: pending, unmatched, confirmed, rejected)"""
+    summary = await bank_reconciliation.get_import(import_id, current_user.building_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="Ekstre bulunamadı")
+    
+    query = {"import_id": import_id, "building_id": current_user.building_id}
+    if item_status:
+        query["status"] = item_status
+    items, next_cursor = await fetch_page(db.bank_reconciliation_items, query, {"_id": 0}, limit or 100, cursor)
+    return {"import": summary, "items": items, "next_cursor": next_cursor}
+
+@api_router.post("/building-manager/bank-statements/{import_id}/confirm")
+async def confirm_bank_matches(import_id: str, data: ReconciliationDecision, current_user: User = Depends(get_current_building_admin)):
+    """Onaylanan eşleşmeleri toplu ödeme olarak kaydet"""
+    # Önce sahiplen: eşzamanlı ikinci bir onay aynı kalemleri göremez
+    claimed = await bank_reconciliation.claim(import_id, current_user.building_id, data.item_ids, current_user.id)
+    items = [item for item in claimed if item.get("match")]
+    
+    now = datetime.now(timezone.utc)
+    payments = []
+    for item in items:
+        match = item["match"]
+        payments.append({
+            "id": str(uuid.uuid4()),
+            "monthly_due_id": match["monthly_due_id"],
+            "resident_id": match.get("resident_id"),
+            "building_id": current_user.building_id,
+            "apartment_id": match["apartment_id"],
+            "amount": match["amount"],
+            "late_fee_ids": match.get("late_fee_ids", []),
+            "status": "paid",
+            "payment_date": item["transaction"]["date"],
+            "payment_method": "bank_transfer",
+            "bank_reference": item["transaction"].get("reference"),
+            "reconciliation_item_id": item["id"],
+            "recorded_at": now
+        })
+    
+    try:
+        # Borcu bu arada (ör. online ödeme ile) kapanmış kalemler kaydedilmez
+        recorded = await record_due_payments(payments)
+    except Exception:
+        # Sahiplenilen kalemler onay bekleyen duruma geri döner
+        await bank_reconciliation.release([item["id"] for item in claimed])
+        raise
+    
+    confirmed_ids = [payment["reconciliation_item_id"] for payment in recorded]
+    confirmed = set(confirmed_ids)
+    stale_ids = [item["id"] for item in items if item["id"] not in confirmed]
+    # Eşleşmesi olmayan kalemler onaylanamaz; bekleyen duruma döner
+    await bank_reconciliation.release([item["id"] for item in claimed if not item.get("match")])
+    await bank_reconciliation.mark(confirmed_ids, "confirmed", current_user.id, from_status="confirming")
+    await bank_reconciliation.mark(stale_ids, "rejected", current_user.id, from_status="confirming", reason="already_settled")
+    
+    return {"success": True, "confirmed": len(confirmed_ids), "already_settled": len(stale_ids)}
+
+@api_router.post("/building-manager/bank-statements/{import_id}/reject")
+async def reject_bank_matches(import_id: str, data: ReconciliationDecision, current_user: User = Depends(get_current_building_admin)):
+    """Eşleşmeleri reddet"""
+    items = await bank_reconciliation.pending_items(import_id, current_user.building_id, data.item_ids)
+    rejected = await bank_reconciliation.mark([item["id"] for item in items], "rejected", current_user.id)
+    return {"success": True, "rejected": rejected}
+
 # ============ BUILDING MANAGER DASHBOARD ============
 
 @api_router.get("/building-manager/dashboard", response_model=BuildingManagerDashboardStats)
 async def get_building_manager_dashboard(current_user: User = Depends(get_current_building_admin)):
-    building_id = current_user.building_id
+    # Sayaçlar yazma yollarında $inc ile güncel tutulur; tek point read
+    counters = await building_counters.get(current_user.building_id)
     
-    # Get apartment stats
-    all_apartments = await db.apartments.find({"building_id": building_id}, {"_id": 0}).to_list(1000)
-    total_apartments = len(all_apartments)
-    occupied_apartments = len([a for a in all_apartments if a.get('status') in ['rented', 'owner_occupied']])
-    empty_apartments = total_apartments - occupied_apartments
-    
-    # Get resident count
-    total_residents = await db.residents.count_documents({"building_id": building_id, "is_active": True})
-    
-    # Get dues stats
-    all_dues = await db.dues.find({"building_id": building_id}, {"_id": 0}).to_list(1000)
-    pending_dues = len([d for d in all_dues if d.get('status') == 'unpaid'])
-    total_due_amount = sum(d.get('amount', 0) for d in all_dues if d.get('status') == 'unpaid')
-    collected_amount = sum(d.get('amount', 0) for d in all_dues if d.get('status') == 'paid')
-    
-    # Get pending requests
-    pending_requests = await db.requests.count_documents({
-        "building_id": building_id,
-        "status": {"$in": ["pending", "in_progress"]}
-    })
+    total_apartments = counters.get("apartments", 0)
+    occupied_apartments = counters.get("occupied_apartments", 0)
     
     return BuildingManagerDashboardStats(
         total_apartments=total_apartments,
         occupied_apartments=occupied_apartments,
-        empty_apartments=empty_apartments,
-        total_residents=total_residents,
-        pending_dues=pending_dues,
-        pending_requests=pending_requests,
-        total_due_amount=total_due_amount,
-        collected_amount=collected_amount
+        empty_apartments=total_apartments - occupied_apartments,
+        total_residents=counters.get("active_residents", 0),
+        pending_dues=counters.get("pending_dues", 0),
+        pending_requests=counters.get("open_requests", 0),
+        total_due_amount=round(counters.get("pending_due_amount", 0), 2),
+        collected_amount=round(counters.get("collected_amount", 0), 2)
     )
 
 @api_router.get("/building-manager/my-building", response_model=Building)
@@ -2598,10 +3143,7 @@ async def get_my_building(current_user: User = Depends(get_current_building_admi
     if not building:
         raise HTTPException(status_code=404, detail="Building not found")
     
-    if isinstance(building.get('created_at'), str):
-        building['created_at'] = datetime.fromisoformat(building['created_at'])
-    if isinstance(building.get('subscription_end_date'), str):
-        building['subscription_end_date'] = datetime.fromisoformat(building['subscription_end_date'])
+    decode_dates(building, 'created_at', 'subscription_end_date')
     
     return Building(**building)
 
@@ -2641,7 +3183,7 @@ async def get_building_status(current_user: User = Depends(get_current_building_
             "elevator": "active",
             "electricity": "active",
             "water": "active",
-            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "updated_at": datetime.now(timezone.utc),
             "updated_by": current_user.id
         }
         await db.building_status.insert_one(default_status)
@@ -2667,7 +3209,7 @@ async def update_building_status(
     )
     
     update_data = {k: v for k, v in status_data.model_dump().items() if v is not None}
-    update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+    update_data["updated_at"] = datetime.now(timezone.utc)
     update_data["updated_by"] = current_user.id
     
     # Hangi durumlar arıza/kesinti olarak değişti kontrol et
@@ -2722,37 +3264,39 @@ async def update_building_status(
         update_data.setdefault("water", "active")
         await db.building_status.insert_one(update_data)
     
-    # TÜM durum değişikliklerinde bildirim gönder
+    # Sakin bildirim akışına yaz
+    for change in status_changes:
+        await notification_timeline.append(status_change_entry(current_user.building_id, change["name"], change["label"]))
+    
+    # TÜM durum değişikliklerinde bildirim kuyruğa alınır (arızalar urgent şeridinde)
     if status_changes:
+        from routes.firebase_push import get_topic_name
+        
         # Bina bilgisini al
         building = await db.buildings.find_one({"id": current_user.building_id}, {"_id": 0})
         building_name = building.get("name", "Bina") if building else "Bina"
         
-        # Tüm aktif sakinleri al
+        # Mail adresi olan aktif sakinler
         residents = await db.residents.find(
             {"building_id": current_user.building_id, "is_active": True},
-            {"_id": 0}
+            {"_id": 0, "email": 1}
         ).to_list(1000)
+        email_recipients = [r["email"] for r in residents if r.get("email")]
         
-        # Her durum değişikliği için bildirim oluştur
+        jobs = []
         for change in status_changes:
             system_name = change["name"]
             system_label = change["label"]
             is_problem = change.get("is_problem", False)
             emoji = "⚠️" if is_problem else "✅"
+            lane = "urgent" if is_problem else "normal"
             
-            # Mail gönder
-            try:
-                from routes.mail_service import MailService
-                mail_service = MailService(db)
-                
-                # Mail adresi olan sakinlere mail gönder
-                email_recipients = [r["email"] for r in residents if r.get("email")]
-                if email_recipients:
-                    await mail_service.send_mail(
-                        to=email_recipients,
-                        subject=f"{emoji} {building_name} - {system_name} Durum Güncellemesi",
-                        body_html=f"""
+            if email_recipients:
+                jobs.extend(outbox.mail_jobs(
+                    email_recipients,
+                    {
+                        "subject": f"{emoji} {building_name} - {system_name} Durum Güncellemesi",
+                        "body_html": f"""
                         <h2>{emoji} {system_name} Durum Güncellemesi</h2>
                         <p>Sayın Sakinimiz,</p>
                         <p><strong>{building_name}</strong> binasında {system_name.lower()} durumu: <strong>{system_label.upper()}</strong></p>
@@ -2760,68 +3304,37 @@ async def update_building_status(
                         <br>
                         <p>Saygılarımızla,<br>{building_name} Yönetimi</p>
                         """
-                    )
-                    print(f"{system_name} durum maili gönderildi: {len(email_recipients)} kişi")
-            except Exception as e:
-                print(f"Mail gönderimi hatası ({system_name}): {e}")
+                    },
+                    lane=lane,
+                    building_id=current_user.building_id
+                ))
             
-            # Firebase Push notification gönder
-            try:
-                from routes.firebase_push import get_topic_name, FIREBASE_INITIALIZED
-                import firebase_admin
-                from firebase_admin import messaging
-                
-                if FIREBASE_INITIALIZED:
-                    topic = get_topic_name(current_user.building_id)
-                    
-                    # Android config
-                    android_config = messaging.AndroidConfig(
-                        priority="high",
-                        notification=messaging.AndroidNotification(
-                            icon="notification_icon",
-                            color="#EF4444",  # Red for alerts
-                            sound="default",
-                            channel_id="building_status"
-                        )
-                    )
-                    
-                    # iOS config
-                    apns_config = messaging.APNSConfig(
-                        payload=messaging.APNSPayload(
-                            aps=messaging.Aps(
-                                alert=messaging.ApsAlert(
-                                    title=f"⚠️ {system_name} {system_label.title()}",
-                                    body=f"{building_name} binasında {system_name.lower()} {system_label} bildirildi."
-                                ),
-                                sound="default",
-                                badge=1
-                            )
-                        )
-                    )
-                    
-                    # Firebase message
-                    message = messaging.Message(
-                        notification=messaging.Notification(
-                            title=f"{emoji} {system_name}: {system_label.upper()}",
-                            body=f"{building_name} binasında {system_name.lower()} durumu güncellendi."
-                        ),
-                        data={
-                            "type": f"{change['key']}_alert",
-                            "building_id": current_user.building_id,
-                            "status": change['key']
-                        },
-                        topic=topic,
-                        android=android_config,
-                        apns=apns_config
-                    )
-                    
-                    # Send via Firebase
-                    response = messaging.send(message)
-                    print(f"Firebase push notification gönderildi ({system_name}): {response}")
-                else:
-                    print(f"Firebase başlatılamadı, bildirim gönderilemedi ({system_name})")
-            except Exception as e:
-                print(f"Firebase push notification hatası ({system_name}): {e}")
+            jobs.append(outbox.job(
+                "firebase_topic",
+                {
+                    "topic": get_topic_name(current_user.building_id),
+                    "title": f"{emoji} {system_name}: {system_label.upper()}",
+                    "body": f"{building_name} binasında {system_name.lower()} durumu güncellendi.",
+                    "data": {
+                        "type": f"{change['key']}_alert",
+                        "building_id": current_user.building_id,
+                        "status": change['key']
+                    },
+                    "alert": {
+                        "title": f"⚠️ {system_name} {system_label.title()}",
+                        "body": f"{building_name} binasında {system_name.lower()} {system_label} bildirildi.",
+                        "color": "#EF4444",
+                        "channel_id": "building_status"
+                    }
+                },
+                lane=lane,
+                building_id=current_user.building_id
+            ))
+        
+        try:
+            await outbox.enqueue_many(jobs)
+        except Exception as e:
+            print(f"Durum bildirimleri kuyruğa alınamadı: {e}")
     
     updated_status = await db.building_status.find_one(
         {"building_id": current_user.building_id},
@@ -2894,9 +3407,17 @@ async def update_building_manager_profile(
     
     if update_data:
         await db.users.update_one({"id": current_user.id}, {"$set": update_data})
+    principal_cache.invalidate("user", current_user.id)
     
     updated_user = await db.users.find_one({"id": current_user.id}, {"_id": 0, "hashed_password": 0})
-    return {"success": True, "message": "Profil bilgileri güncellendi", "user": updated_user}
+    response = {"success": True, "message": "Profil bilgileri güncellendi", "user": updated_user}
+    if update_data:
+        # Claims token'ındaki e-posta / ad eskidi: eski token'ları iptal et, yenisini dön
+        await token_versions.bump(current_user.id, "user", is_active=updated_user.get("is_active", True))
+        if AUTH_CLAIMS_TOKENS:
+            response["access_token"] = create_access_token(data=await build_user_token_data(updated_user))
+            response["token_type"] = "bearer"
+    return response
 
 @api_router.put("/building-manager/change-password")
 async def change_building_manager_password(
@@ -2910,7 +3431,7 @@ async def change_building_manager_password(
         raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
     
     # Mevcut şifreyi doğrula
-    if not verify_password(password_data.current_password, user.get("hashed_password", "")):
+    if not await verify_password(password_data.current_password, user.get("hashed_password", "")):
         raise HTTPException(status_code=400, detail="Mevcut şifre yanlış")
     
     # Yeni şifre en az 6 karakter olmalı
@@ -2918,8 +3439,10 @@ async def change_building_manager_password(
         raise HTTPException(status_code=400, detail="Yeni şifre en az 6 karakter olmalıdır")
     
     # Yeni şifreyi hashle ve kaydet
-    new_hashed_password = get_password_hash(password_data.new_password)
+    new_hashed_password = await get_password_hash(password_data.new_password)
     await db.users.update_one({"id": current_user.id}, {"$set": {"hashed_password": new_hashed_password}})
+    principal_cache.invalidate("user", current_user.id)
+    await token_versions.bump(current_user.id, "user")
     
     return {"success": True, "message": "Şifre başarıyla değiştirildi"}
 
@@ -2938,14 +3461,12 @@ async def update_building_manager_building(
     
     if update_data:
         await db.buildings.update_one({"id": current_user.building_id}, {"$set": update_data})
+        dashboard_cache.invalidate(SUPERADMIN_DASHBOARD_KEY)
     
     updated_building = await db.buildings.find_one({"id": current_user.building_id}, {"_id": 0})
     
     # datetime dönüşümleri
-    if isinstance(updated_building.get('created_at'), str):
-        updated_building['created_at'] = datetime.fromisoformat(updated_building['created_at'])
-    if isinstance(updated_building.get('subscription_end_date'), str):
-        updated_building['subscription_end_date'] = datetime.fromisoformat(updated_building['subscription_end_date'])
+    decode_dates(updated_building, 'created_at', 'subscription_end_date')
     
     return {"success": True, "message": "Bina bilgileri güncellendi", "building": updated_building}
 
@@ -3015,8 +3536,8 @@ async def get_building_payments(current_user: User = Depends(get_current_buildin
                 "period": f"{months[month_idx]} {year}",
                 "amount": monthly_amount,
                 "status": status,
-                "due_date": datetime(year, month_idx + 1, 15).isoformat(),
-                "paid_date": datetime(year, month_idx + 1, 5).isoformat() if status == 'paid' else None
+                "due_date": datetime(year, month_idx + 1, 15, tzinfo=timezone.utc),
+                "paid_date": datetime(year, month_idx + 1, 5, tzinfo=timezone.utc) if status == 'paid' else None
             })
     
     return payments
@@ -3035,7 +3556,7 @@ async def process_building_payment(data: dict, current_user: User = Depends(get_
     period = data.get("period")
     
     # Paratika config kontrolü
-    paratika_config = await db.paratika_config.find_one({"id": "default"}, {"_id": 0})
+    paratika_config = await paratika_service.get_config()
     
     if not paratika_config or not paratika_config.get("is_active"):
         # Paratika aktif değilse demo ödeme simülasyonu
@@ -3043,7 +3564,7 @@ async def process_building_payment(data: dict, current_user: User = Depends(get_
             {"id": payment_id, "building_id": current_user.building_id},
             {"$set": {
                 "status": "paid",
-                "paid_date": datetime.now(timezone.utc).isoformat(),
+                "paid_date": datetime.now(timezone.utc),
                 "payment_method": "demo"
             }},
             upsert=True
@@ -3073,7 +3594,7 @@ async def process_building_payment(data: dict, current_user: User = Depends(get_
             {"$set": {
                 "session_token": result.get("session_token"),
                 "status": "processing",
-                "updated_at": datetime.now(timezone.utc).isoformat()
+                "updated_at": datetime.now(timezone.utc)
             }},
             upsert=True
         )
@@ -3223,18 +3744,32 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_db():
-    # Create indexes
-    await db.users.create_index("email", unique=True)
-    await db.users.create_index("id", unique=True)
-    await db.buildings.create_index("id", unique=True)
-    await db.subscription_plans.create_index("id", unique=True)
-    await db.blocks.create_index("id", unique=True)
-    await db.apartments.create_index("id", unique=True)
-    await db.residents.create_index("id", unique=True)
-    await db.dues.create_index("id", unique=True)
-    await db.announcements.create_index("id", unique=True)
-    await db.requests.create_index("id", unique=True)
+    # Index manifest'ini veritabanıyla eşitle
+    await reconcile_indexes(db)
+    
+    if INDEX_PLAN_CHECK:
+        failures = await check_query_plans(db)
+        if failures:
+            raise RuntimeError(f"COLLSCAN kullanan sorgu şekilleri: {failures}")
+    
+    if AUTH_CLAIMS_TOKENS:
+        await token_versions.refresh(full=True)
+    
+    # String tarihleri arka planda BSON date'e çevir (kaldığı yerden devam eder)
+    if MIGRATE_BSON_DATES_ON_STARTUP:
+        asyncio.create_task(migrate_dates(db))
+    
+    # Yarım kalmış tenant temizleme işlerine devam et
+    await tenant_purge.resume_pending()
+    
+    if LATE_FEE_JOB_ENABLED:
+        asyncio.create_task(late_fee_job.loop())
+    
+    # Ayrı outbox_worker süreci olmayan kurulumlar için süreç içi worker
+    if OUTBOX_INLINE_WORKERS > 0:
+        asyncio.create_task(outbox.run_pool(OUTBOX_INLINE_WORKERS))
 
 @app.on_event("shutdown")
 async def shutdown_db():
+    await smtp_pool.close()
     client.close()
@@ -0,0 +1,119 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# server.py modül seviyesinde bu değişkenleri okur (bağlantı açılmaz)
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test")
+
+
+class AsyncCursor:
+    """mongomock cursor'ını Motor cursor arayüzüyle sarar"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, n):
+        self._cursor = self._cursor.limit(n)
+        return self
+
+    def skip(self, n):
+        self._cursor = self._cursor.skip(n)
+        return self
+
+    async def to_list(self, length=None):
+        documents = list(self._cursor)
+        return documents if length is None else documents[:length]
+
+    def __aiter__(self):
+        self._iterator = iter(self._cursor)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncCollection:
+    """mongomock koleksiyonunu Motor koleksiyonu gibi (await edilebilir) sarar"""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs):
+        kwargs.pop("session", None)
+        return AsyncCursor(self._collection.find(*args, **kwargs))
+
+    def aggregate(self, pipeline, **kwargs):
+        kwargs.pop("session", None)
+        return AsyncCursor(iter(list(self._collection.aggregate(pipeline, **kwargs))))
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            kwargs.pop("session", None)
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncDatabase:
+    """Transaction desteği olmayan (standalone) bir sunucu gibi davranır"""
+
+    def __init__(self):
+        import mongomock
+        self._db = mongomock.MongoClient(tz_aware=True).db
+
+    async def command(self, name, *args, **kwargs):
+        return {"ok": 1}
+
+    def __getattr__(self, name):
+        return AsyncCollection(self._db[name])
+
+    def __getitem__(self, name):
+        return AsyncCollection(self._db[name])
+
+
+@pytest.fixture
+def db():
+    pytest.importorskip("mongomock")
+    return AsyncDatabase()
+
+
+# server.py'nin modül seviyesinde db ile kurduğu servisler
+SERVER_SERVICES = (
+    "token_versions",
+    "building_counters",
+    "notification_timeline",
+    "apartment_ledger",
+    "tenant_purge",
+    "due_generator",
+    "late_fee_job",
+    "bank_reconciliation",
+    "outbox",
+)
+
+
+@pytest.fixture
+def server(db, monkeypatch):
+    """server modülü; db ve db'ye bağlı servisler mongomock'a yönlendirilmiş"""
+    import server as server_module
+    from routes.monthly_dues_cache import MonthlyDuesCache
+
+    monkeypatch.setattr(server_module, "db", db)
+    for name in SERVER_SERVICES:
+        monkeypatch.setattr(getattr(server_module, name), "db", db)
+    monkeypatch.setattr(server_module.apartment_ledger, "_transactions_supported", None)
+    monkeypatch.setattr(server_module, "monthly_dues_cache", MonthlyDuesCache())
+    return server_module
@@ -0,0 +1,136 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+BUILDING_ID = "building-1"
+APARTMENT_ID = "apartment-1"
+IMPORT_ID = "import-1"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def manager(server):
+    return server.User(
+        id="manager-1",
+        email="yonetici@example.com",
+        full_name="Yönetici",
+        building_id=BUILDING_ID,
+        created_at=datetime.now(timezone.utc),
+    )
+
+
+def resident(server):
+    return server.Resident(
+        id="resident-1",
+        building_id=BUILDING_ID,
+        apartment_id=APARTMENT_ID,
+        full_name="Sakin",
+        phone="5550000000",
+        type="owner",
+        created_at=datetime.now(timezone.utc),
+    )
+
+
+async def matched_item(server, **extra):
+    """Açık aidat borcu ve ona eşleşmiş bekleyen bir ekstre kalemi"""
+    now = datetime.now(timezone.utc)
+    monthly_due = {
+        "id": str(uuid.uuid4()),
+        "building_id": BUILDING_ID,
+        "month": "Mart 2026",
+        "per_apartment_amount": 400.0,
+        "due_date": now + timedelta(days=10),
+        "created_at": now,
+    }
+    await server.db.monthly_dues.insert_one(dict(monthly_due))
+    await server.apartment_ledger.charge_monthly_due(monthly_due, [APARTMENT_ID])
+    charge = await server.db.apartment_ledger.find_one({"source_id": monthly_due["id"]})
+    item = {
+        "id": str(uuid.uuid4()),
+        "import_id": IMPORT_ID,
+        "building_id": BUILDING_ID,
+        "status": "pending",
+        "transaction": {"date": now, "amount": 400.0, "reference": "REF1"},
+        "match": {
+            "charge_id": charge["id"],
+            "monthly_due_id": monthly_due["id"],
+            "apartment_id": APARTMENT_ID,
+            "resident_id": None,
+            "amount": 400.0,
+            "late_fee_ids": [],
+        },
+        "created_at": now,
+        **extra,
+    }
+    await server.db.bank_reconciliation_items.insert_one(dict(item))
+    return monthly_due, item
+
+
+async def item_status(server, item_id):
+    return (await server.db.bank_reconciliation_items.find_one({"id": item_id}))["status"]
+
+
+def test_confirm_records_payment(server):
+    async def scenario():
+        monthly_due, item = await matched_item(server)
+        decision = server.ReconciliationDecision(item_ids=[item["id"]])
+        result = await server.confirm_bank_matches(IMPORT_ID, decision, manager(server))
+        assert result["confirmed"] == 1
+        assert await item_status(server, item["id"]) == "confirmed"
+        assert (await server.apartment_ledger.get_balance(APARTMENT_ID))["balance"] == 0
+
+        # İkinci onay aynı kalemi yeniden kaydetmez
+        again = await server.confirm_bank_matches(IMPORT_ID, decision, manager(server))
+        assert again["confirmed"] == 0
+        assert await server.db.due_payments.count_documents({}) == 1
+
+    run(scenario())
+
+
+def test_charge_settled_after_import_is_not_paid_twice(server):
+    async def scenario():
+        monthly_due, item = await matched_item(server)
+        # Ekstre kuyruktayken sakin online öder
+        await server.pay_resident_due(monthly_due["id"], resident(server))
+
+        decision = server.ReconciliationDecision(item_ids=[item["id"]])
+        result = await server.confirm_bank_matches(IMPORT_ID, decision, manager(server))
+        assert result == {"success": True, "confirmed": 0, "already_settled": 1}
+        assert await item_status(server, item["id"]) == "rejected"
+        assert await server.db.due_payments.count_documents({}) == 1
+        assert (await server.apartment_ledger.get_balance(APARTMENT_ID))["balance"] == 0
+
+    run(scenario())
+
+
+def test_failed_confirm_releases_claim(server, monkeypatch):
+    async def failing(payments):
+        raise RuntimeError("mongo hatası")
+
+    async def scenario():
+        monthly_due, item = await matched_item(server)
+        monkeypatch.setattr(server, "record_due_payments", failing)
+        decision = server.ReconciliationDecision(item_ids=[item["id"]])
+        with pytest.raises(RuntimeError):
+            await server.confirm_bank_matches(IMPORT_ID, decision, manager(server))
+        stored = await server.db.bank_reconciliation_items.find_one({"id": item["id"]})
+        assert stored["status"] == "pending"
+        assert "claim_id" not in stored
+
+    run(scenario())
+
+
+def test_stale_claim_is_reclaimed(server):
+    async def scenario():
+        stale = datetime.now(timezone.utc) - timedelta(hours=1)
+        monthly_due, item = await matched_item(server, status="confirming", claim_id="old", decided_at=stale)
+        decision = server.ReconciliationDecision(item_ids=[item["id"]])
+        result = await server.confirm_bank_matches(IMPORT_ID, decision, manager(server))
+        assert result["confirmed"] == 1
+        assert await item_status(server, item["id"]) == "confirmed"
+
+    run(scenario())
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta, timezone
+
+from routes.bank_reconciliation import (
+    BANK_MATCH_DAYS_AFTER,
+    AmountBucket,
+    MatchIndex,
+    match_transaction,
+    parse_mt940,
+    parse_statement,
+)
+
+
+def at(year, month, day):
+    return datetime(year, month, day, tzinfo=timezone.utc)
+
+
+def charge(charge_id, apartment_id, due_date, amount=400.0):
+    return {
+        "id": charge_id,
+        "apartment_id": apartment_id,
+        "amount": amount,
+        "source_id": "monthly-due-1",
+        "due_date": due_date,
+        "period": "2026-03",
+    }
+
+
+def build_index(*charges):
+    apartments = [
+        {"id": "apartment-12", "apartment_number": "A-12"},
+        {"id": "apartment-13", "apartment_number": "A-13"},
+    ]
+    residents = [{"id": "resident-12", "apartment_id": "apartment-12", "full_name": "Ahmet Yılmaz"}]
+    return MatchIndex(list(charges), apartments, residents)
+
+
+MT940 = """:20:STATEMENT
+:25:TR000000000000000000000001
+:61:2603150315C400,00NTRFNONREF//BANKREF1
+:86:?20DAIRE A12 MART AIDAT?32AHMET
+YILMAZ
+:61:260316D50,00NTRFNONREF
+:86:?20KOMISYON
+:62F:C260316TRY350,00
+"""
+
+
+def test_parse_mt940_reads_lines_and_descriptions():
+    first, second = parse_mt940(MT940)
+    assert first["date"] == at(2026, 3, 15)
+    assert first["amount"] == 400.0
+    assert first["reference"] == "BANKREF1"
+    assert first["description"].split() == ["DAIRE", "A12", "MART", "AIDAT", "AHMET", "YILMAZ"]
+    assert second["amount"] == -50.0
+    assert second["reference"] is None
+    assert second["description"].split() == ["KOMISYON"]
+
+
+def test_parse_statement_keeps_only_credits():
+    transactions = parse_statement(MT940.encode(), "ekstre.sta")
+    assert [t["amount"] for t in transactions] == [400.0]
+
+
+def test_amount_bucket_window_skips_used_charges():
+    dated = [charge("c1", "a1", at(2026, 1, 1)), charge("c2", "a2", at(2026, 2, 1)), charge("c3", "a3", at(2026, 6, 1))]
+    bucket = AmountBucket(dated + [charge("c4", "a4", None)])
+    date = at(2026, 2, 10)
+
+    assert [c["id"] for c in bucket.in_window(date, set(), limit=10)] == ["c1", "c2", "c4"]
+    assert [c["id"] for c in bucket.in_window(date, set(), limit=1)] == ["c1"]
+    used = {"c1"}
+    assert [c["id"] for c in bucket.in_window(date, used, limit=10)] == ["c2", "c4"]
+    used.add("c2")
+    assert [c["id"] for c in bucket.in_window(date, used, limit=10)] == ["c4"]
+
+
+def test_amount_bucket_window_bounds():
+    bucket = AmountBucket([charge("c1", "a1", at(2026, 1, 1))])
+    assert bucket.in_window(at(2026, 1, 1) + timedelta(days=BANK_MATCH_DAYS_AFTER), set(), limit=1)
+    assert bucket.in_window(at(2026, 1, 1) + timedelta(days=BANK_MATCH_DAYS_AFTER + 1), set(), limit=1) == []
+
+
+def test_reference_and_name_give_high_confidence():
+    index = build_index(charge("c12", "apartment-12", at(2026, 3, 10)), charge("c13", "apartment-13", at(2026, 3, 10)))
+    transaction = {"date": at(2026, 3, 15), "amount": 400.0, "payer": "AHMET YILMAZ", "description": "Daire A-12 aidat"}
+    match = match_transaction(transaction, index, set())
+    assert match["charge_id"] == "c12"
+    assert match["resident_id"] == "resident-12"
+    assert match["confidence"] == "high"
+    assert match["reasons"] == ["amount", "date_window", "apartment_reference", "payer_name"]
+
+
+def test_reference_only_gives_medium_confidence():
+    index = build_index(charge("c12", "apartment-12", at(2026, 3, 10)), charge("c13", "apartment-13", at(2026, 3, 10)))
+    match = match_transaction({"date": at(2026, 3, 15), "amount": 400.0, "description": "a13 mart"}, index, set())
+    assert match["charge_id"] == "c13"
+    assert match["confidence"] == "medium"
+
+
+def test_amount_only_match_requires_a_single_candidate():
+    index = build_index(charge("c12", "apartment-12", at(2026, 3, 10)), charge("c13", "apartment-13", at(2026, 3, 10)))
+    transaction = {"date": at(2026, 3, 15), "amount": 400.0, "description": "havale"}
+    assert match_transaction(transaction, index, set()) is None
+
+    match = match_transaction(transaction, index, {"c12"})
+    assert match["charge_id"] == "c13"
+    assert match["confidence"] == "low"
+
+
+def test_no_match_for_other_amounts_or_out_of_window():
+    index = build_index(charge("c12", "apartment-12", at(2026, 3, 10)))
+    assert match_transaction({"date": at(2026, 3, 15), "amount": 399.99, "description": "A-12"}, index, set()) is None
+    assert match_transaction({"date": at(2025, 1, 1), "amount": 400.0, "description": "A-12"}, index, set()) is None
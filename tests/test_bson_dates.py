@@ -0,0 +1,51 @@
+import asyncio
+from datetime import datetime, timezone
+
+from routes.bson_dates import migrate_dates
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_unparseable_dates_are_skipped_not_erased(db, caplog):
+    async def scenario():
+        await db.announcements.insert_many([
+            {"id": "a1", "created_at": "2025-03-01T10:00:00+00:00"},
+            {"id": "a2", "created_at": "geçen salı"},
+            {"id": "a3", "created_at": ""},
+        ])
+        results = await migrate_dates(db)
+        assert results["announcements"] == 2
+
+        stored = {doc["id"]: doc["created_at"] for doc in await db.announcements.find({}).to_list(None)}
+        assert stored["a1"] == datetime(2025, 3, 1, 10, tzinfo=timezone.utc)
+        assert stored["a2"] == "geçen salı"
+        assert stored["a3"] is None
+
+        checkpoint = await db.migrations.find_one({"_id": "bson_dates:announcements"})
+        assert checkpoint["done"] is True
+        assert checkpoint["skipped"] == 1
+
+    run(scenario())
+    assert "geçen salı" in caplog.text
+
+
+def test_settings_store_native_dates(server):
+    async def scenario():
+        superadmin = server.User(
+            id="superadmin-1",
+            email="admin@example.com",
+            full_name="Admin",
+            role="superadmin",
+            created_at=datetime.now(timezone.utc),
+        )
+        await server.get_settings(superadmin)
+        stored = await server.db.system_settings.find_one({"id": "system_settings"})
+        assert isinstance(stored["updated_at"], datetime)
+
+        await server.update_settings({"email_from": "bilgi@example.com"}, superadmin)
+        stored = await server.db.system_settings.find_one({"id": "system_settings"})
+        assert isinstance(stored["updated_at"], datetime)
+
+    run(scenario())
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from routes.due_allocation import allocate
+
+
+def apartments(*land_shares, block_id=None):
+    return [
+        {"id": f"apartment-{i}", "land_share": share, "block_id": block_id}
+        for i, share in enumerate(land_shares, 1)
+    ]
+
+
+def test_equal_split_distributes_remaining_kurus():
+    matrix = allocate(apartments(1, 1, 1), [{"name": "Temizlik", "amount": 100.0}])
+    assert matrix[:, 0].tolist() == [3334, 3333, 3333]
+    assert matrix.sum() == 10000
+
+
+def test_remaining_kurus_go_to_largest_fractions():
+    matrix = allocate(apartments(1, 2), [{"name": "Asansör", "amount": 1.0, "allocation": "land_share"}])
+    # 33,33 / 66,67 kuruş: kalan kuruş küsuratı büyük olan daireye
+    assert matrix[:, 0].tolist() == [33, 67]
+
+
+def test_each_item_sums_to_its_amount():
+    items = [
+        {"name": "Temizlik", "amount": 1234.57},
+        {"name": "Asansör", "amount": 999.99, "allocation": "land_share"},
+        {"name": "Isınma", "amount": 0.07, "allocation": "square_meters"},
+    ]
+    units = [
+        {"id": f"apartment-{i}", "land_share": share, "square_meters": m2}
+        for i, (share, m2) in enumerate([(7, 85.5), (11, 120.0), (13, 95.25), (3, 60.0)], 1)
+    ]
+    matrix = allocate(units, items)
+    assert matrix.dtype == np.int64
+    assert matrix.sum(axis=0).tolist() == [123457, 99999, 7]
+
+
+def test_block_filter_charges_only_that_block():
+    units = apartments(1, 1, block_id="A") + [{"id": "apartment-3", "land_share": 1, "block_id": "B"}]
+    matrix = allocate(units, [{"name": "Bahçe", "amount": 0.05, "block_ids": ["A"]}])
+    assert matrix[:, 0].tolist() == [3, 2, 0]
+
+
+def test_item_without_weight_is_rejected():
+    with pytest.raises(ValueError):
+        allocate(apartments(None, None), [{"name": "Asansör", "amount": 10.0, "allocation": "land_share"}])
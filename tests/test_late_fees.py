@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from routes import late_fees
+from routes.late_fees import fee_period
+
+
+def at(year, month, day, hour=0):
+    return datetime(year, month, day, hour, tzinfo=timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def no_grace(monkeypatch):
+    monkeypatch.setattr(late_fees, "LATE_FEE_GRACE_DAYS", 0)
+
+
+def test_not_late_before_due_date():
+    assert fee_period(at(2026, 1, 31), at(2026, 1, 31), "monthly") is None
+    assert fee_period(at(2026, 1, 31), at(2026, 1, 20), "monthly") is None
+
+
+def test_month_end_due_date_is_clamped():
+    due = at(2026, 1, 31)
+    assert fee_period(due, at(2026, 2, 27, 12), "monthly") == at(2026, 1, 31)
+    assert fee_period(due, at(2026, 2, 28, 12), "monthly") == at(2026, 2, 28)
+    assert fee_period(due, at(2026, 3, 30, 12), "monthly") == at(2026, 2, 28)
+    # Kırpma birikmez: Mart dönemi yine ayın 31'inde başlar
+    assert fee_period(due, at(2026, 3, 31, 12), "monthly") == at(2026, 3, 31)
+    assert fee_period(due, at(2026, 4, 30, 12), "monthly") == at(2026, 4, 30)
+
+
+def test_leap_year_february():
+    assert fee_period(at(2024, 1, 31), at(2024, 2, 29, 12), "monthly") == at(2024, 2, 29)
+
+
+def test_period_crosses_year_end():
+    assert fee_period(at(2025, 12, 31), at(2026, 2, 15), "monthly") == at(2026, 1, 31)
+
+
+def test_daily_mode():
+    assert fee_period(at(2026, 1, 31), at(2026, 2, 3, 12), "daily") == at(2026, 2, 3)
+
+
+def test_grace_days_shift_the_start(monkeypatch):
+    monkeypatch.setattr(late_fees, "LATE_FEE_GRACE_DAYS", 5)
+    due = at(2026, 1, 31)
+    assert fee_period(due, at(2026, 2, 4), "monthly") is None
+    assert fee_period(due, at(2026, 2, 6), "monthly") == at(2026, 2, 5)
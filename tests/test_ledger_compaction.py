@@ -0,0 +1,103 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+BUILDING_ID = "building-1"
+APARTMENT_ID = "apartment-1"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def resident(server, resident_id="resident-1"):
+    return server.Resident(
+        id=resident_id,
+        building_id=BUILDING_ID,
+        apartment_id=APARTMENT_ID,
+        full_name="Sakin",
+        phone="5550000000",
+        type="owner",
+        created_at=datetime.now(timezone.utc),
+    )
+
+
+async def paid_last_year_due(server):
+    """Geçen yıl tanımlanmış, banka havalesiyle (resident_id yok) ödenmiş aidat"""
+    year = datetime.now(timezone.utc).year - 1
+    monthly_due = {
+        "id": str(uuid.uuid4()),
+        "building_id": BUILDING_ID,
+        "month": f"{year}-03",
+        "expense_items": [],
+        "total_amount": 500.0,
+        "per_apartment_amount": 500.0,
+        "due_date": datetime(year, 3, 15, tzinfo=timezone.utc),
+        "created_at": datetime(year, 3, 1, tzinfo=timezone.utc),
+    }
+    await server.db.monthly_dues.insert_one(dict(monthly_due))
+    await server.apartment_ledger.charge_monthly_due(monthly_due, [APARTMENT_ID], {APARTMENT_ID: 437.5})
+    await server.apartment_ledger.record_payments([{
+        "id": str(uuid.uuid4()),
+        "monthly_due_id": monthly_due["id"],
+        "resident_id": None,
+        "building_id": BUILDING_ID,
+        "apartment_id": APARTMENT_ID,
+        "amount": 437.5,
+    }])
+    # Kayıtlar geçen yıl yazılmış gibi
+    await server.db.apartment_ledger.update_many({}, {"$set": {"created_at": datetime(year, 3, 20, tzinfo=timezone.utc)}})
+    return monthly_due, year
+
+
+def test_compacted_paid_due_stays_paid(server):
+    async def scenario():
+        monthly_due, year = await paid_last_year_due(server)
+        report = await server.apartment_ledger.compact_year(BUILDING_ID, year)
+        assert report["archived_entries"] == 2
+        assert await server.db.apartment_ledger.count_documents({}) == 0
+
+        dues = await server.get_resident_dues(resident(server, "resident-2"))
+        (due,) = dues["dues"]
+        assert due["id"] == monthly_due["id"]
+        assert due["amount"] == 437.5
+        assert due["is_paid"] is True
+        assert due["status"] == "paid"
+        assert dues["total_debt"] == 0
+        assert dues["overdue_count"] == 0
+
+        with pytest.raises(HTTPException) as error:
+            await server.pay_resident_due(monthly_due["id"], resident(server, "resident-2"))
+        assert error.value.status_code == 400
+        balance = await server.apartment_ledger.get_balance(APARTMENT_ID)
+        assert balance["balance"] == 0
+
+    run(scenario())
+
+
+def test_open_charges_are_not_archived(server):
+    async def scenario():
+        year = datetime.now(timezone.utc).year - 1
+        monthly_due = {
+            "id": str(uuid.uuid4()),
+            "building_id": BUILDING_ID,
+            "month": f"{year}-04",
+            "per_apartment_amount": 300.0,
+            "due_date": datetime(year, 4, 15, tzinfo=timezone.utc),
+            "created_at": datetime(year, 4, 1, tzinfo=timezone.utc),
+        }
+        await server.db.monthly_dues.insert_one(dict(monthly_due))
+        await server.apartment_ledger.charge_monthly_due(monthly_due, [APARTMENT_ID])
+        await server.db.apartment_ledger.update_many({}, {"$set": {"created_at": datetime(year, 4, 1, tzinfo=timezone.utc)}})
+
+        report = await server.apartment_ledger.compact_year(BUILDING_ID, year)
+        assert report["archived_entries"] == 0
+
+        dues = await server.get_resident_dues(resident(server))
+        assert dues["dues"][0]["status"] == "overdue"
+        assert dues["total_debt"] == 300.0
+
+    run(scenario())
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from routes.login_admission import LoginAdmissionController, client_ip
+
+
+class FakeRequest:
+    def __init__(self, peer, forwarded_for=""):
+        self.client = type("Client", (), {"host": peer})
+        self.headers = {"x-forwarded-for": forwarded_for} if forwarded_for else {}
+
+
+def test_forwarded_for_is_ignored_from_private_peers():
+    assert client_ip(FakeRequest("192.168.1.5", "1.2.3.4")) == "192.168.1.5"
+    assert client_ip(FakeRequest("172.18.0.1", "1.2.3.4")) == "172.18.0.1"
+
+
+def test_forwarded_for_is_read_from_loopback_proxy():
+    assert client_ip(FakeRequest("127.0.0.1", "9.9.9.9")) == "9.9.9.9"
+    # İstemcinin eklediği sahte adres atlanır, proxy'nin eklediği son adres alınır
+    assert client_ip(FakeRequest("127.0.0.1", "6.6.6.6, 9.9.9.9")) == "9.9.9.9"
+
+
+def test_identity_window_is_shared_across_routes():
+    controller = LoginAdmissionController(per_identity=4)
+
+    async def failed_login(route):
+        async with controller.admit(route, None, " 5551234567 "):
+            raise ValueError("yanlış şifre")
+
+    async def scenario():
+        for attempt in range(4):
+            with pytest.raises(ValueError):
+                await failed_login("resident-login" if attempt % 2 else "resident-login-v2")
+        with pytest.raises(HTTPException) as error:
+            await failed_login("resident-login")
+        assert error.value.status_code == 429
+
+    asyncio.run(scenario())
+
+
+def test_successful_login_does_not_count():
+    controller = LoginAdmissionController(per_identity=2)
+
+    async def scenario():
+        for _ in range(5):
+            async with controller.admit("login", None, "yonetici@example.com"):
+                pass
+
+    asyncio.run(scenario())
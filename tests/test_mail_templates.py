@@ -0,0 +1,36 @@
+from routes.mail_templates import CompiledMailTemplate, compile_template
+
+
+def test_both_placeholder_forms_are_replaced():
+    template = compile_template("Sayın {{ resident_name }}, {{month}} aidatı: {{ amount }} TL")
+    assert template.render({"resident_name": "Ayşe", "month": "Mart", "amount": 450.5}) == \
+        "Sayın Ayşe, Mart aidatı: 450.5 TL"
+
+
+def test_missing_variables_stay_in_place():
+    template = compile_template("{{ building_name }} - {{due_date}} tarihine kadar {{ amount }} TL")
+    assert template.render({"amount": 400}) == "{{ building_name }} - {{due_date}} tarihine kadar 400 TL"
+
+
+def test_repeated_and_adjacent_placeholders():
+    template = compile_template("{{a}}{{ b }}{{a}}")
+    assert template.render({"a": "x", "b": "y"}) == "xyx"
+
+
+def test_text_without_placeholders_is_unchanged():
+    text = "Sabit metin { tek } ve {{ eksik kapanış"
+    assert compile_template(text).render({"tek": "x"}) == text
+
+
+def test_falsy_values_are_rendered():
+    assert compile_template("{{count}} / {{ note }}").render({"count": 0, "note": ""}) == "0 / "
+
+
+def test_compiled_template_is_cached():
+    assert compile_template("Merhaba {{name}}") is compile_template("Merhaba {{name}}")
+
+
+def test_mail_template_renders_subject_and_body():
+    template = CompiledMailTemplate("{{ building_name }} duyurusu", "<p>{{title}}</p>")
+    assert template.render({"building_name": "Güneş Apt.", "title": "Su kesintisi"}) == \
+        ("Güneş Apt. duyurusu", "<p>Su kesintisi</p>")
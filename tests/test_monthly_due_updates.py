@@ -0,0 +1,135 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+BUILDING_ID = "building-1"
+APARTMENT_IDS = ["apartment-1", "apartment-2"]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def manager(server):
+    return server.User(
+        id="manager-1",
+        email="yonetici@example.com",
+        full_name="Yönetici",
+        building_id=BUILDING_ID,
+        created_at=datetime.now(timezone.utc),
+    )
+
+
+def resident(server, apartment_id="apartment-1"):
+    return server.Resident(
+        id=f"resident-{apartment_id}",
+        building_id=BUILDING_ID,
+        apartment_id=apartment_id,
+        full_name="Sakin",
+        phone="5550000000",
+        type="owner",
+        created_at=datetime.now(timezone.utc),
+    )
+
+
+async def create_due(server, amount=400.0):
+    await server.db.apartments.insert_many([
+        {"id": apartment_id, "building_id": BUILDING_ID, "apartment_number": str(i), "status": "owner_occupied"}
+        for i, apartment_id in enumerate(APARTMENT_IDS, 1)
+    ])
+    await server.db.residents.insert_many([
+        {"id": f"resident-{apartment_id}", "building_id": BUILDING_ID, "apartment_id": apartment_id,
+         "type": "owner", "is_active": True, "created_at": datetime.now(timezone.utc)}
+        for apartment_id in APARTMENT_IDS
+    ])
+    await server.building_counters.rebuild(BUILDING_ID)
+    data = server.MonthlyDueDefinitionCreate(
+        building_id=BUILDING_ID,
+        month="Mart 2026",
+        expense_items=[{"name": "Temizlik", "amount": amount * len(APARTMENT_IDS)}],
+        total_amount=amount * len(APARTMENT_IDS),
+        per_apartment_amount=amount,
+        due_date=datetime.now(timezone.utc) + timedelta(days=10),
+    )
+    created = await server.create_monthly_due(data, manager(server))
+    await server.generate_dues_from_monthly_due(created["id"], manager(server))
+    return created["id"]
+
+
+async def counters(server):
+    return await server.db.building_counters.find_one({"building_id": BUILDING_ID}, {"_id": 0})
+
+
+def test_amount_change_reposts_charges(server):
+    async def scenario():
+        monthly_due_id = await create_due(server)
+        assert (await counters(server))["pending_due_amount"] == 800.0
+
+        update = server.MonthlyDueDefinitionUpdate(per_apartment_amount=450.0, total_amount=900.0)
+        result = await server.update_monthly_due(monthly_due_id, update, manager(server))
+        assert result["reposted"] is True
+
+        for apartment_id in APARTMENT_IDS:
+            balance = await server.apartment_ledger.get_balance(apartment_id)
+            assert balance["balance"] == 450.0
+            open_charges = await server.apartment_ledger.open_charges(apartment_id)
+            assert [charge["amount"] for charge in open_charges] == [450.0]
+
+        dues = await server.db.dues.find({"monthly_due_id": monthly_due_id}).to_list(None)
+        assert sorted(due["amount"] for due in dues) == [450.0, 450.0]
+        assert (await counters(server))["pending_due_amount"] == 900.0
+
+        my_dues = await server.get_resident_dues(resident(server))
+        assert my_dues["dues"][0]["amount"] == 450.0
+
+    run(scenario())
+
+
+def test_label_change_does_not_repost(server):
+    async def scenario():
+        monthly_due_id = await create_due(server)
+        update = server.MonthlyDueDefinitionUpdate(month="Nisan 2026")
+        result = await server.update_monthly_due(monthly_due_id, update, manager(server))
+        assert result["reposted"] is False
+        assert await server.db.apartment_ledger.count_documents({}) == len(APARTMENT_IDS)
+        due = await server.db.dues.find_one({"monthly_due_id": monthly_due_id})
+        assert due["month"] == "Nisan 2026"
+
+    run(scenario())
+
+
+def test_amount_change_rejected_after_payment(server):
+    async def scenario():
+        monthly_due_id = await create_due(server)
+        await server.pay_resident_due(monthly_due_id, resident(server))
+
+        update = server.MonthlyDueDefinitionUpdate(per_apartment_amount=450.0)
+        with pytest.raises(HTTPException) as error:
+            await server.update_monthly_due(monthly_due_id, update, manager(server))
+        assert error.value.status_code == 409
+        balance = await server.apartment_ledger.get_balance("apartment-2")
+        assert balance["balance"] == 400.0
+
+    run(scenario())
+
+
+def test_delete_removes_generated_dues(server):
+    async def scenario():
+        monthly_due_id = await create_due(server)
+        assert (await counters(server))["pending_dues"] == 2
+
+        await server.delete_monthly_due(monthly_due_id, manager(server))
+
+        assert await server.db.dues.count_documents({"monthly_due_id": monthly_due_id}) == 0
+        current = await counters(server)
+        assert current["pending_dues"] == 0
+        assert current["pending_due_amount"] == 0
+        for apartment_id in APARTMENT_IDS:
+            assert (await server.apartment_ledger.get_balance(apartment_id))["balance"] == 0
+        rebuilt = await server.building_counters.rebuild(BUILDING_ID)
+        assert {field: current[field] for field in ("pending_dues", "pending_due_amount")} == \
+            {field: rebuilt[field] for field in ("pending_dues", "pending_due_amount")}
+
+    run(scenario())
@@ -0,0 +1,91 @@
+import asyncio
+from datetime import datetime, timezone
+
+from routes import tenant_purge as tenant_purge_module
+from routes.tenant_purge import TenantPurge
+
+BUILDING_ID = "building-1"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def fast_retries(monkeypatch, max_attempts=3):
+    monkeypatch.setattr(tenant_purge_module, "PURGE_RETRY_BASE_SECONDS", 0)
+    monkeypatch.setattr(tenant_purge_module, "PURGE_MAX_ATTEMPTS", max_attempts)
+    # mongomock, ReturnDocument.AFTER ile filtreyi güncel dokümana yeniden uygular;
+    # sıfır lease ile sahiplenilen iş filtreyi karşılamaya devam eder
+    monkeypatch.setattr(tenant_purge_module, "PURGE_LEASE_SECONDS", 0)
+
+
+async def pending_job(db):
+    now = datetime.now(timezone.utc)
+    await db.apartments.insert_many([
+        {"id": f"apartment-{i}", "building_id": BUILDING_ID} for i in range(3)
+    ] + [{"id": "other", "building_id": "building-2"}])
+    job = {
+        "id": "job-1",
+        "building_id": BUILDING_ID,
+        "status": "pending",
+        "collections": ["apartments"],
+        "progress": {},
+        "deleted_total": 0,
+        "lease_until": now,
+        "created_at": now,
+        "updated_at": now,
+        "error": None,
+    }
+    await db.purge_jobs.insert_one(dict(job))
+    return job
+
+
+def test_failed_batch_is_retried_inside_run(db, monkeypatch):
+    fast_retries(monkeypatch)
+    purge = TenantPurge(db, pause_ms=0)
+    original = purge._purge_collection
+    calls = []
+
+    async def flaky(job, name):
+        calls.append(name)
+        if len(calls) == 1:
+            raise RuntimeError("bağlantı koptu")
+        await original(job, name)
+
+    monkeypatch.setattr(purge, "_purge_collection", flaky)
+
+    async def scenario():
+        await pending_job(db)
+        job = await purge.run("job-1")
+        assert job["status"] == "completed"
+        assert job["error"] is None
+        assert job["attempts"] == 1
+        assert await db.apartments.count_documents({"building_id": BUILDING_ID}) == 0
+        assert await db.apartments.count_documents({}) == 1
+
+    run(scenario())
+
+
+def test_job_fails_after_max_attempts_and_resumes(db, monkeypatch):
+    fast_retries(monkeypatch, max_attempts=2)
+    purge = TenantPurge(db, pause_ms=0)
+
+    async def broken(job, name):
+        raise RuntimeError("bağlantı koptu")
+
+    async def scenario():
+        await pending_job(db)
+        purge._purge_collection = broken
+        assert await purge.run("job-1") is None
+        stored = await purge.get("job-1")
+        assert stored["status"] == "failed"
+        assert stored["attempts"] == 2
+        assert stored["error"] == "bağlantı koptu"
+
+        # Bir sonraki başlangıçta başarısız iş yeniden çalıştırılır
+        del purge._purge_collection
+        assert await purge.resume_pending() == 1
+        await asyncio.gather(*purge._tasks)
+        assert (await purge.get("job-1"))["status"] == "completed"
+
+    run(scenario())